@@ -0,0 +1,143 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+
+benchmarks.bench_model
+~~~~~~~~~~~~~~~~~~~~~~
+
+Microbenchmark of the 'gists.model' classes against the previous model,
+which built a new list of 'GistFile' objects on every access to 'files'.
+
+    $ python benchmarks/bench_model.py [number of gists]
+
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'gists'))
+
+import model
+
+
+class LegacyGist(dict):
+    """ The 'Gist' class before the files were indexed. """
+
+    @property
+    def files(self):
+        if not 'files' in self:
+            self['files'] = {}
+            return self['files']
+        gist_files = []
+        for gist_file in self['files'].values():
+            if gist_file != 'null':
+                gist_files.append(LegacyGistFile(gist_file))
+        return gist_files
+
+    def getFile(self, requested_filename):
+        for gistfile in self.files:
+            if gistfile.filename == requested_filename:
+                return gistfile
+        return None
+
+
+class LegacyGistFile(dict):
+    """ The 'GistFile' class before the '__slots__' declaration. """
+
+    @property
+    def filename(self):
+        return self['filename']
+
+
+def parsed_gists(count, files_per_gist=5):
+    """ Returns 'count' gists as 'json.loads' returns them. """
+    gists = []
+    for number in range(count):
+        files = {}
+        for file_number in range(files_per_gist):
+            filename = "file%d.py" % file_number
+            files[filename] = {
+                'filename': filename,
+                'type': 'application/x-python',
+                'language': 'Python',
+                'size': 1024,
+                'raw_url': 'https://gist.github.com/raw/%d/%s' % (number,
+                                                                  filename)}
+        gists.append({'id': str(number),
+                      'url': 'https://api.github.com/gists/%d' % number,
+                      'description': 'gist number %d' % number,
+                      'public': True,
+                      'files': files})
+    return gists
+
+
+def instance_size(instance):
+    """ Size in bytes of an instance and its attribute dictionary. """
+    size = sys.getsizeof(instance)
+    if hasattr(instance, '__dict__'):
+        size += sys.getsizeof(instance.__dict__)
+    return size
+
+
+def run(gist_class, parsed, repeat=3):
+    """ Returns the timings of building the gists, iterating over their
+    files five times and looking up a file, and the size of an instance
+    of the gist and of the file class. """
+    def build():
+        return [gist_class(gist) for gist in parsed]
+
+    gists = build()
+
+    def iterate():
+        for gist in gists:
+            for _ in range(5):
+                for gistfile in gist.files:
+                    gistfile.filename
+
+    def lookup():
+        for gist in gists:
+            gist.getFile('file4.py')
+
+    timings = [min(timeit.repeat(function, number=1, repeat=repeat))
+               for function in (build, iterate, lookup)]
+    json.dumps(gists)
+    return timings + [instance_size(gists[0]),
+                      instance_size(gists[0].files[0])]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    parsed = parsed_gists(count)
+    header = "%-8s %10s %10s %10s %10s %10s" % ('model', 'build (s)',
+                                                'files (s)', 'lookup (s)',
+                                                'gist (B)', 'file (B)')
+    print "%d gists of %d files" % (count, len(parsed[0]['files']))
+    print header
+    print "-" * len(header)
+    for name, gist_class in (('legacy', LegacyGist), ('indexed', model.Gist)):
+        print "%-8s %10.4f %10.4f %10.4f %10d %10d" % \
+            tuple([name] + run(gist_class, parsed))
+
+
+if __name__ == '__main__':
+    main()
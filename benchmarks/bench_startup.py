@@ -0,0 +1,115 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+
+benchmarks.bench_startup
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Startup time of the 'gists' command. Each command runs in a fresh
+interpreter (with '--help', but 'version') and reports its wall time, the
+number of modules imported and the slowest imports, timed by wrapping the
+'__import__' builtin ('-X importtime' does not exist in Python 2).
+
+    $ python benchmarks/bench_startup.py [number of slowest imports]
+
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+GISTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
+                                         'gists'))
+
+# Run in the fresh interpreter: it times every import, runs the command
+# and prints 'module<TAB>cumulative seconds' lines to stderr.
+PROFILED = r"""
+import sys, time, __builtin__
+timings = {}
+original_import = __builtin__.__import__
+
+def timed_import(name, *args, **kwargs):
+    started = time.time()
+    try:
+        return original_import(name, *args, **kwargs)
+    finally:
+        if name not in timings:
+            timings[name] = time.time() - started
+
+__builtin__.__import__ = timed_import
+sys.path.insert(0, %(gists_dir)r)
+sys.argv = ['gists'] + %(argv)r
+try:
+    import gists
+    gists.run()
+except SystemExit:
+    pass
+sys.stdout.flush()
+sys.stderr.write('modules\t%%d\n' %% len(sys.modules))
+for name, elapsed in timings.items():
+    sys.stderr.write('%%s\t%%f\n' %% (name, elapsed))
+"""
+
+
+def measure(argv):
+    """ Returns the wall time, the number of modules and the import
+    timings of a 'gists' execution. """
+    code = PROFILED % {'gists_dir': GISTS_DIR, 'argv': argv}
+    started = time.time()
+    process = subprocess.Popen([sys.executable, '-c', code],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, errors = process.communicate()
+    elapsed = time.time() - started
+    modules, timings = 0, []
+    for line in errors.splitlines():
+        fields = line.split('\t')
+        if len(fields) != 2:
+            continue
+        if fields[0] == 'modules':
+            modules = int(fields[1])
+        else:
+            timings.append((float(fields[1]), fields[0]))
+    return elapsed, modules, sorted(timings, reverse=True)
+
+
+def main():
+    slowest = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    sys.path.insert(0, GISTS_DIR)
+    import gists
+
+    runs = [['--help'], ['version']]
+    runs += [[name, '--help'] for name, _ in gists.COMMANDS
+             if name != 'version']
+    header = "%-20s %9s %8s  %s" % ('command', 'time (s)', 'modules',
+                                    'slowest imports (s)')
+    print header
+    print "-" * len(header)
+    for argv in runs:
+        elapsed, modules, timings = measure(argv)
+        print "%-20s %9.4f %8d  %s" % (
+            ' '.join(argv), elapsed, modules,
+            ', '.join("%s %.4f" % (name, seconds)
+                      for seconds, name in timings[:slowest]))
+
+
+if __name__ == '__main__':
+    main()
@@ -22,10 +22,29 @@
 # of the available actions, call the GithubFacade to retrieve the
 # Github API response, and handles errors and responses.
 
-from utils import download, build_result, GistsConfigurer
+from utils import (download, build_result, build_batch_result,
+                   GistsConfigurer, GithubFacade, GithubError, Progress)
+from lazy import lazy_import
+import fnmatch
+import functools
+import hashlib
+import json
 import literals
 import model
 import os
+import parallel
+import re
+import sys
+import time
+
+# Modules used by a few actions, imported when they are used. Named after
+# their package, as 'index', 'journal' and 'daemon' are arguments and
+# actions of this module.
+gists_daemon = lazy_import('daemon', globals())
+gists_index = lazy_import('index', globals())
+gists_journal = lazy_import('journal', globals())
+gists_manifest = lazy_import('manifest', globals())
+profiling = lazy_import('profiling', globals())
 
 """
 
@@ -38,43 +57,279 @@ module, call to GitHub Gists API and manage the response.
 
 """
 
+# Fields of the listed gists that are never read, dropped as they are decoded
+LIST_SKIPPED_FIELDS = ('history', 'forks', 'owner')
+
+# Gists requested per page when all the pages are listed
+SYNC_PAGE_SIZE = 100
+
+# Seconds subtracted to the synchronization time, in case the local clock
+# is ahead of the Github one
+SYNC_CLOCK_SKEW = 60
+
+# Seconds after which 'list --cached' refreshes the index in background
+INDEX_REFRESH_INTERVAL = 5 * 60
+
+# Gists stored at once in the search index
+SEARCH_BATCH_SIZE = 100
+
+# Statuses of a replayed change that Github will never accept: the change
+# is dropped from the journal. On any other failure it is kept.
+REJECTED_STATUSES = (404, 410, 422)
+
+
 def get_json(request):
     """ Retrieve JSON of from request
 
     :param request: the request
     """
-    if callable(request.json):
-        return request.json()
-    else: 
-        return request.json
+    with profiling.stage('decode'):
+        if callable(request.json):
+            return request.json()
+        else:
+            return request.json
+
+
+def parse_gist(response):
+    """ Builds the :class: `Gist <Gist>` of a response of Github
+
+    :param response: the response with the JSON of a gist
+    """
+    data = get_json(response)
+    with profiling.stage('model'):
+        return model.Gist(data)
+
+
+def error_message(response):
+    """ Retrieve the reason of a failed request.
+
+    Github explains it in the 'message' field of the JSON body. If the body
+    is not JSON (a proxy or a load balancer error page, for instance) the
+    HTTP status is returned instead.
+
+    :param response: the failed response
+    """
+    try:
+        return get_json(response)['message']
+    except (ValueError, TypeError, KeyError):
+        return literals.HTTP_ERROR % (response.status_code, response.reason)
+
 
-def list_gists(username, facade, want_starred):
+def reports_github_errors(action):
+    """ Decorator for the actions that call Github through a facade.
+
+    Errors raised by the facade are returned as a failed result, and the
+    retries and circuit breaker trips of the action are counted in the
+    result.
+    """
+    @functools.wraps(action)
+    def wrapper(*args, **kwargs):
+        facades = [arg for arg in list(args) + list(kwargs.values())
+                   if isinstance(arg, GithubFacade)]
+        if facades:
+            before = dict(facades[0].call_stats())
+        try:
+            result = action(*args, **kwargs)
+        except GithubError as error:
+            result = build_result(False, unicode(error))
+        if facades:
+            after = facades[0].call_stats()
+            result.retries += after['retries'] - before['retries']
+            result.trips += after['trips'] - before['trips']
+        return result
+    return wrapper
+
+
+@reports_github_errors
+def list_gists(username, facade, want_starred, per_page=None,
+               prefetch=False, since=None, index=None, query=None,
+               raise_errors=False):
     """ Retrieve the list of gists for a concrete user.
 
-    :param token: GitHub authentication token
+    The data of the result is a generator that follows the pagination of
+    the GitHub API, yielding the gists as their pages arrive.
+
+    :param username: owner of the gists
     :param facade: instance of the object that actually performs the request
     :param want_starred: if we want the starred ones
+    :param per_page: number of gists requested per page
+    :param prefetch: request the next page while the current one is consumed
+    :param since: ISO 8601 timestamp. Only the gists updated after it are
+        listed.
+    :param index: :class: `GistIndex <GistIndex>` kept current with the
+        listed gists. The starred ones are not indexed.
+    :param query: filters of 'GistIndex.query'. If set, the gists are read
+        from the 'index' instead, and the index is refreshed in background.
+    :param raise_errors: the generator raises 'GithubError' if a page can
+        not be retrieved, instead of writing it in the standard error.
     """
 
+    if query is not None:
+        return list_indexed(username, facade, index, query)
+
+    started = time.time()
     if not want_starred:
-        response = facade.request_list_of_gists(username)
+        response = facade.request_list_of_gists(username, per_page, since)
     else:
-        response = facade.request_list_starred_gists(username)
+        response = facade.request_list_starred_gists(username, per_page,
+                                                     since)
+        index = None
 
     if response.ok:
         # List of gists for the requested user found.
-        list_gists = []
-        for gist in get_json(response):
-            list_gists.append(model.Gist(gist))
-
-        return build_result(True, list_gists)
+        if since is not None:
+            # A partial listing is not the whole state of the user
+            started = None
+        return build_result(True, iter_gists(response, facade, prefetch,
+                                             index, username, started,
+                                             raise_errors))
     else:
         # GitHub response error. Parse the response
         return build_result(False, literals.LISTS_ERROR,
-                            get_json(response)['message'])
+                            error_message(response))
+
+
+def iter_gists(response, facade, prefetch=False, index=None, owner=None,
+               started=None, raise_errors=False):
+    """ Yield the gists of a paginated list response, page by page.
 
+    If a page can not be retrieved, the iteration stops and the reason is
+    written in the standard error, or raised as a 'GithubError' if
+    'raise_errors' is set.
 
-def get(gist_id, requested_file, destination_dir, facade):
+    :param response: response of the first page
+    :param facade: instance of the object that actually performs the request
+    :param prefetch: request the next page while the current one is consumed
+    :param index: :class: `GistIndex <GistIndex>` where each page is stored
+    :param owner: owner of the listed gists
+    :param started: time the listing started, if it lists all the gists of
+        the owner. Once all the pages are listed, the gists that are not
+        listed are removed from the index, and this is the time of its last
+        refresh.
+    :param raise_errors: raise the errors instead of writing them
+    """
+    pages = facade.iter_pages(response, prefetch)
+    listed_ids = []
+    while True:
+        try:
+            page = next(pages)
+        except StopIteration:
+            if index is not None and started is not None:
+                index.prune(owner, listed_ids, not facade.credential)
+                index.set_refreshed_at(owner, started)
+            return
+        except GithubError as error:
+            if raise_errors:
+                raise
+            sys.stderr.write(literals.LISTS_PAGE_ERROR % error + '\n')
+            return
+        if not page.ok:
+            if raise_errors:
+                raise GithubError(literals.LISTS_PAGE_ERROR %
+                                  error_message(page))
+            sys.stderr.write(literals.LISTS_PAGE_ERROR %
+                             error_message(page) + '\n')
+            return
+        page_gists = []
+        try:
+            for gist in facade.iter_list(page, LIST_SKIPPED_FIELDS):
+                with profiling.stage('model'):
+                    gist = model.Gist(gist)
+                page_gists.append(gist)
+                yield gist
+        except GithubError as error:
+            if raise_errors:
+                raise
+            sys.stderr.write(literals.LISTS_PAGE_ERROR % error + '\n')
+            return
+        if index is not None:
+            index.store(page_gists, owner)
+            listed_ids.extend(gist.identifier for gist in page_gists)
+
+
+def list_indexed(username, facade, index, query):
+    """ Retrieve the gists of a user from the local index.
+
+    The first time, the index is filled before answering. Later, it is
+    refreshed in background with the gists updated since the last refresh,
+    once 'INDEX_REFRESH_INTERVAL' seconds have passed. It is never
+    refreshed while the facade is offline.
+
+    :param username: owner of the gists
+    :param facade: instance of the object that actually performs the request
+    :param index: the :class: `GistIndex <GistIndex>`
+    :param query: filters of 'GistIndex.query'
+    """
+    refreshed_at = index.refreshed_at(username)
+    if refreshed_at is None:
+        if facade.offline:
+            return build_result(False, literals.OFFLINE_NOT_INDEXED,
+                                username)
+        refresh_index(username, facade, index)
+    gists = index.query(owner=username, **query)
+    if (refreshed_at is not None and not facade.offline and
+            time.time() - refreshed_at > INDEX_REFRESH_INTERVAL):
+        __refresh_in_background(username, facade, index)
+    return build_result(True, gists)
+
+
+def refresh_index(username, facade, index):
+    """ Stores in the index the gists of a user updated since its last
+    refresh.
+
+    The first refresh lists all the gists and removes the indexed ones that
+    no longer exist. Later, the deleted gists are removed by the next full
+    'list'.
+
+    :param username: owner of the gists
+    :param facade: instance of the object that actually performs the request
+    :param index: the :class: `GistIndex <GistIndex>`
+    """
+    started = time.time()
+    refreshed_at = index.refreshed_at(username)
+    since = None
+    if refreshed_at is not None:
+        since = time.strftime(literals.ISO_8601,
+                              time.gmtime(refreshed_at - SYNC_CLOCK_SKEW))
+    gists = fetch_gists(username, facade, since)
+    index.store(gists, username)
+    if since is None:
+        index.prune(username, [gist.identifier for gist in gists],
+                    not facade.credential)
+    index.set_refreshed_at(username, started)
+
+
+def __refresh_in_background(username, facade, index):
+    """ Runs 'refresh_index' in a detached process, so the command does not
+    wait for it. Without 'os.fork', the index is refreshed by the next
+    'list' that is not cached. """
+    if not hasattr(os, 'fork'):
+        return
+    pid = os.fork()
+    if pid:
+        # Wait for the intermediate process, that exits right away
+        os.waitpid(pid, 0)
+        return
+    try:
+        if os.fork() == 0:
+            os.setsid()
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            # The connections of the parent process can not be shared
+            facade = facade.clone()
+            try:
+                refresh_index(username, facade,
+                              gists_index.GistIndex(index.path))
+            finally:
+                facade.close()
+    finally:
+        os._exit(0)
+
+
+@reports_github_errors
+def get(gist_id, requested_file, destination_dir, facade, download_all=False,
+        jobs=None, quiet=False):
     """ Download a gist file.
 
     Gists can have several files. This method searches for and downloads
@@ -82,10 +337,17 @@ def get(gist_id, requested_file, destination_dir, facade):
     If the 'requested_file' is not informed, then it won't raise an error
     only if the gist have just a single file.
 
+    If 'download_all' is set or 'requested_file' is a glob pattern, all the
+    matching files are downloaded concurrently and the result is a
+    :class: `BatchResult <BatchResult>`.
+
     :param gist_id: identifier of the gist to download
     :param requested_file: name of the Gist file to download
     :param destination_dir: destination directory after the download
     :param facade: instance of the object that actually perform the request
+    :param download_all: download all the files of the gist
+    :param jobs: maximum number of concurrent downloads
+    :param quiet: do not write the downloads and their progress
     """
 
     # Get the gist information
@@ -93,14 +355,21 @@ def get(gist_id, requested_file, destination_dir, facade):
 
     if response.ok:
         # Gist file found. Parse it into a 'model.Gist' class.
-        gist_obj = model.Gist(get_json(response))
+        gist_obj = parse_gist(response)
         list_names = [gistfile.filename for gistfile in gist_obj.files]
 
+        if download_all or is_pattern(requested_file):
+            # Download all the files matching the pattern at once
+            return download_files(gist_obj, requested_file, destination_dir,
+                                  facade, jobs, quiet)
+
         if len(gist_obj.files) == 1 and not requested_file:
             # Download the only file in the gist
             gistfile = gist_obj.files[0]
             download(gistfile.raw_url, destination_dir,
-                     gistfile.filename, gistfile.size)
+                     gistfile.filename, gistfile.size,
+                     facade.timeout_for(facade.DOWNLOAD)[1], quiet,
+                     facade.offline)
 
             result = build_result(True, literals.DOWNLOAD_OK,
                                   gistfile.filename)
@@ -117,7 +386,9 @@ def get(gist_id, requested_file, destination_dir, facade):
 
                     # Gist file found. Download it.
                     download(gistfile.raw_url, destination_dir,
-                             gistfile.filename, gistfile.size)
+                             gistfile.filename, gistfile.size,
+                             facade.timeout_for(facade.DOWNLOAD)[1], quiet,
+                             facade.offline)
 
                     result = build_result(True, literals.DOWNLOAD_OK,
                                           gistfile.filename)
@@ -130,12 +401,66 @@ def get(gist_id, requested_file, destination_dir, facade):
     else:
         # Handle GitHub response error
         result = build_result(False, literals.DOWNLOAD_ERROR,
-                              get_json(response)['message'])
+                              error_message(response))
 
     return result
 
 
-def show(gist_id, requested_file, facade):
+def is_pattern(name):
+    """ Whenever a file name is a glob pattern. """
+    return bool(name) and any(char in name for char in "*?[")
+
+
+def download_files(gist_obj, pattern, destination_dir, facade, jobs=None,
+                   quiet=False):
+    """ Download concurrently the files of a gist.
+
+    The aggregated progress is written in the standard error while the
+    files are downloaded, unless 'quiet' is set.
+
+    :param gist_obj: the :class: `Gist <Gist>` whose files are downloaded
+    :param pattern: glob pattern of the files to download. All if None.
+    :param destination_dir: destination directory after the download
+    :param facade: instance of the object that actually perform the request
+    :param jobs: maximum number of concurrent downloads
+    :param quiet: do not write the progress
+    """
+    gistfiles = [gistfile for gistfile in gist_obj.files
+                 if not pattern or fnmatch.fnmatch(gistfile.filename, pattern)]
+    if not gistfiles:
+        list_names = [gistfile.filename for gistfile in gist_obj.files]
+        return build_result(False, literals.FILE_NOT_FOUND,
+                            ", ".join(list_names))
+
+    progress = None
+    if not quiet:
+        progress = Progress(len(gistfiles),
+                            sum(gistfile.size or 0 for gistfile in gistfiles))
+
+    def download_file(gistfile):
+        try:
+            download(gistfile.raw_url, destination_dir, gistfile.filename,
+                     gistfile.size, facade.timeout_for(facade.DOWNLOAD)[1],
+                     quiet=True, offline=facade.offline)
+            outcome = build_result(True, literals.DOWNLOAD_OK,
+                                   gistfile.filename)
+        except GithubError as error:
+            outcome = build_result(False, unicode(error))
+        if progress:
+            progress.update(gistfile.size, outcome.success)
+        return gistfile.filename, outcome
+
+    start = time.time()
+    pool = parallel.WorkerPool(jobs or parallel.WorkerPool.SIZE)
+    try:
+        outcomes = list(pool.imap_unordered(download_file, gistfiles))
+    finally:
+        pool.close()
+    return build_batch_result(sorted(outcomes), time.time() - start)
+
+
+@reports_github_errors
+def show(gist_id, requested_file, facade, index=None):
     """ Retrieve a single gist.
 
     If the 'requested_file' is None, then it will show the
@@ -147,6 +472,7 @@ def show(gist_id, requested_file, facade):
     :param gist_id: identifier of the Gist to print
     :param requested_file: Gist File to show
     :param facade: instance of the object that actually performs the request
+    :param index: :class: `GistIndex <GistIndex>` kept current with the gist
     """
 
     # get the gist information
@@ -154,7 +480,9 @@ def show(gist_id, requested_file, facade):
 
     if response.ok:
         # Gist found. Parse the json response into the 'model.Gist' class
-        gist_obj = model.Gist(get_json(response))
+        gist_obj = parse_gist(response)
+        if index is not None:
+            index.store([gist_obj])
         if not requested_file:
             # Fill the response with the metadata of the gist
             result = build_result(True, gist_obj)
@@ -174,12 +502,13 @@ def show(gist_id, requested_file, facade):
     else:
         # GitHub response not ok. Parse the response
         result = build_result(False, literals.SHOW_ERROR,
-                              get_json(response)['message'])
+                              error_message(response))
 
     return result
 
 
-def post(public, upload_files, filepath, description, facade):
+@reports_github_errors
+def post(public, upload_files, filepath, description, facade, journal=None):
     """ Create a new Gist.
 
     Currently only support create Gist with single files. (Then you can
@@ -194,6 +523,8 @@ def post(public, upload_files, filepath, description, facade):
     :param filepath: input parameter path
     :param description: brief description of the Gist
     :param facade: instance of the object that actually performs the request
+    :param journal: :class: `Journal <Journal>` where the creation is queued
+        while offline, instead of performed
     """
 
     # Prepare the Gist file object and set its description and 'public' value
@@ -211,35 +542,47 @@ def post(public, upload_files, filepath, description, facade):
             gistFile.content = file_content
         gist.addFile(gistFile)
 
+    if journal is not None:
+        return queue(journal, model.Mutation({
+            'action': gists_journal.CREATE, 'public': public,
+            'description': description,
+            'files': dict((gistfile.filename, gistfile.content)
+                          for gistfile in gist.files)}))
+
     response = facade.create_gist(gist)
     # Parse the response
     if response.ok:
-        result = build_result(True, model.Gist(get_json(response)))
+        result = build_result(True, parse_gist(response))
     else:
-        if get_json(response):
-            result = build_result(False, get_json(response)['message'])
-        else:
-            result = build_result(False, literals.UNHANDLED_EXCEPTION)
+        result = build_result(False, error_message(response))
     return result
 
 
-def delete(gistid, facade):
+@reports_github_errors
+def delete(gistid, facade, confirmed=False, journal=None):
     """ Just deletes a gist.
 
     :param gistid: identifier of the Gist to delete
     :param facade: instance of the object that actually performs the request
+    :param confirmed: do not ask for confirmation before the deletion
+    :param journal: :class: `Journal <Journal>` where the deletion is queued
+        while offline, instead of performed
     """
 
+    if journal is not None:
+        # The gist can not be checked until the deletion is replayed
+        if confirmed or confirm(literals.DELETE_CONFIRMATION % (gistid)):
+            return queue(journal, model.Mutation({
+                'action': gists_journal.DELETE, 'gist_id': gistid}))
+        return build_result(False, literals.DELETE_ABORTED)
+
     # First check if the gist exists
     response = facade.request_gist(gistid)
 
     if response.ok:
 
         # Gist Found. Ask for confirmation
-        value_raw_input = (literals.DELETE_CONFIRMATION) % (gistid)
-        value = raw_input(value_raw_input)
-        accepted_values_for_yes = ["y", "yes", "ofcourse", "ye"]
-        if value.lower() in accepted_values_for_yes:
+        if confirmed or confirm(literals.DELETE_CONFIRMATION % (gistid)):
 
             # Perform the deletion
             response = facade.delete_gist(gistid)
@@ -247,22 +590,134 @@ def delete(gistid, facade):
                 result = build_result(True, literals.DELETE_OK, gistid)
 
             else:
-                res_message = get_json(response)['message']
+                res_message = error_message(response)
                 result = build_result(False, literals.DELETE_NOK, res_message)
         else:
             # Aborted mission
             result = build_result(False, literals.DELETE_ABORTED)
     else:
         # Gist not retrieved.
-        res_message = get_json(response)['message']
+        res_message = error_message(response)
         result = build_result(False, literals.DELETE_NOK, res_message)
 
     return result
 
 
-def update(gistid, description, filenames, filepath, new, remove, facade):
+def delete_gists(gist_ids, facade, jobs=None, confirmed=False,
+                 journal=None):
+    """ Deletes one or several gists.
+
+    A single gist is deleted through 'delete'. Several ones are deleted
+    concurrently, after a single confirmation for all of them.
+
+    :param gist_ids: identifiers of the Gists to delete
+    :param facade: instance of the object that actually performs the request
+    :param jobs: maximum number of gists deleted concurrently
+    :param confirmed: do not ask for confirmation before the deletion
+    :param journal: :class: `Journal <Journal>` where the deletions are
+        queued while offline
+    """
+    if len(gist_ids) == 1:
+        return delete(gist_ids[0], facade, confirmed, journal)
+
+    if not confirmed and not confirm(literals.DELETE_MANY_CONFIRMATION %
+                                     (len(gist_ids))):
+        return build_result(False, literals.DELETE_ABORTED)
+    return bulk(lambda gist_id: delete(gist_id, facade, True, journal),
+                gist_ids, facade, jobs)
+
+
+def fork_gists(gist_ids, facade, jobs=None):
+    """ Forks one or several gists concurrently.
+
+    :param gist_ids: identifiers of the Gists to fork
+    :param facade: instance of the object that actually performs the request
+    :param jobs: maximum number of gists forked concurrently
+    """
+    if len(gist_ids) == 1:
+        return fork(gist_ids[0], facade)
+    return bulk(lambda gist_id: fork(gist_id, facade), gist_ids, facade,
+                jobs)
+
+
+def star_gists(gist_ids, facade, jobs=None, journal=None):
+    """ Stars one or several gists concurrently.
+
+    :param gist_ids: identifiers of the Gists to star
+    :param facade: instance of the object that actually performs the request
+    :param jobs: maximum number of gists starred concurrently
+    :param journal: :class: `Journal <Journal>` where the changes are
+        queued while offline
+    """
+    if len(gist_ids) == 1:
+        return star(gist_ids[0], facade, journal)
+    return bulk(lambda gist_id: star(gist_id, facade, journal), gist_ids,
+                facade, jobs)
+
+
+def unstar_gists(gist_ids, facade, jobs=None, journal=None):
+    """ Unstars one or several gists concurrently.
+
+    :param gist_ids: identifiers of the Gists to unstar
+    :param facade: instance of the object that actually performs the request
+    :param jobs: maximum number of gists unstarred concurrently
+    :param journal: :class: `Journal <Journal>` where the changes are
+        queued while offline
+    """
+    if len(gist_ids) == 1:
+        return unstar(gist_ids[0], facade, journal)
+    return bulk(lambda gist_id: unstar(gist_id, facade, journal), gist_ids,
+                facade, jobs)
+
+
+def bulk(action, gist_ids, facade, jobs=None):
+    """ Applies an action to several gists through a pool of threads.
+
+    Returns a :class: `BatchResult <BatchResult>` with the outcome of each
+    gist, in the same order as 'gist_ids'.
+
+    :param action: function that receives a gist identifier and returns
+        its :class: `Result <Result>`
+    :param gist_ids: identifiers of the Gists
+    :param facade: instance of the object that actually performs the request
+    :param jobs: maximum number of gists processed concurrently. By default,
+        the size of the facade's connection pool.
+    """
+    start = time.time()
+    pool = parallel.WorkerPool(jobs or facade.pool_size)
+    try:
+        outcomes = zip(gist_ids, pool.imap(action, gist_ids))
+    finally:
+        pool.close()
+    return build_batch_result(outcomes, time.time() - start)
+
+
+def confirm(question):
+    """ Ask a yes/no question through the standard input.
+
+    If the standard input is closed, the answer is 'no'.
+
+    :param question: the question to prompt
+    """
+    try:
+        value = raw_input(question)
+    except EOFError:
+        return False
+    accepted_values_for_yes = ["y", "yes", "ofcourse", "ye"]
+    return value.lower() in accepted_values_for_yes
+
+
+@reports_github_errors
+def update(gistid, description, filenames, filepath, new, remove, facade,
+           journal=None):
     """ Updates a gist.
 
+    Only the changes are sent to Github: the description if it is
+    different, and the files added, removed or whose content hash differs
+    from the remote one. If nothing has changed, the gist is not written.
+    The bytes saved against sending the whole gist are informed in the
+    'bytes_saved' attribute of the result.
+
     :param gistid: identifier of the Gist to update
     :param description: new description of the Gist. If 'None' it won't be
     updated
@@ -271,22 +726,41 @@ def update(gistid, description, filenames, filepath, new, remove, facade):
     :param new: whenever the file is new or already exists
     :param remove: if the file should be deleted instead of modified
     :param facade: instance of the object that actually performs the request
+    :param journal: :class: `Journal <Journal>` where the update is queued
+        while offline, instead of performed. The files are read now, but
+        they are not checked against the gist until it is replayed.
     """
 
+    if journal is not None:
+        files = {}
+        for filename in filenames or []:
+            if remove:
+                files[filename] = None
+            else:
+                with open(os.path.join(filepath, filename), 'r') as f:
+                    files[filename] = f.read()
+        return queue(journal, model.Mutation({
+            'action': gists_journal.UPDATE, 'gist_id': gistid,
+            'description': description, 'files': files}))
+
     # First get the result
     response = facade.request_gist(gistid)
 
     if response.ok:
         # Gist found.
-        gist = model.Gist(get_json(response))
+        gist = parse_gist(response)
     else:
         result = build_result(False, literals.UPDATE_NOK,
-                              get_json(response)['message'])
+                              error_message(response))
         return result
 
-    if description:
+    # 'delta' keeps only the changes to send
+    delta = model.Gist({'id': gist.identifier})
+
+    if description and description != gist.description:
         # Update the description of a Gist if requested
         gist.description = description
+        delta.description = description
 
     if filenames:
         for filename in filenames:
@@ -303,6 +777,7 @@ def update(gistid, description, filenames, filepath, new, remove, facade):
                         file_content = f.read()
                         gistFile.content = file_content
                     gist.addFile(gistFile)
+                    delta.setFile(filename, {'content': file_content})
                 else:
                     # File not found and option --new it does not exist
                     return build_result(False, literals.UPDATE_NF)
@@ -313,28 +788,67 @@ def update(gistid, description, filenames, filepath, new, remove, facade):
                 if remove:
                     # Remove a file
                     gist.setFile(filename, "null")
+                    delta.setFile(filename, None)
                 else:
-                    # Update the contents of the file
+                    # Update the contents of the file, if they differ
                     with open(os.path.join(filepath, filename), 'r') as f:
                         file_content = f.read()
+                    if not same_content(file_obj, file_content, facade):
                         file_obj.content = file_content
-                    gist.setFile(filename, file_obj)
+                        gist.setFile(filename, file_obj)
+                        delta.setFile(filename, {'content': file_content})
+
+    # Size of the whole gist, as it would be sent without the delta
+    full_size = len(json.dumps(gist, indent=2))
+
+    if len(delta) == 1:
+        # Nothing has changed. Do not write the gist
+        result = build_result(True, gist)
+        result.bytes_saved = full_size
+        return result
 
     # prepare the request
-    response = facade.update_gist(gist)
+    response = facade.update_gist(delta)
     if response.ok:
-        return build_result(True, gist)
+        result = build_result(True, gist)
+        result.bytes_saved = full_size - len(response.request.body or '')
+        return result
     else:
         return build_result(False, literals.UPDATE_NOK,
-                            get_json(response)['message'])
+                            error_message(response))
 
-    return result
 
+def same_content(gistfile, local_content, facade):
+    """ Whenever a local content is the same as the remote file's one.
+
+    Contents are compared by their SHA-1 hash. Github truncates the
+    content of big files in the gist response: if the sizes match, the
+    raw file is requested to compare it.
+
+    :param gistfile: the remote :class: `GistFile <GistFile>`
+    :param local_content: the local content (a byte string)
+    :param facade: instance of the object that actually performs the request
+    """
+    if gistfile.get('size') not in (None, len(local_content)):
+        return False
+    if gistfile.truncated or gistfile.get('content') is None:
+        response = facade.request('GET', gistfile.raw_url, cached=False,
+                                  endpoint=facade.DOWNLOAD)
+        if not response.ok:
+            return False
+        remote_content = response.content
+    else:
+        remote_content = gistfile.content.encode('utf-8')
+    return (hashlib.sha1(remote_content).digest() ==
+            hashlib.sha1(local_content).digest())
 
-def authorize(facade):
+
+@reports_github_errors
+def authorize(facade, save=True):
     """ Configure the user and password of the GitHub user.
 
     :param facade: The Github interface
+    :param save: write the user and the token to the configuration file
     """
 
     # check if there is already an authorization for the app
@@ -344,13 +858,14 @@ def authorize(facade):
             authorization = model.Authorization(auth)
             if authorization.note == literals.APP_NAME:
                 # write the token to the configuration file
-                configurer = GistsConfigurer()
-                configurer.setConfigUser(facade.username)
-                configurer.setConfigToken(authorization.token)
+                if save:
+                    configurer = GistsConfigurer()
+                    configurer.setConfigUser(facade.username)
+                    configurer.setConfigToken(authorization.token)
                 return build_result(True, authorization)
     else:
         return build_result(False, literals.AUTHORIZE_NOK,
-                            get_json(response)['message'])
+                            error_message(response))
 
     # build the authorization request
     auth = model.Authorization()
@@ -365,16 +880,18 @@ def authorize(facade):
         result = build_result(True, auth)
 
         # write the token to the configuration file
-        configurer = GistsConfigurer()
-        configurer.setConfigUser(facade.username)
-        configurer.setConfigToken(auth.token)
+        if save:
+            configurer = GistsConfigurer()
+            configurer.setConfigUser(facade.username)
+            configurer.setConfigToken(auth.token)
     else:
         result = build_result(False, literals.AUTHORIZE_NOK,
-                              get_json(response)['message'])
+                              error_message(response))
 
     return result
 
 
+@reports_github_errors
 def fork(gist_id, facade):
     """ Forks a gist.
 
@@ -384,47 +901,466 @@ def fork(gist_id, facade):
     response = facade.fork_gist(gist_id)
 
     if response.ok:
-        result = build_result(True, model.Gist(get_json(response)))
+        result = build_result(True, parse_gist(response))
     else:
-        if get_json(response):
-            result = build_result(False, literals.FORK_ERROR, gist_id,
-                                  get_json(response)['message'])
-        else:
-            result = build_result(False, literals.UNHANDLED_EXCEPTION)
+        result = build_result(False, literals.FORK_ERROR, gist_id,
+                              error_message(response))
     return result
 
 
-def star(gist_id, facade):
+@reports_github_errors
+def star(gist_id, facade, journal=None):
     """ Stars a gist.
 
     :param gistid: identifier of the Gist to star
     :param facade: instance of the object that actually performs the request
+    :param journal: :class: `Journal <Journal>` where the change is queued
+        while offline, instead of performed
     """
+    if journal is not None:
+        return queue(journal, model.Mutation({'action': gists_journal.STAR,
+                                              'gist_id': gist_id}))
     response = facade.star_gist(gist_id)
 
     if response.ok:
         result = build_result(True, literals.STAR_OK, gist_id)
 
     else:
-        res_message = get_json(response)['message']
+        res_message = error_message(response)
         result = build_result(False, literals.STAR_NOK, res_message)
 
     return result
 
 
-def unstar(gist_id, facade):
+@reports_github_errors
+def unstar(gist_id, facade, journal=None):
     """ Unstars a gist.
 
     :param gistid: identifier of the Gist to unstar
     :param facade: instance of the object that actually performs the request
+    :param journal: :class: `Journal <Journal>` where the change is queued
+        while offline, instead of performed
     """
+    if journal is not None:
+        return queue(journal, model.Mutation({'action': gists_journal.UNSTAR,
+                                              'gist_id': gist_id}))
     response = facade.unstar_gist(gist_id)
 
     if response.ok:
         result = build_result(True, literals.UNSTAR_OK, gist_id)
 
     else:
-        res_message = get_json(response)['message']
+        res_message = error_message(response)
         result = build_result(False, literals.UNSTAR_NOK, res_message)
 
     return result
+
+
+@reports_github_errors
+def sync(username, destination_dir, facade, prune=True, jobs=None,
+         quiet=False):
+    """ Mirror the gists of a user in a local directory.
+
+    The gists are listed once, and compared with the state of the mirror,
+    kept in a :class: `Manifest <Manifest>`: only the new or modified files
+    of the updated gists are downloaded (concurrently).
+
+    :param username: owner of the gists
+    :param destination_dir: directory of the mirror
+    :param facade: instance of the object that actually performs the request
+    :param prune: remove the local copies of the deleted gists. All the
+        gists of the user are listed, as their pages are usually
+        revalidated by the cache. Otherwise, only the gists updated since
+        the last synchronization are listed.
+    :param jobs: maximum number of concurrent downloads
+    :param quiet: do not write the progress of the downloads
+    """
+    start = time.time()
+    local = gists_manifest.Manifest(destination_dir)
+    started_at = time.strftime(literals.ISO_8601,
+                               time.gmtime(start - SYNC_CLOCK_SKEW))
+
+    # The deleted gists are only found in the whole list
+    since = None if prune else local.synced_at
+    listed = fetch_gists(username, facade, since)
+    changed = [gist for gist in listed if not local.is_updated(gist)]
+    tasks = []
+    for gist in changed:
+        gist_dir = local.gist_dir(gist.identifier)
+        tasks.extend((gist_dir, gist.identifier, gistfile)
+                     for gistfile in local.stale_files(gist))
+
+    progress = None
+    if not quiet:
+        progress = Progress(len(tasks),
+                            sum(task[2].size or 0 for task in tasks))
+
+    def download_file(task):
+        gist_dir, gist_id, gistfile = task
+        try:
+            download(gistfile.raw_url, gist_dir, gistfile.filename,
+                     gistfile.size, facade.timeout_for(facade.DOWNLOAD)[1],
+                     quiet=True, offline=facade.offline)
+            message = None
+        except GithubError as error:
+            message = "%s: %s" % (gistfile.filename, error)
+        if progress:
+            progress.update(gistfile.size, message is None)
+        return gist_id, message
+
+    errors = {}
+    downloads = {}
+    pool = parallel.WorkerPool(jobs or parallel.WorkerPool.SIZE)
+    try:
+        for gist_id, message in pool.imap_unordered(download_file, tasks):
+            downloads[gist_id] = downloads.get(gist_id, 0) + 1
+            if message:
+                errors.setdefault(gist_id, []).append(message)
+    finally:
+        pool.close()
+
+    outcomes = []
+    for gist in changed:
+        if gist.identifier in errors:
+            outcome = build_result(False, "; ".join(errors[gist.identifier]))
+        else:
+            local.update(gist)
+            outcome = build_result(True, literals.SYNC_UPDATED,
+                                   downloads.get(gist.identifier, 0))
+        outcomes.append((gist.identifier, outcome))
+
+    if prune:
+        remote_ids = set(gist.identifier for gist in listed)
+        for gist_id in sorted(set(local.gists) - remote_ids):
+            local.remove(gist_id)
+            outcomes.append((gist_id, build_result(True,
+                                                   literals.SYNC_REMOVED)))
+
+    if not errors:
+        # Failed gists will be listed again in the next synchronization
+        local.synced_at = started_at
+    local.save()
+    return build_batch_result(outcomes, time.time() - start)
+
+
+def fetch_gists(username, facade, since=None):
+    """ Retrieve all the pages of the list of gists of a user.
+
+    Unlike 'list_gists', it raises a 'GithubError' if any of the pages can
+    not be retrieved, so a partial list is never taken as the whole one.
+
+    :param username: owner of the gists
+    :param facade: instance of the object that actually performs the request
+    :param since: ISO 8601 timestamp. Only the gists updated after it are
+        listed.
+    """
+    response = facade.request_list_of_gists(username, SYNC_PAGE_SIZE, since)
+    gists = []
+    for page in facade.iter_pages(response, prefetch=True):
+        if not page.ok:
+            raise GithubError(literals.LISTS_ERROR % error_message(page))
+        for gist in facade.iter_list(page, LIST_SKIPPED_FIELDS):
+            with profiling.stage('model'):
+                gists.append(model.Gist(gist))
+    return gists
+
+
+@reports_github_errors
+def search(username, pattern, facade, index, search_index, regex=False,
+           ignore_case=False, refresh=True, jobs=None):
+    """ Search a text or a regular expression in the descriptions, file
+    names and contents of the gists of a user.
+
+    Unless 'refresh' is False, the index of gists is brought up to date
+    first, and the contents of the gists updated since they were indexed
+    are retrieved concurrently and indexed. Without credentials, only the
+    public ones are retrieved.
+
+    :param username: owner of the gists
+    :param pattern: the text or the regular expression to search
+    :param facade: instance of the object that actually performs the request
+    :param index: the :class: `GistIndex <GistIndex>` of the gists
+    :param search_index: the :class: `SearchIndex <SearchIndex>`
+    :param regex: whenever 'pattern' is a regular expression
+    :param ignore_case: ignore the case of the letters
+    :param refresh: update the indexes before searching
+    :param jobs: maximum number of gists retrieved concurrently
+    """
+    if isinstance(pattern, str):
+        # The indexes hold unicode text: a byte string pattern (as read
+        # from the command line) would not match any of its characters
+        pattern = pattern.decode(getattr(sys.stdin, 'encoding', None) or
+                                 'utf-8', 'replace')
+    if regex:
+        try:
+            re.compile(pattern)
+        except re.error as error:
+            return build_result(False, literals.SEARCH_PATTERN_ERROR, error)
+
+    if refresh:
+        refreshed_at = index.refreshed_at(username)
+        if (refreshed_at is None or
+                time.time() - refreshed_at > INDEX_REFRESH_INTERVAL):
+            refresh_index(username, facade, index)
+        listed = index.query(owner=username)
+        readable = listed
+        if not facade.credential:
+            # The private gists indexed by an authenticated search can not
+            # be retrieved. They are searched as they were indexed.
+            readable = [gist for gist in listed if gist.public]
+        outdated = [gist.identifier
+                    for gist in search_index.outdated(readable)]
+
+        def fetch(gist_id):
+            try:
+                return fetch_contents(gist_id, facade)
+            except GithubError as error:
+                # Indexed on the next search
+                sys.stderr.write(literals.SEARCH_FETCH_ERROR %
+                                 (gist_id, error) + '\n')
+                return None
+
+        fetched = []
+        pool = parallel.WorkerPool(jobs or parallel.WorkerPool.SIZE)
+        try:
+            for gist in pool.imap_unordered(fetch, outdated):
+                if gist is not None:
+                    fetched.append(gist)
+                if len(fetched) == SEARCH_BATCH_SIZE:
+                    search_index.store(fetched, username)
+                    fetched = []
+        finally:
+            pool.close()
+        search_index.store(fetched, username)
+        search_index.prune(username, [gist.identifier for gist in listed])
+
+    return build_result(True, search_index.search(pattern, regex,
+                                                  ignore_case, username))
+
+
+def fetch_contents(gist_id, facade):
+    """ Retrieve a gist with the whole content of its files.
+
+    Github truncates the content of big files in the gist response: their
+    raw file is requested.
+
+    :param gist_id: identifier of the gist
+    :param facade: instance of the object that actually performs the request
+    """
+    response = facade.request_gist(gist_id)
+    if not response.ok:
+        raise GithubError(literals.SHOW_ERROR % error_message(response))
+    gist = parse_gist(response)
+    for gistfile in gist.files:
+        if gistfile.truncated or gistfile.get('content') is None:
+            raw = facade.request('GET', gistfile.raw_url, cached=False,
+                                 endpoint=facade.DOWNLOAD)
+            if not raw.ok:
+                raise GithubError(literals.DOWNLOAD_ERROR %
+                                  error_message(raw))
+            gistfile.content = raw.content.decode('utf-8', 'replace')
+    return gist
+
+
+def cache(response_cache, clear):
+    """ Shows the statistics of the local cache of responses.
+
+    :param response_cache: the :class: `ResponseCache <ResponseCache>`
+    :param clear: remove all the entries before returning the statistics
+    """
+    if clear:
+        response_cache.clear()
+    return build_result(True, response_cache.stats())
+
+
+def daemon(command, path, foreground=False, idle_timeout=None):
+    """ Starts or stops the daemon that runs the commands, or returns its
+    status.
+
+    :param command: 'start', 'stop' or 'status'
+    :param path: path of the Unix socket of the daemon
+    :param foreground: run the daemon in this process, until it exits
+    :param idle_timeout: seconds without commands after which the daemon
+        exits. 'IDLE_TIMEOUT' if None.
+    """
+    status = gists_daemon.daemon_status(path)
+    if command == 'status':
+        if status is None:
+            return build_result(False, literals.DAEMON_NOT_RUNNING)
+        return build_result(True, status)
+
+    if command == 'stop':
+        if gists_daemon.stop_daemon(path) is None:
+            return build_result(False, literals.DAEMON_NOT_RUNNING)
+        return build_result(True, literals.DAEMON_STOPPED, status['pid'])
+
+    if status is not None:
+        return build_result(False, literals.DAEMON_RUNNING, status['pid'])
+    status = gists_daemon.start_daemon(
+        path, idle_timeout or gists_daemon.IDLE_TIMEOUT, foreground)
+    if foreground:
+        return build_result(True, literals.DAEMON_STOPPED, os.getpid())
+    if status is None:
+        return build_result(False, literals.DAEMON_START_ERROR)
+    return build_result(True, status)
+
+
+def queue(journal, mutation):
+    """ Appends a change to the journal, to send it once online.
+
+    :param journal: the :class: `Journal <Journal>`
+    :param mutation: the :class: `Mutation <Mutation>` to queue
+    """
+    journal.append(mutation)
+    return build_result(True, literals.JOURNAL_QUEUED,
+                        gists_journal.describe(mutation))
+
+
+def journal(command, changes, facade=None, confirmed=False):
+    """ Shows, replays or drops the changes queued while offline.
+
+    The data of the 'show' result is the list of queued changes, and its
+    'requests' attribute the number of requests they are coalesced into.
+
+    :param command: 'show', 'replay' or 'clear'
+    :param changes: the :class: `Journal <Journal>`
+    :param facade: instance of the object that actually performs the request.
+        Only needed to replay the changes.
+    :param confirmed: do not ask for confirmation before dropping the
+        changes
+    """
+    if command == 'replay':
+        return replay(changes, facade)
+
+    mutations = changes.mutations()
+    if not mutations:
+        return build_result(True, literals.JOURNAL_EMPTY)
+    if command == 'clear':
+        if not confirmed and not confirm(literals.JOURNAL_CLEAR_CONFIRMATION
+                                         % (len(mutations))):
+            return build_result(False, literals.JOURNAL_ABORTED)
+        changes.replace([], len(mutations))
+        return build_result(True, literals.JOURNAL_CLEARED, len(mutations))
+    result = build_result(True, mutations)
+    result.requests = len(gists_journal.coalesce(mutations))
+    return result
+
+
+@reports_github_errors
+def replay(changes, facade):
+    """ Sends the queued changes to Github in order, once coalesced.
+
+    Each change leaves the journal as soon as it is sent, or if Github
+    rejects it for good ('REJECTED_STATUSES'). On any other failure (Github
+    can not be reached, the credentials are not valid, a rate limit...) the
+    replay stops: that change and the following ones are kept for the next
+    replay.
+
+    Returns a :class: `BatchResult <BatchResult>` with the outcome of each
+    sent change. Its 'queued' attribute is the number of queued changes,
+    'requests' the number of requests they are coalesced into, 'dropped'
+    the number of changes rejected and dropped, and 'kept' the number of
+    changes left in the journal.
+
+    :param changes: the :class: `Journal <Journal>`
+    :param facade: instance of the object that actually performs the request
+    """
+    start = time.time()
+    mutations = changes.mutations()
+    if not mutations:
+        return build_result(True, literals.JOURNAL_EMPTY)
+    pending = gists_journal.coalesce(mutations)
+    changes.replace(pending, len(mutations))
+
+    outcomes = []
+    dropped = kept = 0
+    for position, mutation in enumerate(pending):
+        outcome, retry = __replay_mutation(mutation, facade)
+        outcomes.append((gists_journal.describe(mutation), outcome))
+        if retry:
+            kept = len(pending) - position
+            break
+        if not outcome.success:
+            dropped += 1
+        changes.replace([], 1)
+    result = build_batch_result(outcomes, time.time() - start)
+    result.queued = len(mutations)
+    result.requests = len(pending)
+    result.dropped = dropped
+    result.kept = kept
+    return result
+
+
+def __replay_mutation(mutation, facade):
+    """ Sends a queued change to Github.
+
+    Returns its :class: `Result <Result>`, and whenever it has to be sent
+    again: unless it has been sent or rejected for good, it is kept.
+    """
+    try:
+        response = __mutation_request(mutation, facade)
+    except GithubError as error:
+        return build_result(False, unicode(error)), True
+
+    if response.ok:
+        if mutation.action == gists_journal.CREATE:
+            return build_result(True, parse_gist(response)), False
+        messages = {gists_journal.UPDATE: literals.UPDATE_OK,
+                    gists_journal.DELETE: literals.DELETE_OK,
+                    gists_journal.STAR: literals.STAR_OK,
+                    gists_journal.UNSTAR: literals.UNSTAR_OK}
+        return (build_result(True, messages[mutation.action],
+                             mutation.gist_id), False)
+
+    errors = {gists_journal.UPDATE: literals.UPDATE_NOK,
+              gists_journal.DELETE: literals.DELETE_NOK,
+              gists_journal.STAR: literals.STAR_NOK,
+              gists_journal.UNSTAR: literals.UNSTAR_NOK}
+    result = build_result(False, errors.get(mutation.action, "%s"),
+                          error_message(response))
+    if facade.rate_limiter.is_limited(response):
+        return result, True
+    return result, response.status_code not in REJECTED_STATUSES
+
+
+def __mutation_request(mutation, facade):
+    """ Sends the request of a queued change and returns its response. """
+    if mutation.action == gists_journal.CREATE:
+        gist = model.Gist({'public': mutation.public})
+        if mutation.description:
+            gist.description = mutation.description
+        for filename, content in mutation.files.items():
+            gist.setFile(filename, {'content': content})
+        return facade.create_gist(gist)
+
+    if mutation.action == gists_journal.UPDATE:
+        delta = model.Gist({'id': mutation.gist_id})
+        if mutation.description:
+            delta.description = mutation.description
+        for filename, content in mutation.files.items():
+            if content is None:
+                delta.setFile(filename, None)
+            else:
+                delta.setFile(filename, {'content': content})
+        return facade.update_gist(delta)
+
+    requests = {gists_journal.DELETE: facade.delete_gist,
+                gists_journal.STAR: facade.star_gist,
+                gists_journal.UNSTAR: facade.unstar_gist}
+    return requests[mutation.action](mutation.gist_id)
+
+
+@reports_github_errors
+def ratelimit(facade):
+    """ Retrieve the current rate limit budget.
+
+    :param facade: instance of the object that actually performs the request
+    """
+    response = facade.request_rate_limit()
+
+    if response.ok:
+        result = build_result(True, get_json(response)['resources']['core'])
+    else:
+        result = build_result(False, literals.RATE_LIMIT_ERROR,
+                              error_message(response))
+    return result
@@ -0,0 +1,304 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+
+gists.batch
+~~~~~~~~~~~
+
+Execution of many commands in a single process ('batch' command). Each
+line of a script is a command, written as the arguments of 'gists' or as
+a JSON list of arguments or object of argument values:
+
+    create -d "Deploy notes" -f notes.md
+    ["star", "5ab8f2e"]
+    {"command": "update", "gist_id": "5ab8f2e", "description": "Notes"}
+
+Every line runs through the 'handlers'->'actions'->'formatters' workflow,
+and the facades, caches and indexes are shared by all of them. Lines can
+run concurrently, but the ones of the same gist run in order.
+
+"""
+
+import argparse
+import collections
+import json
+import shlex
+import threading
+import time
+import types
+import gists
+import literals
+import parallel
+from lazy import lazy_import
+from utils import ScriptResult, build_result
+
+colored = lazy_import('clint.textui.colored')
+
+
+class LineError(Exception):
+    """ Raised when a line of a script is not a valid command. """
+
+
+class LineParser(argparse.ArgumentParser):
+    """ :class: `LineParser <LineParser>` parser of the arguments of a
+    line, that raises 'LineError' instead of exiting. """
+
+    def error(self, message):
+        raise LineError(message)
+
+    def exit(self, status=0, message=None):
+        raise LineError(message or self.format_usage().strip())
+
+
+def read_script(script):
+    """ Yields the (line number, line) of each command of a script,
+    skipping the blank lines and the comments (starting with '#').
+
+    :param script: file-like object with a command per line
+    """
+    for number, line in enumerate(iter(script.readline, ''), 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield number, line
+
+
+def parse_line(line):
+    """ Returns the parsed arguments of a line. Raises 'LineError' if it
+    is not a valid command. """
+    if line.startswith('['):
+        argv = __json(line)
+    elif line.startswith('{'):
+        argv = json_argv(__json(line))
+    else:
+        try:
+            argv = shlex.split(line)
+        except ValueError as e:
+            raise LineError(str(e))
+    return gists.parse_args([__text(argument) for argument in argv],
+                            LineParser)
+
+
+def json_argv(values):
+    """ Returns the command line arguments of a JSON object, whose
+    'command' key is the name of the command and the other keys are the
+    names of its arguments (as 'gist_id', 'description' or 'no_cache').
+
+    Positional arguments take the value (or the list of values) of their
+    key. Options are written with their long name, flags only if their
+    value is true.
+    """
+    values = dict(values)
+    command = values.pop('command', None)
+    parser, subparsers = gists.build_parser(command, LineParser)
+    if command not in subparsers.choices:
+        raise LineError(literals.BATCH_UNKNOWN_COMMAND % command)
+
+    argv = []
+    for arguments_parser in (parser, subparsers.choices[command]):
+        positionals, options = [], []
+        for action in arguments_parser._actions:
+            if action.dest not in values or action is subparsers:
+                continue
+            value = values.pop(action.dest)
+            if not isinstance(value, list):
+                value = [value]
+            if not action.option_strings:
+                positionals.extend(value)
+            elif action.nargs == 0:
+                if value[0]:
+                    options.append(action.option_strings[-1])
+            elif value[0] is not None:
+                options.append(action.option_strings[-1])
+                options.extend(value)
+        # Positionals go first, so options with several values do not
+        # take them
+        argv.extend(positionals + options)
+        if arguments_parser is parser:
+            argv.append(command)
+    if values:
+        raise LineError(literals.BATCH_UNKNOWN_ARGUMENTS %
+                        ", ".join(sorted(values)))
+    return argv
+
+
+def run_script(script, jobs=None, defaults=None):
+    """ Runs the commands of a script.
+
+    Returns a :class: `ScriptResult <ScriptResult>` whose data yields the
+    outcome of each line, in order, as soon as it is completed. Lines are
+    read, parsed and handled (which may ask for a password) one at a time,
+    and their actions run in a pool of 'jobs' threads. The actions of the
+    lines of the same gist wait for the previous ones.
+
+    :param script: file-like object with a command per line
+    :param jobs: maximum number of lines run concurrently (1 by default)
+    :param defaults: values of the global arguments of the lines that do
+        not set them
+    """
+    result = ScriptResult()
+    result.data = __run_lines(read_script(script), jobs or 1,
+                              defaults or {})
+    return result
+
+
+def format_script(result):
+    """ Formats the output of the 'batch' command.
+
+    Returns a generator of the output of each line, after the line
+    itself, and a summary.
+
+    :param result: ScriptResult instance
+    """
+    succeeded = total = 0
+    for number, line, args, outcome in result.data:
+        total += 1
+        if outcome.success:
+            succeeded += 1
+        yield colored.cyan("%d: %s\n" % (number, line))
+        if args is None:
+            yield colored.red("Error: ") + outcome.data + "\n"
+            continue
+        output = gists.format_result(args, outcome)
+        if isinstance(output, types.GeneratorType):
+            for chunk in output:
+                yield chunk
+        else:
+            yield output
+            yield "\n"
+    summary = literals.BATCH_SUMMARY % (succeeded, total,
+                                        time.time() - result.started)
+    if succeeded == total:
+        yield colored.cyan(summary) + "\n"
+    else:
+        yield colored.red(summary) + "\n"
+
+
+def __run_lines(lines, jobs, defaults):
+    """ Yields the (line number, line, arguments, result) of each line. """
+    pool = parallel.WorkerPool(jobs)
+    pending = collections.deque()
+    last_by_gist = {}
+    try:
+        for number, line in lines:
+            pending.append(__submit(pool, number, line, defaults,
+                                    last_by_gist))
+            # Keep a bounded number of lines in flight
+            while len(pending) > jobs or (pending and
+                                          pending[0][3].ready()):
+                yield __outcome(pending.popleft())
+        while pending:
+            yield __outcome(pending.popleft())
+    finally:
+        pool.close()
+
+
+def __submit(pool, number, line, defaults, last_by_gist):
+    """ Parses and handles a line, and schedules its action. Returns the
+    (line number, line, arguments, pending result) of the line. """
+    try:
+        args = parse_line(line)
+        for name, value in defaults.items():
+            if not getattr(args, name, None):
+                setattr(args, name, value)
+        gist_ids = __gist_ids(args)
+        if '-' in gist_ids or __confirms(args):
+            raise LineError(literals.BATCH_INTERACTIVE)
+        parameters = gists.load(args.handle_args)(args)
+    except (LineError, SystemExit) as e:
+        message = e.code if isinstance(e, SystemExit) else str(e)
+        return number, line, None, __Done(build_result(
+            False, literals.BATCH_LINE_ERROR, message or line))
+
+    # The action waits for the previous lines of the same gists. Their
+    # pending results can not be shared: only one thread is woken up when
+    # they are ready.
+    previous = [last_by_gist[gist_id] for gist_id in gist_ids
+                if gist_id in last_by_gist]
+    done = threading.Event()
+    pending = pool.submit(__perform, args, parameters, previous, done)
+    for gist_id in gist_ids:
+        last_by_gist[gist_id] = done
+    return number, line, args, pending
+
+
+def __perform(args, parameters, previous, done):
+    """ Runs the action of a line, once the previous lines of its gists
+    have been completed, and sets the 'done' event. """
+    try:
+        for event in previous:
+            event.wait()
+        return gists.load(args.func)(*parameters)
+    except Exception as e:
+        return build_result(False, literals.BATCH_LINE_ERROR, e)
+    finally:
+        done.set()
+
+
+def __outcome(line):
+    """ Waits for the result of a scheduled line. """
+    number, text, args, pending = line
+    return number, text, args, pending.get()
+
+
+def __confirms(args):
+    """ Whenever the command of a line asks for confirmation. """
+    if args.func == 'actions.delete_gists':
+        return not args.yes
+    if args.func == 'actions.journal':
+        return args.command == 'clear' and not args.yes
+    return False
+
+
+def __gist_ids(args):
+    """ Returns the identifiers of the gists a command works with. """
+    if getattr(args, 'gist_ids', None):
+        return args.gist_ids
+    if getattr(args, 'gist_id', None):
+        return [args.gist_id]
+    return []
+
+
+def __json(line):
+    """ Decodes a JSON line. """
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        raise LineError(str(e))
+
+
+def __text(value):
+    """ Returns an argument as a string. """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+class __Done(object):
+    """ Pending result of a line that has not been scheduled. """
+
+    def __init__(self, result):
+        self.result = result
+
+    def ready(self):
+        return True
+
+    def get(self):
+        return self.result
@@ -0,0 +1,258 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+
+gists.cache
+~~~~~~~~~~~
+
+On-disk cache of the GitHub API responses. Bodies are stored with their
+'ETag' and 'Last-Modified' headers, so the next requests are sent as
+conditional ones and a '304 Not Modified' answer is served from disk.
+
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from lazy import lazy_import
+
+# Imported when a cached response is built
+requests = lazy_import('requests')
+
+
+class ResponseCache(object):
+    """ :class: `ResponseCache <ResponseCache>` stores the responses of the
+    GET requests in a directory, evicting the least recently used ones when
+    the size of the stored bodies exceeds 'max_size'.
+    """
+
+    # Name of the file that keeps the entries metadata
+    INDEX_FILE = "index.json"
+
+    # Default size cap of the stored bodies (in bytes)
+    MAX_SIZE = 20 * 1024 * 1024
+
+    # Response headers kept along with the body
+    STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Link')
+
+    def __init__(self, directory, max_size=MAX_SIZE):
+        """ Initializes the cache, loading the index from 'directory'.
+
+        :param directory: where the bodies and the index are stored. It is
+            created if it does not exist.
+        :param max_size: maximum size in bytes of the stored bodies.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.index_path = os.path.join(directory, self.INDEX_FILE)
+        self.entries, self.totals = self.__load_index()
+
+    def key(self, url, params=None, identity=None):
+        """ Returns the key of a request.
+
+        :param url: the requested URL
+        :param params: the query parameters of the request
+        :param identity: who performs the request, so private responses are
+            never served to another user.
+        """
+        raw_key = json.dumps([url, sorted((params or {}).items()), identity])
+        return hashlib.sha1(raw_key).hexdigest()
+
+    def conditional_headers(self, key):
+        """ Returns the headers to revalidate the entry of 'key'.
+
+        Empty dict if the entry is not stored.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+        headers = {}
+        if entry:
+            if entry['headers'].get('ETag'):
+                headers['If-None-Match'] = entry['headers']['ETag']
+            if entry['headers'].get('Last-Modified'):
+                headers['If-Modified-Since'] = \
+                    entry['headers']['Last-Modified']
+        return headers
+
+    def hit(self, key, response):
+        """ Builds the response of a revalidated entry.
+
+        Called when Github answers '304 Not Modified'. The headers of the
+        '304' response are merged over the stored ones.
+
+        :param key: key of the entry
+        :param response: the '304' response
+        """
+        cached = self.__read(key, response.headers)
+        if cached is not None:
+            cached.url = response.url
+            cached.request = response.request
+            cached.encoding = response.encoding or 'utf-8'
+        return cached
+
+    def lookup(self, key, url):
+        """ Builds the response of a stored entry, without revalidating
+        it. Used while offline. None if the entry is not stored.
+
+        :param key: key of the entry
+        :param url: the requested URL
+        """
+        cached = self.__read(key)
+        if cached is not None:
+            cached.url = url
+            cached.encoding = 'utf-8'
+        return cached
+
+    def miss(self, key, response):
+        """ Stores a fresh response, if it can be revalidated later.
+
+        :param key: key of the entry
+        :param response: the '200' response
+        """
+        with self.lock:
+            self.misses += 1
+            self.totals['misses'] += 1
+            if (response.status_code != 200 or not
+                    (response.headers.get('ETag') or
+                     response.headers.get('Last-Modified'))):
+                self.__save_index()
+                return
+            body = response.content
+            with open(self.__body_path(key), 'wb') as f:
+                f.write(body)
+            self.entries[key] = {
+                'url': response.url.split('?')[0],
+                'size': len(body),
+                'accessed': time.time(),
+                'headers': dict((name, response.headers[name])
+                                for name in self.STORED_HEADERS
+                                if name in response.headers)}
+            self.__evict()
+            self.__save_index()
+
+    def size(self):
+        """ Returns the size in bytes of the stored bodies. """
+        with self.lock:
+            return sum(entry['size'] for entry in self.entries.values())
+
+    def stats(self):
+        """ Returns the statistics of the cache.
+
+        'hits' and 'misses' are counted for this instance, while
+        'total_hits' and 'total_misses' are kept between executions.
+        """
+        with self.lock:
+            return {'entries': len(self.entries),
+                    'size': sum(entry['size']
+                                for entry in self.entries.values()),
+                    'max_size': self.max_size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'total_hits': self.totals['hits'],
+                    'total_misses': self.totals['misses'],
+                    'evictions': self.totals['evictions']}
+
+    def clear(self):
+        """ Removes all the entries and resets the statistics. """
+        with self.lock:
+            for key in list(self.entries):
+                self.__remove(key)
+            self.totals = {'hits': 0, 'misses': 0, 'evictions': 0}
+            self.__save_index()
+
+    def __read(self, key, headers=None):
+        """ Builds a '200' response from the stored entry of 'key', with
+        'headers' merged over the stored ones. Counted as a hit. """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            try:
+                with open(self.__body_path(key), 'rb') as f:
+                    body = f.read()
+            except IOError:
+                self.__remove(key)
+                self.__save_index()
+                return None
+            entry['accessed'] = time.time()
+            self.hits += 1
+            self.totals['hits'] += 1
+            self.__save_index()
+
+        cached = requests.models.Response()
+        cached.status_code = 200
+        cached.reason = 'OK'
+        cached.headers = requests.structures.CaseInsensitiveDict(
+            entry['headers'])
+        cached.headers.update(headers or {})
+        cached._content = body
+        cached._content_consumed = True
+        cached.from_cache = True
+        return cached
+
+    def __evict(self):
+        """ Removes the least recently used entries until the size of the
+        stored bodies fits in 'max_size'. """
+        total = sum(entry['size'] for entry in self.entries.values())
+        by_access = sorted(self.entries.items(),
+                           key=lambda item: item[1]['accessed'])
+        for key, entry in by_access:
+            if total <= self.max_size:
+                break
+            total -= entry['size']
+            self.__remove(key)
+            self.totals['evictions'] += 1
+
+    def __remove(self, key):
+        """ Removes a single entry and its body. """
+        self.entries.pop(key, None)
+        try:
+            os.remove(self.__body_path(key))
+        except OSError:
+            pass
+
+    def __body_path(self, key):
+        return os.path.join(self.directory, key + '.body')
+
+    def __load_index(self):
+        """ Loads the entries and the statistics from the index file. """
+        totals = {'hits': 0, 'misses': 0, 'evictions': 0}
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            totals.update(index.get('totals', {}))
+            return index.get('entries', {}), totals
+        except (IOError, ValueError):
+            return {}, totals
+
+    def __save_index(self):
+        """ Writes the index file atomically. """
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'entries': self.entries, 'totals': self.totals}, f)
+        os.rename(temp_path, self.index_path)
@@ -0,0 +1,171 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+
+gists.client
+~~~~~~~~~~~~
+
+Programmatic interface to the gists, for applications that embed them
+instead of running the 'gists' command. The credentials are explicit, and
+the methods never read the configuration file, prompt, or write to the
+standard streams: they return the :class: `Result <Result>` of the
+'actions' functions, whose data are the 'model' objects.
+
+    >>> client = Client(token='2f9a...')
+    >>> result = client.show('5ab8f2e')
+    >>> if result.success:
+    ...     print result.data.description
+
+A single client can be shared by the threads of a server: all the calls
+use the facade's pool of connections.
+
+"""
+
+import actions
+import literals
+from cache import ResponseCache
+from utils import GithubError, GithubFacade, build_result
+
+
+class Client(object):
+    """ :class: `Client <Client>` performs the operations on the gists
+    with a single :class: `GithubFacade <GithubFacade>`.
+
+    :param username: the GitHub user. It authenticates with 'password',
+        and it is the owner of the listed gists by default.
+    :param token: OAuth token to authenticate with, instead of the
+        password.
+    :param password: the password of 'username'.
+    :param cache_dir: directory where the responses are cached and
+        revalidated. No cache if None.
+    :param options: other arguments of the facade ('pool_size', 'timeouts',
+        'retry_policy', 'headers'...)
+    """
+
+    def __init__(self, username=None, token=None, password=None,
+                 cache_dir=None, **options):
+        if password is not None and username is None:
+            raise ValueError(literals.CLIENT_PASSWORD_WITHOUT_USER)
+        self.username = username
+        if cache_dir is not None:
+            options['cache'] = ResponseCache(cache_dir)
+        if password is not None:
+            self.facade = GithubFacade(username, password, **options)
+        else:
+            self.facade = GithubFacade(None, token, **options)
+
+    def list_gists(self, username=None, starred=False, per_page=None):
+        """ Lists the gists of a user, or the starred ones of the
+        authenticated user. The data of the result is a list of
+        :class: `Gist <Gist>`.
+
+        :param username: owner of the gists. The client's user if None.
+        """
+        username = username or self.username
+        if not username and not starred:
+            return build_result(False, literals.CLIENT_USER_NOT_FOUND)
+        result = actions.list_gists(username, self.facade, starred,
+                                    per_page, raise_errors=True)
+        if result.success:
+            try:
+                result.data = list(result.data)
+            except GithubError as error:
+                # The pages after the first one are requested as the list
+                # is consumed
+                return build_result(False, unicode(error))
+        return result
+
+    def show(self, gist_id, filename=None):
+        """ Retrieves a :class: `Gist <Gist>`, or one of its files as a
+        :class: `GistFile <GistFile>` if 'filename' is set. """
+        return actions.show(gist_id, filename, self.facade)
+
+    def download(self, gist_id, filename=None, destination_dir=".",
+                 download_all=False, jobs=None):
+        """ Downloads the only file of a gist, the file 'filename' or, if
+        'download_all' is set or 'filename' is a glob pattern, all the
+        matching files (in a :class: `BatchResult <BatchResult>`). """
+        return actions.get(gist_id, filename, destination_dir, self.facade,
+                           download_all, jobs, quiet=True)
+
+    def create(self, filenames, directory=".", description=None,
+               public=True):
+        """ Creates a gist with the files 'filenames' of 'directory'. The
+        data of the result is the new :class: `Gist <Gist>`. """
+        return actions.post(public, filenames, directory, description,
+                            self.facade)
+
+    def update(self, gist_id, description=None, filenames=None,
+               directory=".", new=False, remove=False):
+        """ Updates the description of a gist, or its files 'filenames'
+        with the ones of 'directory'. With 'new' the files are added, and
+        with 'remove' they are removed from the gist. """
+        return actions.update(gist_id, description, filenames, directory,
+                              new, remove, self.facade)
+
+    def delete(self, gist_id):
+        """ Deletes a gist, without asking for confirmation. """
+        return actions.delete(gist_id, self.facade, confirmed=True)
+
+    def fork(self, gist_id):
+        """ Forks a gist. The data of the result is the new
+        :class: `Gist <Gist>`. """
+        return actions.fork(gist_id, self.facade)
+
+    def star(self, gist_id):
+        """ Stars a gist. """
+        return actions.star(gist_id, self.facade)
+
+    def unstar(self, gist_id):
+        """ Unstars a gist. """
+        return actions.unstar(gist_id, self.facade)
+
+    def sync(self, destination_dir, username=None, prune=True, jobs=None):
+        """ Mirrors the gists of a user in 'destination_dir'. The result is
+        a :class: `BatchResult <BatchResult>` with the updated and removed
+        gists. """
+        username = username or self.username
+        if not username:
+            return build_result(False, literals.CLIENT_USER_NOT_FOUND)
+        return actions.sync(username, destination_dir, self.facade, prune,
+                            jobs, quiet=True)
+
+    def authorize(self):
+        """ Retrieves (or creates) the OAuth token of the application for
+        the user and password of the client. The data of the result is an
+        :class: `Authorization <Authorization>`; the configuration file is
+        not written. """
+        return actions.authorize(self.facade, save=False)
+
+    def rate_limit(self):
+        """ Retrieves the remaining requests to the API, as a dict with
+        the 'limit', 'remaining' and 'reset' keys. """
+        return actions.ratelimit(self.facade)
+
+    def close(self):
+        """ Closes the connections of the facade. """
+        self.facade.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,404 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+
+gists.daemon
+~~~~~~~~~~~~
+
+Optional background process that runs the commands with warm state: the
+modules are imported, the configuration is parsed and the facades keep
+their connections, caches and rate limit budget between commands.
+
+The 'gists' command forwards its arguments, along with the working
+directory and the terminal of the client, through the Unix socket
+'~/.gists/daemon.sock', and writes the output sent back. When no daemon
+is listening, the command runs in its own process as usual.
+
+Commands are run one at a time, as they change the working directory and
+the standard streams of the daemon.
+
+"""
+
+import errno
+import json
+import os
+import socket
+import sys
+import time
+import traceback
+
+# Name of the socket inside '~/.gists'
+SOCKET_NAME = 'daemon.sock'
+
+# Seconds to wait for the daemon to accept a connection
+CONNECT_TIMEOUT = 1.0
+
+# Seconds without commands after which the daemon exits
+IDLE_TIMEOUT = 30 * 60
+
+# Seconds to wait for a new daemon to listen
+START_TIMEOUT = 5.0
+
+
+def socket_path():
+    """ Returns the path of the socket of the daemon. """
+    import utils
+    return utils.data_path(SOCKET_NAME)
+
+
+def forward(argv, path=None):
+    """ Runs a command in the daemon, writing its output to the standard
+    streams of this process.
+
+    Returns the exit status of the command, or None if no daemon is
+    listening on the socket.
+
+    :param argv: the command line arguments, without the program name
+    :param path: path of the socket. '~/.gists/daemon.sock' if None.
+    """
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+    connection = __connect(path)
+    if connection is None:
+        return None
+    try:
+        import utils
+        __send(connection, {'argv': argv,
+                            'cwd': os.getcwd(),
+                            'tty': [sys.stdout.isatty(), sys.stderr.isatty()],
+                            'size': utils.terminal_size(),
+                            'encoding': sys.stdout.encoding})
+        reader = connection.makefile('rb')
+        while True:
+            header = reader.readline()
+            if not header:
+                # The daemon exited while running the command
+                import literals
+                sys.stderr.write(literals.DAEMON_LOST + '\n')
+                return 1
+            kind, value = header[0], int(header[1:])
+            if kind == 'x':
+                return value
+            stream = sys.stdout if kind == 'o' else sys.stderr
+            stream.write(reader.read(value))
+            stream.flush()
+    finally:
+        connection.close()
+
+
+def daemon_status(path=None):
+    """ Returns the status of the daemon as a dict, None if it is not
+    running. """
+    return __control(path or socket_path(), 'status')
+
+
+def stop_daemon(path=None):
+    """ Stops the daemon. Returns its last status, None if it was not
+    running. """
+    return __control(path or socket_path(), 'stop')
+
+
+def start_daemon(path=None, idle_timeout=IDLE_TIMEOUT, foreground=False):
+    """ Starts a daemon, detached from the terminal unless 'foreground' is
+    set. Returns its status once it is listening, None if it could not be
+    started.
+
+    With 'foreground', it only returns when the daemon exits.
+    """
+    path = path or socket_path()
+    if foreground:
+        Daemon(path, idle_timeout).serve()
+        return None
+    if not hasattr(os, 'fork'):
+        return None
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            if os.fork() == 0:
+                os.setsid()
+                devnull = os.open(os.devnull, os.O_RDWR)
+                for fd in (0, 1, 2):
+                    os.dup2(devnull, fd)
+                Daemon(path, idle_timeout).serve()
+        finally:
+            os._exit(0)
+
+    # Wait for the intermediate process, that exits right away, and for
+    # the daemon to listen
+    os.waitpid(pid, 0)
+    started = time.time()
+    while time.time() - started < START_TIMEOUT:
+        status = daemon_status(path)
+        if status is not None:
+            return status
+        time.sleep(0.05)
+    return None
+
+
+class Daemon(object):
+    """ :class: `Daemon <Daemon>` server of the Unix socket.
+
+    Each connection sends a JSON line with the request. The 'status' and
+    'stop' requests are answered with a JSON line. Otherwise, the request
+    is a command ('argv', 'cwd', 'tty', 'size' and 'encoding' keys), and
+    its output is sent as frames: 'o<length>\\n<bytes>' for the standard
+    output, 'e<length>\\n<bytes>' for the standard error and finally
+    'x<status>\\n' with the exit status.
+    """
+
+    def __init__(self, path, idle_timeout=IDLE_TIMEOUT):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.started = None
+        self.served = 0
+        self.running = False
+
+    def serve(self):
+        """ Accepts connections until it is stopped or it has been idle
+        'idle_timeout' seconds. """
+        listener = self.__listen()
+        self.started = time.time()
+        self.running = True
+        self.__warm_up()
+        try:
+            while self.running:
+                try:
+                    connection, _ = listener.accept()
+                except socket.timeout:
+                    break
+                try:
+                    connection.settimeout(None)
+                    self.handle(connection)
+                except socket.error:
+                    # The client went away
+                    pass
+                finally:
+                    connection.close()
+        finally:
+            listener.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def handle(self, connection):
+        """ Answers the request of a connection. A request that can not be
+        run is answered with an error, and the daemon keeps serving. """
+        try:
+            request = json.loads(connection.makefile('rb').readline())
+            command = request.get('command')
+        except (ValueError, AttributeError) as error:
+            self.__fail(connection, error)
+            return
+        if command == 'status':
+            self.__reply(connection, self.status())
+        elif command == 'stop':
+            self.running = False
+            self.__reply(connection, self.status())
+        else:
+            try:
+                self.run(connection, request)
+            except socket.error:
+                raise
+            except Exception as error:
+                self.__fail(connection, error)
+            self.served += 1
+
+    def run(self, connection, request):
+        """ Runs a command with the standard streams and the working
+        directory of the client, sending its output and its exit status.
+        """
+        import gists
+        import utils
+        stdout_tty, stderr_tty = request.get('tty', (False, False))
+        encoding = request.get('encoding')
+        stdout = ClientStream(connection, 'o', stdout_tty, encoding)
+        stderr = ClientStream(connection, 'e', stderr_tty, encoding)
+        saved = (sys.stdout, sys.stderr, sys.stdin, os.getcwd())
+        status = 0
+        try:
+            os.chdir(request['cwd'])
+            utils.set_terminal_size(tuple(request['size']))
+            sys.stdout, sys.stderr = stdout, stderr
+            # Prompts can not be answered: the client runs those commands
+            sys.stdin = open(os.devnull)
+            try:
+                gists.execute(gists.parse_args(request['argv']))
+            except SystemExit as e:
+                status = self.__exit_status(e.code)
+            except Exception:
+                traceback.print_exc()
+                status = 1
+            stdout.flush()
+            stderr.flush()
+        finally:
+            if sys.stdin is not saved[2]:
+                sys.stdin.close()
+            sys.stdout, sys.stderr, sys.stdin, cwd = saved
+            os.chdir(cwd)
+            utils.set_terminal_size(None)
+        connection.sendall('x%d\n' % status)
+
+    def status(self):
+        """ Returns the status of the daemon as a dict. """
+        return {'pid': os.getpid(),
+                'socket': self.path,
+                'started': self.started,
+                'uptime': int(time.time() - self.started),
+                'requests': self.served,
+                'running': self.running}
+
+    def __reply(self, connection, message):
+        """ Sends the answer of a control request as a JSON line. """
+        connection.sendall(json.dumps(message) + '\n')
+
+    def __fail(self, connection, error):
+        """ Answers a request that can not be run with the error in the
+        standard error and a failed exit status. """
+        import literals
+        message = (literals.DAEMON_REQUEST_ERROR % error) + '\n'
+        if isinstance(message, unicode):
+            message = message.encode('utf-8', 'replace')
+        connection.sendall('e%d\n%s' % (len(message), message))
+        connection.sendall('x1\n')
+
+    def __listen(self):
+        """ Binds the socket, only accessible by the current user,
+        replacing the one of a daemon that is no longer running. """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)
+        try:
+            listener.bind(self.path)
+        finally:
+            os.umask(umask)
+        listener.listen(16)
+        listener.settimeout(self.idle_timeout)
+        return listener
+
+    def __warm_up(self):
+        """ Imports the modules and reads the configuration the commands
+        need, so the first one is as fast as the next ones. """
+        import actions
+        import formatters
+        import handlers
+        import renderers
+        import utils
+        utils.requests.Session
+        utils.colored.green
+        handlers.get_config()
+
+    def __exit_status(self, code):
+        """ Returns the exit status of a 'SystemExit' code. """
+        if code is None:
+            return 0
+        if isinstance(code, int):
+            return code
+        sys.stderr.write("%s\n" % code)
+        return 1
+
+
+class ClientStream(object):
+    """ :class: `ClientStream <ClientStream>` file-like object that sends
+    the output of a command to the client of the daemon.
+
+    Writes are sent as frames when they are flushed. Once the client has
+    gone away, the first write raises 'IOError' (as a closed pipe does)
+    and the next ones are dropped.
+    """
+
+    def __init__(self, connection, kind, tty=False, encoding=None):
+        self.connection = connection
+        self.kind = kind
+        self.tty = tty
+        self.encoding = encoding or 'utf-8'
+        self.pending = []
+        self.lost = False
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode(self.encoding, 'replace')
+        self.pending.append(data)
+        if self.tty:
+            self.flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if not self.pending:
+            return
+        data = ''.join(self.pending)
+        self.pending = []
+        if self.lost:
+            return
+        try:
+            self.connection.sendall('%s%d\n%s' % (self.kind, len(data), data))
+        except socket.error as e:
+            self.lost = True
+            raise IOError(errno.EPIPE, str(e))
+
+    def isatty(self):
+        return self.tty
+
+
+def __connect(path):
+    """ Returns a connection to the daemon, None if it is not listening.
+    A socket left behind by a daemon that died is removed. """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(CONNECT_TIMEOUT)
+    try:
+        connection.connect(path)
+    except socket.error as e:
+        connection.close()
+        if e.errno == errno.ECONNREFUSED:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return None
+    connection.settimeout(None)
+    return connection
+
+
+def __send(connection, message):
+    """ Sends a message as a JSON line. """
+    connection.sendall(json.dumps(message) + '\n')
+
+
+def __control(path, command):
+    """ Sends a control request to the daemon and returns its answer,
+    None if it is not listening. """
+    if not os.path.exists(path):
+        return None
+    connection = __connect(path)
+    if connection is None:
+        return None
+    try:
+        __send(connection, {'command': command})
+        line = connection.makefile('rb').readline()
+        return json.loads(line) if line else None
+    except (socket.error, ValueError):
+        return None
+    finally:
+        connection.close()
@@ -18,9 +18,17 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import os
+import time
+import literals
 import model
-from clint.textui import colored
+import utils
+from lazy import lazy_import
+
+# Imported when the first colored string is formatted
+colored = lazy_import('clint.textui.colored')
+
+# Imported when the journal is formatted
+journal = lazy_import('journal', globals())
 
 """
 
@@ -61,7 +69,13 @@ def format_post(result):
     :param result: Result instance
     """
 
+    if isinstance(result, utils.BatchResult):
+        # Several gists processed at once
+        return __format_batch(result)
     if result.success:
+        if isinstance(result.data, basestring):
+            # Queued while offline. Just a string informing it
+            return result.data
         # Format the 'Gist' metadata object
         return __format_gist(result.data)
     else:
@@ -75,6 +89,9 @@ def format_get(result):
     :param result: Result instance
     """
 
+    if isinstance(result, utils.BatchResult):
+        # Several files downloaded at once
+        return __format_batch(result)
     if result.success:
         # The result is just a string informing the success
         return result.data
@@ -89,6 +106,9 @@ def format_delete(result):
     :param result: Result instance
     """
 
+    if isinstance(result, utils.BatchResult):
+        # Several gists processed at once
+        return __format_batch(result)
     if result.success:
         # The result is just a string informing the success
         return result.data
@@ -98,14 +118,21 @@ def format_delete(result):
 
 
 def format_update(result):
-    """ Formats the output of the 'delete' action.
+    """ Formats the output of the 'update' action.
 
     :param result: Result instance
     """
 
     if result.success:
-        # Format the 'Gist' metadata object
-        return __format_gist(result.data)
+        if isinstance(result.data, basestring):
+            # Queued while offline. Just a string informing it
+            return result.data
+        # Format the 'Gist' metadata object and the bytes saved
+        update_string = __format_gist(result.data)
+        if getattr(result, 'bytes_saved', None):
+            update_string += colored.green(literals.UPDATE_BYTES_SAVED %
+                                           (result.bytes_saved))
+        return update_string
     else:
         # Format the error string message
         return __format_error(result.data)
@@ -114,41 +141,13 @@ def format_update(result):
 def format_list(result):
     """ Formats the output of the 'list' action.
 
+    Returns a generator of lines, so each gist is written as soon as it
+    is listed.
+
     :param result: Result instance
     """
     if result.success:
-
-        # Get the list of Gists from the data
-        list_of_gists = result.data
-
-        # Calculate the number of columns of the current terminal window
-        rows, columns = os.popen('stty size', 'r').read().split()
-
-        # Set the header
-        gists_string = unicode(colored.cyan('-' * int(columns)) + "\n")
-        gists_string += unicode(colored.cyan("List of gists\n"))
-        gists_string += unicode(colored.cyan('-' * int(columns)) + "\n")
-
-        # Set the contents for each Gist listed
-        for gist in list_of_gists:
-            gists_string += unicode(colored.green(gist.identifier + ": "))
-            description = "(no desc)"
-            if gist.description and gist.description != "":
-                description = gist.description
-            gists_string += description
-            gist_names = [gistfile.filename for
-                          gistfile in gist.files]
-            stringfiles = " [" + ", ".join(gist_names) + "]"
-            gists_string += unicode(colored.red(stringfiles))
-            if not gist.public:
-                gists_string += " (Private Gist) "
-            gists_string += '\n'
-
-        # Set the footer
-        gists_string += unicode(colored.cyan('-' * int(columns)) + "\n")
-
-        # Return the formatted String
-        return gists_string
+        return __iter_list(result.data)
     else:
         # Format the error string message
         return __format_error(result.data)
@@ -169,6 +168,9 @@ def format_star(result):
     :param result: Result instance
     """
 
+    if isinstance(result, utils.BatchResult):
+        # Several gists processed at once
+        return __format_batch(result)
     if result.success:
         # The result is just a string informing the success
         return result.data
@@ -177,6 +179,156 @@ def format_star(result):
         return __format_error(result.data)
 
 
+def format_sync(result):
+    """ Formats the output of the 'sync' action.
+
+    :param result: Result instance
+    """
+
+    if isinstance(result, utils.BatchResult):
+        if not result.data:
+            return colored.green(literals.SYNC_UP_TO_DATE)
+        return __format_batch(result)
+    else:
+        # Format the error string message
+        return __format_error(result.data)
+
+
+def format_ratelimit(result):
+    """ Formats the output of the 'ratelimit' action.
+
+    :param result: Result instance
+    """
+
+    if result.success:
+        budget = result.data
+        reset = time.strftime("%Y-%m-%d %H:%M:%S",
+                              time.localtime(budget['reset']))
+        limit_string = (colored.green("Limit:\t\t") +
+                        str(budget['limit']) + "\n")
+        limit_string += (colored.green("Remaining:\t") +
+                         str(budget['remaining']) + "\n")
+        limit_string += colored.green("Reset:\t\t") + reset
+        return limit_string
+    else:
+        # Format the error string message
+        return __format_error(result.data)
+
+
+def format_cache(result):
+    """ Formats the output of the 'cache' action.
+
+    :param result: Result instance
+    """
+
+    if result.success:
+        stats = result.data
+        cache_string = (colored.green("Entries:\t") +
+                        str(stats['entries']) + "\n")
+        cache_string += (colored.green("Size:\t\t") + "%s / %s bytes\n" %
+                         (stats['size'], stats['max_size']))
+        cache_string += (colored.green("Hits:\t\t") +
+                         str(stats['total_hits']) + "\n")
+        cache_string += (colored.green("Misses:\t\t") +
+                         str(stats['total_misses']) + "\n")
+        cache_string += (colored.green("Evictions:\t") +
+                         str(stats['evictions']))
+        return cache_string
+    else:
+        # Format the error string message
+        return __format_error(result.data)
+
+
+def format_daemon(result):
+    """ Formats the output of the 'daemon' action.
+
+    :param result: Result instance
+    """
+
+    if result.success:
+        status = result.data
+        if not isinstance(status, dict):
+            # The result is just a string informing the success
+            return status
+        started = time.strftime("%Y-%m-%d %H:%M:%S",
+                                time.localtime(status['started']))
+        daemon_string = (colored.green("Pid:\t\t") +
+                         str(status['pid']) + "\n")
+        daemon_string += (colored.green("Socket:\t\t") +
+                          status['socket'] + "\n")
+        daemon_string += (colored.green("Started:\t") + started + "\n")
+        daemon_string += (colored.green("Requests:\t") +
+                          str(status['requests']))
+        return daemon_string
+    else:
+        # Format the error string message
+        return __format_error(result.data)
+
+
+def format_journal(result):
+    """ Formats the output of the 'journal' action.
+
+    :param result: Result instance
+    """
+
+    if isinstance(result, utils.BatchResult):
+        # The queued changes have been sent
+        journal_string = __format_batch(result) + "\n"
+        journal_string += colored.cyan(literals.JOURNAL_SUMMARY %
+                                       (result.queued, result.requests))
+        if result.dropped:
+            journal_string += "\n" + colored.red(literals.JOURNAL_DROPPED %
+                                                 (result.dropped))
+        if result.kept:
+            journal_string += "\n" + colored.red(literals.JOURNAL_KEPT %
+                                                 (result.kept))
+        return journal_string
+    if result.success:
+        if not isinstance(result.data, list):
+            # The result is just a string informing the success
+            return result.data
+        journal_string = ""
+        for mutation in result.data:
+            queued_at = time.strftime("%Y-%m-%d %H:%M:%S",
+                                      time.localtime(mutation.queued_at))
+            journal_string += (colored.green(queued_at + "\t") +
+                               journal.describe(mutation) + "\n")
+        journal_string += colored.cyan(literals.JOURNAL_SUMMARY %
+                                       (len(result.data), result.requests))
+        return journal_string
+    else:
+        # Format the error string message
+        return __format_error(result.data)
+
+
+def format_search(result):
+    """ Formats the output of the 'search' action.
+
+    Returns a generator of lines, one per matching line.
+
+    :param result: Result instance
+    """
+
+    if result.success:
+        if not result.data:
+            return colored.yellow(literals.SEARCH_NO_MATCHES)
+        return __iter_matches(result.data)
+    else:
+        # Format the error string message
+        return __format_error(result.data)
+
+
+def __iter_matches(matches):
+    """ Yields a line per :class: `Match <Match>`. """
+    for match in matches:
+        location = match.filename or "(description)"
+        if match.line:
+            location += ":%d" % match.line
+        yield u"".join((unicode(colored.green(match.gist_id + " ")),
+                        unicode(colored.cyan(location + ": ")),
+                        match.text.strip(), "\n"))
+
+
 def __format_gist(gist):
     """ Formats the output for a Gist metadata object.
 
@@ -187,13 +339,13 @@ def __format_gist(gist):
     public_title = unicode(colored.green('Private:\t'))
     file_title = unicode(colored.green('Files:\t\t'))
 
-    # Calculate the number of columns of the current terminal window
-    rows, columns = os.popen('stty size', 'r').read().split()
+    # Get the number of columns of the current terminal window
+    rows, columns = utils.terminal_size()
 
     # Prepare the Header
-    gists_string = colored.cyan('-' * int(columns)) + "\n"
+    gists_string = colored.cyan('-' * columns) + "\n"
     gists_string += colored.cyan("Gist [" + gist.identifier + "]") + '\n'
-    gists_string += colored.cyan('-' * int(columns)) + "\n"
+    gists_string += colored.cyan('-' * columns) + "\n"
 
     # Format Gist data
     gists_string += colored.green('Description:\t')
@@ -207,11 +359,71 @@ def __format_gist(gist):
     gists_string += file_title + colored.red(stringfiles) + '\n'
 
     # Prepare the Footer
-    gists_string += colored.cyan('-' * int(columns)) + "\n"
+    gists_string += colored.cyan('-' * columns) + "\n"
 
     return gists_string
 
 
+def __iter_list(list_of_gists):
+    """ Yields the lines of the list of gists.
+
+    :param list_of_gists: iterable of :class: `Gist <Gist>` instances.
+    """
+    # Get the number of columns of the current terminal window
+    rows, columns = utils.terminal_size()
+
+    # Set the header
+    separator = unicode(colored.cyan('-' * columns)) + "\n"
+    yield separator
+    yield unicode(colored.cyan("List of gists\n"))
+    yield separator
+
+    # Set the contents for each Gist listed
+    for gist in list_of_gists:
+        description = "(no desc)"
+        if gist.description and gist.description != "":
+            description = gist.description
+        gist_names = [gistfile.filename for
+                      gistfile in gist.files]
+        stringfiles = " [" + ", ".join(gist_names) + "]"
+        private = ""
+        if not gist.public:
+            private = " (Private Gist) "
+        yield u"".join((unicode(colored.green(gist.identifier + ": ")),
+                        description, unicode(colored.red(stringfiles)),
+                        private, "\n"))
+
+    # Set the footer
+    yield separator
+
+
+def __format_batch(result):
+    """ Formats the outcome of each item of a batch and a summary.
+
+    :param result: :class: `BatchResult <BatchResult>` instance.
+    """
+    batch_string = ""
+    for item, outcome in result.data:
+        if isinstance(outcome.data, model.Gist):
+            # A new gist has been created (forked, for instance)
+            batch_string += (colored.green(item + ": ") +
+                             outcome.data.html_url + "\n")
+        elif outcome.success:
+            batch_string += colored.green(item + ": ") + outcome.data + "\n"
+        else:
+            batch_string += (colored.red(item + ": ") +
+                             __format_error(outcome.data) + "\n")
+    succeeded = len([item for item, outcome in result.data
+                     if outcome.success])
+    summary = literals.BATCH_SUMMARY % (succeeded, len(result.data),
+                                        result.elapsed)
+    if result.success:
+        batch_string += colored.cyan(summary)
+    else:
+        batch_string += colored.red(summary)
+    return batch_string
+
+
 def __format_error(data):
     """ Print the string output error. """
     return colored.red("Error: ") + data
@@ -223,13 +435,13 @@ def __format_file(file_gist):
     :param gist: :class: `GistFile <GistFile>` instance.
     """
 
-    # Calculate the number of columns of the current terminal window
-    rows, columns = os.popen('stty size', 'r').read().split()
+    # Get the number of columns of the current terminal window
+    rows, columns = utils.terminal_size()
 
     # Prepare the Header
-    gist_string = colored.cyan('-' * int(columns)) + "\n"
+    gist_string = colored.cyan('-' * columns) + "\n"
     gist_string += colored.cyan("File [" + file_gist.filename + "]\n")
-    gist_string += colored.cyan('-' * int(columns)) + "\n"
+    gist_string += colored.cyan('-' * columns) + "\n"
 
     # Format Gist data
     gist_string += (colored.green("Language:") + " " +
@@ -242,6 +454,6 @@ def __format_file(file_gist):
                     + file_gist.content + "\n\n")
 
     # Prepare the Footer
-    gist_string += colored.cyan('-' * int(columns)) + "\n"
+    gist_string += colored.cyan('-' * columns) + "\n"
 
     return gist_string
@@ -30,63 +30,218 @@ and coordinates the 'handlers'->'actions'->'formatters' execution workflow
 """
 
 import argparse
-from actions import (list_gists, show, get, post, delete, update, authorize,
-                     fork, star, unstar)
-from handlers import (handle_list, handle_show, handle_update,
-                      handle_authorize, handle_get, handle_post, handle_delete,
-                      handle_fork, handle_star)
-from formatters import (format_list, format_post, format_update,
-                        format_get, format_show, format_delete,
-                        format_authorize, format_star)
+import sys
+import time
+import types
+from lazy import lazy_import
 from version import VERSION
 
+# Imported when the first command is run, after the arguments are parsed
+profiling = lazy_import('profiling', globals())
+
 
 USER_MSG = ("github username. Use this user instead of the defined one in "
             "the configuration file. If action demands authentication, a "
             "password request will be prompt")
 GIST_ID_MSG = ("identifier of the Gist. Execute 'gists list' to know Gists "
                "identifiers")
+GIST_IDS_MSG = ("identifiers of the Gists. Use '-' to read them from the "
+                "standard input")
+JOBS_MSG = ("maximum number of Gists processed concurrently (10 by "
+            "default)")
+
+# Formats of the '--output' argument (see 'renderers.RENDERERS')
+OUTPUT_FORMATS = ('csv', 'jsonl', 'tsv')
 
 
 def run(*args, **kwargs):
 
-    # Initialize argument's parser
-    description = 'Manage Github gists from CLI'
-    parser = argparse.ArgumentParser(description=description,
-                                     epilog="Happy Gisting!")
+    # Time the command started, for '--profile'
+    started = time.time()
 
-    # Define subparsers to handle each action
-    subparsers = parser.add_subparsers(help="Available commands.")
+    # Parse the arguments
+    argv = sys.argv[1:]
+    args = parse_args(argv)
+
+    profiler = None
+    if args.profile or args.profile_dump or args.profile_trace:
+        profiler = profiling.start(started, args.profile_dump)
+        profiler.add_stage('parse', started)
+
+    # Run the command in the daemon, if there is one listening and the
+    # command does not need the terminal to ask something
+    if __forwardable(args):
+        from daemon import forward
+        status = forward(argv)
+        if status is not None:
+            sys.exit(status)
+
+    try:
+        execute(args)
+    finally:
+        if profiler is not None:
+            profiler.finish(args.profile_trace)
+
+
+def parse_args(argv, parser_class=argparse.ArgumentParser):
+    """ Returns the parsed command line arguments.
+
+    :param argv: the command line arguments, without the program name
+    :param parser_class: class of the parsers. 'argparse.ArgumentParser'
+        exits on errors.
+    """
+    parser = __build_parser(parser_class)
+    __add_subparsers(parser, __command_name(parser, argv))
+    return parser.parse_args(argv)
 
-    # Add the subparsers
-    __add_list_parser(subparsers)
-    __add_show_parser(subparsers)
-    __add_get_parser(subparsers)
-    __add_create_parser(subparsers)
-    __add_update_parser(subparsers)
-    __add_delete_parser(subparsers)
-    __add_authorize_parser(subparsers)
-    __add_version_parser(subparsers)
-    __add_fork_parser(subparsers)
-    __add_star_parser(subparsers)
-    __add_unstar_parser(subparsers)
 
-    # Parse the arguments
-    args = parser.parse_args()
+def build_parser(command=None, parser_class=argparse.ArgumentParser):
+    """ Returns the parser of the arguments and its subparsers action.
+
+    :param command: name of the command to parse. The subparsers of all
+        the commands are added if None.
+    :param parser_class: class of the parsers
+    """
+    parser = __build_parser(parser_class)
+    return parser, __add_subparsers(parser, command)
+
+
+def execute(args):
+    """ Runs the command of the parsed arguments and prints its output.
+
+    :param args: the arguments returned by 'parse_args'
+    """
 
     # Calling the handle_args function defined, parsing the args and return
     # and object with the needed values to execute the function
-    parameters = args.handle_args(args)
+    # The functions are named as 'module.function', and their modules are
+    # imported here, so each command only imports the modules it uses.
+    # Each step is a stage of '--profile'.
+    with profiling.stage('handle'):
+        parameters = load(args.handle_args)(args)
 
     # Passing the 'parameters' object as array of parameters
-    result = args.func(*parameters)
+    with profiling.stage('action'):
+        result = load(args.func)(*parameters)
 
     # Parsing the 'result' object to be output formatted.
     # (that must be a single object)
-    result_formatted = args.formatter(result)
+    with profiling.stage('format'):
+        result_formatted = format_result(args, result)
 
-    # Print the formatted output
-    print result_formatted
+    # Print the formatted output. Generators are written as their lines
+    # are produced, so the lazy work of the action is timed here.
+    with profiling.stage('write'):
+        if isinstance(result_formatted, types.GeneratorType):
+            load('utils.OutputWriter')().write_all(result_formatted)
+        else:
+            print result_formatted
+
+
+def format_result(args, result):
+    """ Returns the output of a command: the records of the '--output'
+    format, or the text of its formatter.
+
+    :param args: the arguments returned by 'parse_args'
+    :param result: the :class: `Result <Result>` of its action
+    """
+    if args.output:
+        return load('renderers.RENDERERS')[args.output](result)
+    return load(args.formatter)(result)
+
+
+def load(name):
+    """ Returns the function (or any attribute) 'module.name', importing
+    its module. Other values, like lambdas, are returned as they are. """
+    if not isinstance(name, basestring):
+        return name
+    module_name, attribute = name.rsplit('.', 1)
+    module = __import__(module_name, globals(), {}, [attribute])
+    return getattr(module, attribute)
+
+
+def __forwardable(args):
+    """ Whenever the command can run in the daemon: it can not prompt for
+    a password or a confirmation, nor read the standard input. Profiled
+    commands run in this process. """
+    return not (args.no_daemon or getattr(args, 'local', False) or
+                args.profile or args.profile_dump or args.profile_trace or
+                getattr(args, 'user', None) or
+                getattr(args, 'gist_ids', None) == ['-'] or
+                (args.func == 'actions.delete_gists' and not args.yes))
+
+
+def __build_parser(parser_class):
+    """ Returns the parser of the global arguments. """
+
+    # Initialize argument's parser
+    description = 'Manage Github gists from CLI'
+    parser = parser_class(description=description, epilog="Happy Gisting!")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="""do not revalidate the responses against the
+                        local cache""")
+    parser.add_argument("--retries", type=int, help="""times a request is sent
+                        again after a transient failure (3 by default)""")
+    parser.add_argument("--timeout", type=float, help="""seconds to wait for
+                        each response of the API (30 by default)""")
+    parser.add_argument("--deadline", type=float, help="""maximum seconds the
+                        whole command can take""")
+    parser.add_argument("--output", choices=OUTPUT_FORMATS,
+                        help="""machine-readable output: a record per line
+                        as JSON, tab separated or comma separated values""")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="""run the command in this process, even if a
+                        'gists daemon' is running""")
+    parser.add_argument("--offline", action="store_true",
+                        help="""do not call Github: read the gists from the
+                        local cache and queue the changes until 'gists
+                        journal replay'""")
+    parser.add_argument("--profile", action="store_true",
+                        help="""write the wall and CPU time of each stage of
+                        the command and each HTTP call to the standard
+                        error""")
+    parser.add_argument("--profile-dump", metavar="FILE", help="""like
+                        '--profile', and save the 'cProfile' statistics of
+                        the command in FILE""")
+    parser.add_argument("--profile-trace", metavar="FILE", help="""like
+                        '--profile', and save the stages and the HTTP calls
+                        in FILE as a Chrome trace (JSON)""")
+    return parser
+
+
+def __add_subparsers(parser, command):
+    """ Adds the subparser of the command and returns the subparsers
+    action. All of them are added to print the help, or if the command is
+    unknown. """
+
+    # Define subparsers to handle each action
+    subparsers = parser.add_subparsers(help="Available commands.")
+
+    # Add the subparser of the requested command
+    add_parser = dict(COMMANDS).get(command)
+    if add_parser is not None:
+        add_parser(subparsers)
+    else:
+        for name, add_parser in COMMANDS:
+            add_parser(subparsers)
+    return subparsers
+
+
+def __command_name(parser, argv):
+    """ Returns the first positional argument, the name of the command.
+
+    :param parser: the parser with the global arguments
+    :param argv: the command line arguments
+    """
+    arguments = iter(argv)
+    for argument in arguments:
+        if not argument.startswith('-'):
+            return argument
+        action = parser._option_string_actions.get(argument)
+        if action is not None and action.nargs != 0:
+            # Skip the value of the argument
+            next(arguments, None)
+    return None
 
 
 def __add_list_parser(subparsers):
@@ -104,8 +259,26 @@ def __add_list_parser(subparsers):
                         action="store_true")
     group1.add_argument("-s", "--starred", help="""return ONLY the starred
                         gists. Needs authentication""", action="store_true")
-    parser_list.set_defaults(handle_args=handle_list,
-                             func=list_gists, formatter=format_list)
+    parser_list.add_argument("--per_page", type=int, help="""number of gists
+                             requested on each page""")
+    parser_list.add_argument("--prefetch", action="store_true",
+                             help="""request the next page while the current
+                             one is printed""")
+    parser_list.add_argument("--since", help="""only the gists updated after
+                             this ISO 8601 date (YYYY-MM-DDTHH:MM:SSZ)""")
+    parser_list.add_argument("--cached", action="store_true",
+                             help="""read the gists from the local index,
+                             which is refreshed in background""")
+    parser_list.add_argument("--language", help="""only the gists with a file
+                             in this language. Needs '--cached'""")
+    parser_list.add_argument("--filename", help="""only the gists with a file
+                             that matches this pattern. Needs '--cached'""")
+    parser_list.add_argument("--visibility", choices=('public', 'private'),
+                             help="""only the public or private gists. Needs
+                             '--cached'""")
+    parser_list.set_defaults(handle_args='handlers.handle_list',
+                             func='actions.list_gists',
+                             formatter='formatters.format_list')
 
 
 def __add_show_parser(subparsers):
@@ -121,8 +294,9 @@ def __add_show_parser(subparsers):
                                         """)
     parser_show.add_argument("gist_id", help=GIST_ID_MSG)
     parser_show.add_argument("-f", "--filename", help="gist file to show")
-    parser_show.set_defaults(handle_args=handle_show, func=show,
-                             formatter=format_show)
+    parser_show.set_defaults(handle_args='handlers.handle_show',
+                             func='actions.show',
+                             formatter='formatters.format_show')
 
 
 def __add_get_parser(subparsers):
@@ -137,11 +311,18 @@ def __add_get_parser(subparsers):
                                        file, argument '-f' (--filename) is not
                                        needed""")
     parser_get.add_argument("gist_id", help=GIST_ID_MSG)
-    parser_get.add_argument("-f", "--filename", help="file to download")
+    parser_get.add_argument("-f", "--filename", help="""file to download. If
+                            it is a glob pattern (like '*.py'), all the
+                            matching files are downloaded""")
+    parser_get.add_argument("-a", "--all", action="store_true",
+                            help="download all the files of the gist")
     parser_get.add_argument("-o", "--output_dir", help="destination directory",
                             default=".")
-    parser_get.set_defaults(handle_args=handle_get, func=get,
-                            formatter=format_get)
+    parser_get.add_argument("-j", "--jobs", type=int, help="""maximum number
+                            of concurrent downloads (10 by default)""")
+    parser_get.set_defaults(handle_args='handlers.handle_get',
+                            func='actions.get',
+                            formatter='formatters.format_get')
 
 
 def __add_create_parser(subparsers):
@@ -163,8 +344,9 @@ def __add_create_parser(subparsers):
                              the source files are""")
     parser_post.add_argument("-d", "--description", help="""description for
                              the Gist to create""")
-    parser_post.set_defaults(handle_args=handle_post, func=post,
-                             formatter=format_post)
+    parser_post.set_defaults(handle_args='handlers.handle_post',
+                             func='actions.post',
+                             formatter='formatters.format_post')
 
 
 def __add_update_parser(subparsers):
@@ -196,8 +378,9 @@ def __add_update_parser(subparsers):
     group2 = parser_update.add_argument_group('metadata options',
                                               "update Gist metadata")
     group2.add_argument("-d", "--description", help="update Gist description")
-    parser_update.set_defaults(handle_args=handle_update, func=update,
-                               formatter=format_update)
+    parser_update.set_defaults(handle_args='handlers.handle_update',
+                               func='actions.update',
+                               formatter='formatters.format_update')
 
 
 def __add_delete_parser(subparsers):
@@ -207,12 +390,19 @@ def __add_delete_parser(subparsers):
     """
 
     # Add the subparser to handle the 'delete' action
-    parser_delete = subparsers.add_parser("delete", help="""delete a Gist.
-                                          Needs authentication""")
-    parser_delete.add_argument("gist_id", help=GIST_ID_MSG)
+    parser_delete = subparsers.add_parser("delete", help="""delete one or
+                                          several Gists. Needs
+                                          authentication""")
+    parser_delete.add_argument("gist_ids", nargs='+', help=GIST_IDS_MSG)
     parser_delete.add_argument("-u", "--user", help=USER_MSG)
-    parser_delete.set_defaults(handle_args=handle_delete, func=delete,
-                               formatter=format_delete)
+    parser_delete.add_argument("-j", "--jobs", type=int, help=JOBS_MSG)
+    parser_delete.add_argument("-y", "--yes", action="store_true",
+                               help="""do not ask for confirmation. Needed
+                               when the identifiers are read from the
+                               standard input""")
+    parser_delete.set_defaults(handle_args='handlers.handle_delete',
+                               func='actions.delete_gists',
+                               formatter='formatters.format_delete')
 
 
 def __add_authorize_parser(subparsers):
@@ -227,8 +417,9 @@ def __add_authorize_parser(subparsers):
     parser_authorize.add_argument("-u", "--user", help="""your github user
                                   . Needed to generate the auth token. """,
                                   required=True)
-    parser_authorize.set_defaults(handle_args=handle_authorize, func=authorize,
-                                  formatter=format_authorize)
+    parser_authorize.set_defaults(handle_args='handlers.handle_authorize',
+                                  func='actions.authorize',
+                                  formatter='formatters.format_authorize')
 
 
 def __add_version_parser(subparsers):
@@ -239,9 +430,9 @@ def __add_version_parser(subparsers):
 
     parser_version = subparsers.add_parser("version", help="""print the version
                                            of the release""")
-    parser_version.set_defaults(handle_args=lambda x: (None,),
-                                func=lambda x: None,
-                                formatter=lambda x: VERSION)
+    parser_version.set_defaults(handle_args=lambda x: (True, VERSION),
+                                func='utils.build_result',
+                                formatter=lambda x: x.data)
 
 
 def __add_fork_parser(subparsers):
@@ -252,10 +443,12 @@ def __add_fork_parser(subparsers):
 
     parser_fork = subparsers.add_parser("fork", help="""fork another users'
                                         Gists""")
-    parser_fork.add_argument("gist_id", help=GIST_ID_MSG)
+    parser_fork.add_argument("gist_ids", nargs='+', help=GIST_IDS_MSG)
     parser_fork.add_argument("-u", "--user", help=USER_MSG)
-    parser_fork.set_defaults(handle_args=handle_fork, func=fork,
-                             formatter=format_post)
+    parser_fork.add_argument("-j", "--jobs", type=int, help=JOBS_MSG)
+    parser_fork.set_defaults(handle_args='handlers.handle_fork',
+                             func='actions.fork_gists',
+                             formatter='formatters.format_post')
 
 
 def __add_star_parser(subparsers):
@@ -265,10 +458,12 @@ def __add_star_parser(subparsers):
     """
 
     parser_star = subparsers.add_parser("star", help="star a Gist")
-    parser_star.add_argument("gist_id", help=GIST_ID_MSG)
+    parser_star.add_argument("gist_ids", nargs='+', help=GIST_IDS_MSG)
     parser_star.add_argument("-u", "--user", help=USER_MSG)
-    parser_star.set_defaults(handle_args=handle_star, func=star,
-                             formatter=format_star)
+    parser_star.add_argument("-j", "--jobs", type=int, help=JOBS_MSG)
+    parser_star.set_defaults(handle_args='handlers.handle_star',
+                             func='actions.star_gists',
+                             formatter='formatters.format_star')
 
 
 def __add_unstar_parser(subparsers):
@@ -278,7 +473,186 @@ def __add_unstar_parser(subparsers):
     """
 
     parser_unstar = subparsers.add_parser("unstar", help="unstar a Gist")
-    parser_unstar.add_argument("gist_id", help=GIST_ID_MSG)
+    parser_unstar.add_argument("gist_ids", nargs='+', help=GIST_IDS_MSG)
     parser_unstar.add_argument("-u", "--user", help=USER_MSG)
-    parser_unstar.set_defaults(handle_args=handle_star, func=unstar,
-                               formatter=format_star)
+    parser_unstar.add_argument("-j", "--jobs", type=int, help=JOBS_MSG)
+    parser_unstar.set_defaults(handle_args='handlers.handle_star',
+                               func='actions.unstar_gists',
+                               formatter='formatters.format_star')
+
+
+def __add_cache_parser(subparsers):
+    """ Define the subparser to handle 'cache' functionallity.
+
+    :param subparsers: the subparser entity
+    """
+
+    parser_cache = subparsers.add_parser("cache", help="""show the statistics
+                                         of the local cache of responses""")
+    parser_cache.add_argument("--clear", action="store_true",
+                              help="remove all the cached responses")
+    parser_cache.set_defaults(handle_args='handlers.handle_cache',
+                              func='actions.cache',
+                              formatter='formatters.format_cache')
+
+
+def __add_ratelimit_parser(subparsers):
+    """ Define the subparser to handle 'ratelimit' functionallity.
+
+    :param subparsers: the subparser entity
+    """
+
+    parser_ratelimit = subparsers.add_parser("ratelimit", help="""show the
+                                             remaining requests to the
+                                             GitHub API""")
+    parser_ratelimit.add_argument("-u", "--user", help=USER_MSG)
+    parser_ratelimit.set_defaults(handle_args='handlers.handle_ratelimit',
+                                  func='actions.ratelimit',
+                                  formatter='formatters.format_ratelimit')
+
+
+def __add_sync_parser(subparsers):
+    """ Define the subparser to handle 'sync' functionallity.
+
+    :param subparsers: the subparser entity
+    """
+
+    parser_sync = subparsers.add_parser("sync", help="""mirror the gists of a
+                                        user in a local directory, downloading
+                                        only what has changed since the last
+                                        synchronization""")
+    parser_sync.add_argument("-u", "--user", help=USER_MSG)
+    parser_sync.add_argument("-p", "--private", help="""mirror the private
+                             gists besides the public ones. Needs
+                             authentication""", action="store_true")
+    parser_sync.add_argument("-o", "--output_dir", help="""directory of the
+                             mirror. Current directory by default""",
+                             default=".")
+    parser_sync.add_argument("--no-prune", action="store_true",
+                             help="""keep the local copies of the gists deleted
+                             in Github""")
+    parser_sync.add_argument("-j", "--jobs", type=int, help="""maximum number
+                             of concurrent downloads (10 by default)""")
+    parser_sync.set_defaults(handle_args='handlers.handle_sync',
+                             func='actions.sync',
+                             formatter='formatters.format_sync')
+
+
+def __add_search_parser(subparsers):
+    """ Define the subparser to handle the 'search' functionality.
+
+    :param subparsers: the subparser entity
+    """
+
+    parser_search = subparsers.add_parser("search", help="""search a text in
+                                          the descriptions, file names and
+                                          contents of a user's Gists""")
+    parser_search.add_argument("pattern", help="""text to search, or regular
+                               expression with '-e'""")
+    parser_search.add_argument("-u", "--user", help=USER_MSG)
+    parser_search.add_argument("-p", "--private", help="""index the private
+                               gists besides the public ones. Needs
+                               authentication""", action="store_true")
+    parser_search.add_argument("-e", "--regex", action="store_true",
+                               help="the pattern is a regular expression")
+    parser_search.add_argument("-i", "--ignore-case", action="store_true",
+                               help="ignore the case of the letters")
+    parser_search.add_argument("--no-refresh", action="store_true",
+                               help="""search the local index without
+                               retrieving the updated gists""")
+    parser_search.add_argument("-j", "--jobs", type=int, help=JOBS_MSG)
+    parser_search.set_defaults(handle_args='handlers.handle_search',
+                               func='actions.search',
+                               formatter='formatters.format_search')
+
+
+def __add_daemon_parser(subparsers):
+    """ Define the subparser to handle 'daemon' functionallity.
+
+    :param subparsers: the subparser entity
+    """
+
+    parser_daemon = subparsers.add_parser("daemon", help="""run the commands
+                                          in a background process that keeps
+                                          the connections and the caches
+                                          warm""")
+    parser_daemon.add_argument("command", nargs="?", default="status",
+                               choices=("start", "stop", "status"),
+                               help="""start or stop the daemon, or show
+                               its status (the default)""")
+    parser_daemon.add_argument("--foreground", action="store_true",
+                               help="""do not detach the daemon from the
+                               terminal""")
+    parser_daemon.add_argument("--idle-timeout", type=int, help="""minutes
+                               without commands after which the daemon
+                               exits (30 by default)""")
+    parser_daemon.set_defaults(handle_args='handlers.handle_daemon',
+                               func='actions.daemon',
+                               formatter='formatters.format_daemon',
+                               local=True)
+
+
+def __add_batch_parser(subparsers):
+    """ Define the subparser to handle 'batch' functionallity.
+
+    :param subparsers: the subparser entity
+    """
+
+    parser_batch = subparsers.add_parser("batch", help="""run the commands of
+                                         a file, one per line""")
+    parser_batch.add_argument("file", nargs="?", default="-", help="""file
+                              with a command per line, as the arguments of
+                              'gists' or as a JSON list or object. Read from
+                              the standard input if '-' (the default)""")
+    parser_batch.add_argument("-j", "--jobs", type=int, help="""maximum number
+                              of lines run concurrently (1 by default). The
+                              lines of the same Gist run in order""")
+    parser_batch.set_defaults(handle_args='handlers.handle_batch',
+                              func='batch.run_script',
+                              formatter='batch.format_script',
+                              local=True)
+
+
+def __add_journal_parser(subparsers):
+    """ Define the subparser to handle 'journal' functionallity.
+
+    :param subparsers: the subparser entity
+    """
+
+    parser_journal = subparsers.add_parser("journal", help="""show, send or
+                                           drop the changes queued with
+                                           '--offline'""")
+    parser_journal.add_argument("command", nargs="?", default="show",
+                                choices=("show", "replay", "clear"),
+                                help="""show the queued changes (the
+                                default), send them to Github or drop
+                                them""")
+    parser_journal.add_argument("-u", "--user", help=USER_MSG)
+    parser_journal.add_argument("-y", "--yes", action="store_true",
+                                help="""do not ask for confirmation before
+                                dropping the changes""")
+    parser_journal.set_defaults(handle_args='handlers.handle_journal',
+                                func='actions.journal',
+                                formatter='formatters.format_journal',
+                                local=True)
+
+
+# Function that adds the subparser of each command
+COMMANDS = (('list', __add_list_parser),
+            ('show', __add_show_parser),
+            ('get', __add_get_parser),
+            ('create', __add_create_parser),
+            ('update', __add_update_parser),
+            ('delete', __add_delete_parser),
+            ('authorize', __add_authorize_parser),
+            ('version', __add_version_parser),
+            ('fork', __add_fork_parser),
+            ('star', __add_star_parser),
+            ('unstar', __add_unstar_parser),
+            ('cache', __add_cache_parser),
+            ('ratelimit', __add_ratelimit_parser),
+            ('sync', __add_sync_parser),
+            ('search', __add_search_parser),
+            ('daemon', __add_daemon_parser),
+            ('batch', __add_batch_parser),
+            ('journal', __add_journal_parser))
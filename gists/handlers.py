@@ -29,14 +29,46 @@ data for the functions in 'actions' module.
 
 """
 
+import os
 import sys
 import utils
 import literals
 import getpass
+from lazy import lazy_import
+from retry import RetryPolicy
 
+# Modules of the stores and the profiler, imported when they are used
+cache = lazy_import('cache', globals())
+daemon = lazy_import('daemon', globals())
+index = lazy_import('index', globals())
+journal = lazy_import('journal', globals())
+profiling = lazy_import('profiling', globals())
+search = lazy_import('search', globals())
 
-# Load the configuration instance once the module is imported
-config = utils.GistsConfigurer()
+
+# Configuration instance, loaded the first time it is needed, and the
+# modification time of its file when it was loaded
+__config = None
+__config_mtime = None
+
+# Facades, caches and indexes built so far. A long-running process (the
+# 'daemon') reuses them, with their connections, between commands.
+__facades = {}
+__stores = {}
+
+
+def get_config():
+    """ Return the configuration read from '~/.gistsrc'.
+
+    It is read again if the file has been modified since it was loaded.
+    """
+    global __config, __config_mtime
+    mtime = __modification_time(os.path.expanduser('~/.gistsrc'))
+    if __config is None or mtime != __config_mtime:
+        with profiling.stage('config'):
+            __config = utils.GistsConfigurer()
+        __config_mtime = mtime
+    return __config
 
 
 def handle_list(args):
@@ -47,7 +79,7 @@ def handle_list(args):
     if args.user:
         username = args.user
     else:
-        username = config.getConfigUser()
+        username = get_config().getConfigUser()
     if not username:
         print literals.USER_NOT_FOUND
         sys.exit()
@@ -61,8 +93,26 @@ def handle_list(args):
     else:
         credential = None
 
-    return (username, utils.GithubFacade(args.user, credential),
-            args.starred)
+    # With '--cached', the gists are read from the local index, filtered by
+    # the arguments. Only the public ones unless '--private' is set.
+    # While offline, the gists are always read from the index
+    query = None
+    if args.cached or getattr(args, 'offline', False):
+        if args.starred:
+            if args.cached:
+                print literals.CACHED_STARRED
+            else:
+                print literals.OFFLINE_STARRED
+            sys.exit()
+        public = {'public': True, 'private': False}.get(args.visibility)
+        if public is None and not args.private:
+            public = True
+        query = {'language': args.language, 'public': public,
+                 'filename': args.filename, 'since': args.since}
+
+    return (username, build_facade(args, args.user, credential),
+            args.starred, args.per_page, args.prefetch, args.since,
+            get_index(), query)
 
 
 def handle_update(args):
@@ -72,7 +122,8 @@ def handle_update(args):
 
     return (args.gist_id, args.description, args.filenames,
             args.input_dir, args.new, args.remove,
-            utils.GithubFacade(args.user, get_credentials(args)))
+            build_facade(args, args.user, get_credentials(args)),
+            __offline_journal(args))
 
 
 def handle_post(args):
@@ -88,39 +139,257 @@ def handle_post(args):
         args.input_dir = "./"
 
     return (public, args.filenames, args.input_dir, args.description,
-            utils.GithubFacade(args.user, get_credentials(args)))
+            build_facade(args, args.user, get_credentials(args)),
+            __offline_journal(args))
 
 
 def handle_show(args):
     """ Handle the arguments to call the 'show' gists functionality. """
-    return args.gist_id, args.filename, utils.GithubFacade()
+    return args.gist_id, args.filename, build_facade(args), get_index()
 
 
 def handle_get(args):
     """ Handle the arguments to call the 'get' gists functionality. """
-    return args.gist_id, args.filename, args.output_dir, utils.GithubFacade()
+    return (args.gist_id, args.filename, args.output_dir, build_facade(args),
+            args.all, args.jobs)
 
 
 def handle_delete(args):
     """ Handle the arguments to call the 'delete' gists functionality. """
-    return args.gist_id, utils.GithubFacade(args.user, get_credentials(args))
+    return (read_gist_ids(args.gist_ids),
+            build_facade(args, args.user, get_credentials(args)), args.jobs,
+            args.yes, __offline_journal(args))
 
 
 def handle_authorize(args):
     """ Handle the arguments to call the 'authorize' gists functionality. """
     password = get_credentials(args)
-    return utils.GithubFacade(args.user, password),
+    return build_facade(args, args.user, password),
 
 
 def handle_fork(args):
     """ Handle the arguments to call the 'fork' gists functionality. """
-    return args.gist_id, utils.GithubFacade(args.user, get_credentials(args))
+    return (read_gist_ids(args.gist_ids),
+            build_facade(args, args.user, get_credentials(args)), args.jobs)
 
 
 def handle_star(args):
     """ Handle the arguments to call the 'star' and 'unstar' gists
     functionality. """
-    return args.gist_id, utils.GithubFacade(args.user, get_credentials(args))
+    return (read_gist_ids(args.gist_ids),
+            build_facade(args, args.user, get_credentials(args)), args.jobs,
+            __offline_journal(args))
+
+
+def handle_sync(args):
+    """ Handle the arguments to call the 'sync' gists functionality. """
+
+    # Get the 'user' argument if exists, otherwise take it from configuration
+    # file. If 'user' can not be loaded, raise an exception
+    if args.user:
+        username = args.user
+    else:
+        username = get_config().getConfigUser()
+    if not username:
+        print literals.USER_NOT_FOUND
+        sys.exit()
+
+    # Private gists are only listed with authentication
+    if args.private:
+        credential = get_credentials(args)
+    else:
+        credential = None
+
+    return (username, args.output_dir,
+            build_facade(args, args.user, credential), not args.no_prune,
+            args.jobs)
+
+
+def handle_search(args):
+    """ Handle the arguments to call the 'search' gists functionality. """
+
+    # Get the 'user' argument if exists, otherwise take it from configuration
+    # file. If 'user' can not be loaded, raise an exception
+    if args.user:
+        username = args.user
+    else:
+        username = get_config().getConfigUser()
+    if not username:
+        print literals.USER_NOT_FOUND
+        sys.exit()
+
+    # Private gists are only listed with authentication
+    if args.private:
+        credential = get_credentials(args)
+    else:
+        credential = None
+
+    return (username, args.pattern,
+            build_facade(args, args.user, credential), get_index(),
+            get_search_index(), args.regex, args.ignore_case,
+            not (args.no_refresh or getattr(args, 'offline', False)),
+            args.jobs)
+
+
+def handle_ratelimit(args):
+    """ Handle the arguments to call the 'ratelimit' gists functionality.
+
+    Authentication is optional: the budget of the anonymous requests is
+    returned if there are no credentials.
+    """
+    if args.user:
+        credential = get_credentials(args)
+    else:
+        credential = get_config().getConfigToken()
+    return build_facade(args, args.user, credential),
+
+
+def handle_cache(args):
+    """ Handle the arguments to call the 'cache' gists functionality. """
+    return get_response_cache(), args.clear
+
+
+def handle_batch(args):
+    """ Handle the arguments to call the 'batch' gists functionality.
+
+    The global arguments of the batch are the default ones of its lines.
+    """
+    if args.file == '-':
+        script = sys.stdin
+    else:
+        try:
+            script = open(args.file, 'r')
+        except IOError as e:
+            print literals.BATCH_FILE_ERROR % (args.file, e.strerror)
+            sys.exit()
+    defaults = dict((name, getattr(args, name)) for name in
+                    ('no_cache', 'retries', 'timeout', 'offline'))
+    if args.deadline:
+        # A single deadline, started now, for all the lines of the batch
+        defaults['deadline'] = utils.Deadline(args.deadline)
+    return script, args.jobs, defaults
+
+
+def handle_daemon(args):
+    """ Handle the arguments to call the 'daemon' gists functionality. """
+    idle_timeout = None
+    if args.idle_timeout:
+        idle_timeout = args.idle_timeout * 60
+    return args.command, daemon.socket_path(), args.foreground, idle_timeout
+
+
+def handle_journal(args):
+    """ Handle the arguments to call the 'journal' gists functionality. """
+    facade = None
+    if args.command == 'replay':
+        if getattr(args, 'offline', False):
+            print literals.JOURNAL_OFFLINE
+            sys.exit()
+        facade = build_facade(args, args.user, get_credentials(args))
+    return args.command, get_journal(), facade, args.yes
+
+
+def read_gist_ids(gist_ids):
+    """ Return the identifiers of the gists to process.
+
+    If the only identifier is '-', they are read from the standard input,
+    separated by blanks or new lines.
+    """
+    if gist_ids == ['-']:
+        return sys.stdin.read().split()
+    return gist_ids
+
+
+def build_facade(args, username=None, credential=None):
+    """ Build the facade that performs the calls to Github.
+
+    GET responses are revalidated against the local cache, unless the
+    '--no-cache' argument is set. The '--retries' argument sets how many
+    times the idempotent requests are sent again after a transient failure.
+    The '--timeout' argument sets the read timeout of the API calls, and
+    '--deadline' the time limit of the whole command (seconds, or the
+    :class: `Deadline <Deadline>` shared by the lines of a batch). With
+    '--offline', the facade answers from the cache and does not call Github.
+
+    :param args: the parsed arguments
+    :param username: the user to authenticate with, if any
+    :param credential: the password or the token to authenticate with
+    """
+    response_cache = None
+    if not getattr(args, 'no_cache', False):
+        response_cache = get_response_cache()
+    retry_policy = None
+    if getattr(args, 'retries', None) is not None:
+        retry_policy = RetryPolicy(retries=args.retries)
+    timeouts = None
+    if getattr(args, 'timeout', None):
+        timeouts = {utils.GithubFacade.METADATA:
+                    (min(args.timeout, 5), args.timeout)}
+    deadline = getattr(args, 'deadline', None)
+    if deadline and not isinstance(deadline, utils.Deadline):
+        deadline = utils.Deadline(deadline)
+
+    # Facades are built once per set of arguments, so their connections
+    # are reused. The deadline belongs to the current command, so each
+    # command gets its own view of the shared facade.
+    offline = getattr(args, 'offline', False)
+    key = (username, credential, response_cache is not None,
+           getattr(args, 'retries', None), getattr(args, 'timeout', None),
+           offline)
+    facade = __facades.get(key)
+    if facade is None:
+        facade = utils.GithubFacade(username, credential,
+                                    cache=response_cache,
+                                    retry_policy=retry_policy,
+                                    timeouts=timeouts, offline=offline)
+        __facades[key] = facade
+    return facade.with_deadline(deadline or None)
+
+
+def get_response_cache():
+    """ Return the cache of responses stored in '~/.gists/cache'. """
+    return __get_store(cache.ResponseCache, 'cache')
+
+
+def get_index():
+    """ Return the index of gists stored in '~/.gists/index.sqlite'. """
+    return __get_store(index.GistIndex, 'index.sqlite')
+
+
+def get_search_index():
+    """ Return the search index stored in '~/.gists/search.sqlite'. """
+    return __get_store(search.SearchIndex, 'search.sqlite')
+
+
+def get_journal():
+    """ Return the journal of the changes queued while offline, stored in
+    '~/.gists/journal'. """
+    return __get_store(journal.Journal, 'journal')
+
+
+def __offline_journal(args):
+    """ Return the journal where the changes are queued if the '--offline'
+    argument is set, None otherwise. """
+    if getattr(args, 'offline', False):
+        return get_journal()
+    return None
+
+
+def __get_store(store_class, name):
+    """ Return the instance of 'store_class' kept in '~/.gists/<name>',
+    opening it the first time it is needed. """
+    if name not in __stores:
+        __stores[name] = store_class(utils.data_path(name))
+    return __stores[name]
+
+
+def __modification_time(path):
+    """ Return the modification time of a file, None if it does not
+    exist. """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
 
 
 def get_credentials(args):
@@ -135,7 +404,7 @@ def get_credentials(args):
         credentials = getpass.getpass("Github password for user '%s': "
                                       % (args.user))
     else:
-        credentials = config.getConfigToken()
+        credentials = get_config().getConfigToken()
     if not credentials:
         print literals.CREDENTIAL_NOT_FOUND
         sys.exit()
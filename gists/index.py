@@ -0,0 +1,204 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+
+gists.index
+~~~~~~~~~~~
+
+Local index of the metadata of the gists, stored in a SQLite database. It is
+kept current by the responses of 'list' and 'show', and answers the
+'list --cached' queries without calling GitHub.
+
+"""
+
+import sqlite3
+import threading
+import model
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS gists (
+    id TEXT PRIMARY KEY,
+    owner TEXT,
+    description TEXT,
+    public INTEGER,
+    url TEXT,
+    html_url TEXT,
+    created_at TEXT,
+    updated_at TEXT);
+CREATE INDEX IF NOT EXISTS gists_owner ON gists (owner, updated_at);
+CREATE TABLE IF NOT EXISTS files (
+    gist_id TEXT,
+    filename TEXT,
+    language TEXT,
+    size INTEGER,
+    raw_url TEXT,
+    PRIMARY KEY (gist_id, filename));
+CREATE INDEX IF NOT EXISTS files_language ON files (language);
+CREATE TABLE IF NOT EXISTS refreshes (
+    owner TEXT PRIMARY KEY,
+    refreshed_at REAL);
+"""
+
+
+class GistIndex(object):
+    """ :class: `GistIndex <GistIndex>` SQLite index of gists.
+
+    A single connection is shared by the threads of the process, guarded by
+    a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def store(self, gists, owner=None):
+        """ Inserts or replaces the metadata of the gists, in a single
+        transaction.
+
+        :param gists: iterable of :class: `Gist <Gist>` instances
+        :param owner: owner of the gists. Read from each gist if None.
+        """
+        with self.lock:
+            with self.connection:
+                for gist in gists:
+                    self.__store(gist, owner)
+
+    def remove(self, gist_ids):
+        """ Removes gists from the index. """
+        with self.lock:
+            with self.connection:
+                for gist_id in gist_ids:
+                    self.connection.execute(
+                        "DELETE FROM files WHERE gist_id = ?", (gist_id,))
+                    self.connection.execute(
+                        "DELETE FROM gists WHERE id = ?", (gist_id,))
+
+    def prune(self, owner, listed_ids, public_only=False):
+        """ Removes the gists of an owner that are not in a full listing.
+
+        :param owner: owner of the listed gists
+        :param listed_ids: identifiers of all the listed gists
+        :param public_only: the listing only had the public gists, so the
+            private ones are kept.
+        """
+        sql = "SELECT id FROM gists WHERE owner = ?"
+        if public_only:
+            sql += " AND public"
+        with self.lock:
+            indexed = [row[0] for row in
+                       self.connection.execute(sql, (owner,))]
+        self.remove(set(indexed) - set(listed_ids))
+
+    def query(self, owner=None, language=None, public=None, filename=None,
+              since=None):
+        """ Returns the indexed gists that match all the filters, the last
+        updated first.
+
+        :param owner: owner of the gists
+        :param language: language of any of the files
+        :param public: True for the public gists, False for the private ones
+        :param filename: glob pattern that any of the file names matches
+        :param since: ISO 8601 timestamp. Only the gists updated after it.
+        """
+        conditions = []
+        params = []
+        if owner is not None:
+            conditions.append("owner = ?")
+            params.append(owner)
+        if public is not None:
+            conditions.append("public = ?")
+            params.append(int(public))
+        if since is not None:
+            conditions.append("updated_at >= ?")
+            params.append(since)
+        if language is not None:
+            conditions.append("id IN (SELECT gist_id FROM files "
+                              "WHERE language = ? COLLATE NOCASE)")
+            params.append(language)
+        if filename is not None:
+            conditions.append("id IN (SELECT gist_id FROM files "
+                              "WHERE filename GLOB ?)")
+            params.append(filename)
+        sql = ("SELECT id, owner, description, public, url, html_url, "
+               "created_at, updated_at, filename, language, size, raw_url "
+               "FROM gists LEFT JOIN files ON files.gist_id = gists.id")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY updated_at DESC, id"
+
+        with self.lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        gists = []
+        for row in rows:
+            if not gists or gists[-1].identifier != row[0]:
+                gists.append(model.Gist({
+                    'id': row[0], 'owner': {'login': row[1]},
+                    'description': row[2], 'public': bool(row[3]),
+                    'url': row[4], 'html_url': row[5],
+                    'created_at': row[6], 'updated_at': row[7],
+                    'files': {}}))
+            if row[8] is not None:
+                gists[-1]['files'][row[8]] = {'filename': row[8],
+                                              'language': row[9],
+                                              'size': row[10],
+                                              'raw_url': row[11]}
+        return gists
+
+    def refreshed_at(self, owner):
+        """ Returns the time (seconds since the epoch) of the last refresh
+        of the gists of an owner, None if they have never been listed. """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT refreshed_at FROM refreshes WHERE owner = ?",
+                (owner,)).fetchone()
+        return row[0] if row else None
+
+    def set_refreshed_at(self, owner, refreshed_at):
+        """ Records the time of the last refresh of the gists of an owner. """
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO refreshes VALUES (?, ?)",
+                    (owner, refreshed_at))
+
+    def close(self):
+        self.connection.close()
+
+    def __store(self, gist, owner):
+        """ Inserts or replaces a gist and its files. """
+        if owner is None:
+            owner = (gist.get('owner') or gist.get('user') or {}).get('login')
+        self.connection.execute(
+            "INSERT OR REPLACE INTO gists VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (gist.identifier, owner, gist.get('description'),
+             int(bool(gist.get('public'))), gist.get('url'),
+             gist.get('html_url'), gist.get('created_at'),
+             gist.get('updated_at')))
+        self.connection.execute("DELETE FROM files WHERE gist_id = ?",
+                                (gist.identifier,))
+        self.connection.executemany(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+            [(gist.identifier, gistfile.filename, gistfile.get('language'),
+              gistfile.get('size'), gistfile.get('raw_url'))
+             for gistfile in gist.files])
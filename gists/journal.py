@@ -0,0 +1,211 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+
+gists.journal
+~~~~~~~~~~~~~
+
+Durable queue of the changes made while offline ('--offline' argument).
+Each change is appended to the journal file as a line of JSON, and synced
+to disk before the command ends. Before they are replayed, the queued
+changes are coalesced: the successive updates of a gist are merged into a
+single one, a star and an unstar of the same gist cancel each other, and
+the changes of a gist that is deleted later are dropped.
+
+"""
+
+import json
+import os
+import threading
+import time
+import model
+
+try:
+    import fcntl
+except ImportError:
+    # Without 'fcntl', only the threads of a process are synchronized
+    fcntl = None
+
+# Kinds of changes
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+STAR = 'star'
+UNSTAR = 'unstar'
+
+
+class Journal(object):
+    """ :class: `Journal <Journal>` of the changes queued while offline,
+    stored as JSON Lines in 'path'.
+
+    Several processes may append changes at the same time: the journal is
+    locked through the '<path>.lock' file while it is written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.lock = threading.Lock()
+
+    def append(self, mutation):
+        """ Appends a change at the end of the journal.
+
+        :param mutation: the :class: `Mutation <Mutation>`. Its 'queued_at'
+            time is set if it is missing.
+        """
+        mutation.setdefault('queued_at', time.time())
+        line = json.dumps(mutation, separators=(',', ':'), sort_keys=True)
+        lock_file = self.__lock()
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                         0600)
+            try:
+                os.write(fd, line + '\n')
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        finally:
+            self.__unlock(lock_file)
+
+    def mutations(self):
+        """ Returns the queued changes, in order. """
+        lock_file = self.__lock()
+        try:
+            return self.__read()
+        finally:
+            self.__unlock(lock_file)
+
+    def replace(self, mutations, consumed):
+        """ Replaces the first changes of the journal, keeping the ones
+        appended after they were read.
+
+        :param mutations: the changes that take their place
+        :param consumed: number of changes replaced
+        """
+        lock_file = self.__lock()
+        try:
+            self.__write(list(mutations) + self.__read()[consumed:])
+        finally:
+            self.__unlock(lock_file)
+
+    def __read(self):
+        """ Reads the changes from the journal file. """
+        mutations = []
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        mutations.append(model.Mutation(json.loads(line)))
+                    except ValueError:
+                        # A line left incomplete by an interrupted write
+                        continue
+        except IOError:
+            pass
+        return mutations
+
+    def __write(self, mutations):
+        """ Writes the journal file atomically. """
+        if not mutations:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            for mutation in mutations:
+                f.write(json.dumps(mutation, separators=(',', ':'),
+                                   sort_keys=True) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp_path, self.path)
+
+    def __lock(self):
+        """ Locks the journal. Returns the open lock file, if any. """
+        self.lock.acquire()
+        if fcntl is None:
+            return None
+        lock_file = open(self.lock_path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def __unlock(self, lock_file):
+        """ Unlocks the journal. Closing the lock file releases it. """
+        if lock_file is not None:
+            lock_file.close()
+        self.lock.release()
+
+
+def coalesce(mutations):
+    """ Returns the changes to send to Github, in the order of 'mutations'.
+
+    The updates of a gist are merged into its first update, and the star
+    and unstar of a gist cancel each other (if a gist is starred twice,
+    the second star is dropped). A deletion drops the pending updates,
+    stars and unstars of the gist.
+
+    :param mutations: list of :class: `Mutation <Mutation>`
+    """
+    coalesced = []
+    # Position in 'coalesced' of the pending update and star of each gist
+    updates = {}
+    stars = {}
+    for mutation in mutations:
+        gist_id = mutation.gist_id
+        if mutation.action == UPDATE and gist_id in updates:
+            position = updates[gist_id]
+            coalesced[position] = merge(coalesced[position], mutation)
+            continue
+        if mutation.action in (STAR, UNSTAR) and gist_id in stars:
+            if coalesced[stars[gist_id]].action != mutation.action:
+                coalesced[stars.pop(gist_id)] = None
+            continue
+        if mutation.action == DELETE:
+            for pending in (updates, stars):
+                if gist_id in pending:
+                    coalesced[pending.pop(gist_id)] = None
+        if mutation.action == UPDATE:
+            updates[gist_id] = len(coalesced)
+        elif mutation.action in (STAR, UNSTAR):
+            stars[gist_id] = len(coalesced)
+        coalesced.append(mutation)
+    return [mutation for mutation in coalesced if mutation is not None]
+
+
+def merge(first, second):
+    """ Merges two updates of the same gist into a single one. The
+    description and the files of 'second' take precedence. """
+    merged = model.Mutation(first)
+    if second.description is not None:
+        merged['description'] = second.description
+    files = dict(first.files)
+    files.update(second.files)
+    merged['files'] = files
+    return merged
+
+
+def describe(mutation):
+    """ Returns a short description of a change, like 'star 2a9b1c'. """
+    if mutation.action == CREATE:
+        return "%s (%s)" % (CREATE, ", ".join(sorted(mutation.files)))
+    if mutation.action == UPDATE and mutation.files:
+        return "%s %s (%s)" % (UPDATE, mutation.gist_id,
+                               ", ".join(sorted(mutation.files)))
+    return "%s %s" % (mutation.action, mutation.gist_id)
@@ -0,0 +1,114 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+
+gists.jsonstream
+~~~~~~~~~~~~~~~~
+
+Incremental decoding of JSON arrays. The elements of the top-level array are
+decoded one by one as the chunks of the body arrive, so a list response is
+never held parsed as a whole.
+
+    >>> for gist in iter_array(response.iter_content(64 * 1024)):
+    ...     print gist['id']
+
+"""
+
+import codecs
+import json
+import re
+
+# Whitespace allowed between the JSON tokens
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# Characters that may go on a number split between chunks
+SCALAR_TAIL = re.compile(r'[0-9eE.+-]*$')
+
+
+def iter_array(chunks, skip=()):
+    """ Yield the elements of a JSON array read from chunks of bytes.
+
+    Raises 'ValueError' if the body is not a JSON array, or ends before it
+    is closed.
+
+    :param chunks: iterable of UTF-8 encoded strings
+    :param skip: keys removed from the elements that are objects, for the
+        fields the caller never reads.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = u''
+    position = 0
+    # Expected token: '[', a value or ']', a value, or ',' or ']'
+    expected = '['
+    while True:
+        position = WHITESPACE.match(buffer, position).end()
+        if position == len(buffer):
+            buffer = __read(chunks, utf8, buffer, position)
+            position = 0
+            continue
+
+        char = buffer[position]
+        if expected == '[':
+            if char != '[':
+                raise ValueError("Expecting '[' at %d" % position)
+            position += 1
+            expected = 'value or ]'
+        elif expected != 'value' and char == ']':
+            return
+        elif expected == ', or ]':
+            if char != ',':
+                raise ValueError("Expecting ',' or ']' at %d" % position)
+            position += 1
+            expected = 'value'
+        else:
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                end = None
+            if end is None or (not isinstance(element, (dict, list,
+                                                        basestring)) and
+                               SCALAR_TAIL.match(buffer, end)):
+                # The element is split between chunks. A number or literal
+                # that reaches the end of the buffer, even through
+                # characters it could not be decoded with ('2.' of '2.5'),
+                # may go on in the next chunk.
+                buffer = __read(chunks, utf8, buffer, position)
+                position = 0
+                continue
+            if isinstance(element, dict):
+                for key in skip:
+                    element.pop(key, None)
+            # Drop the decoded text, so the buffer holds a single element
+            buffer = buffer[end:]
+            position = 0
+            expected = ', or ]'
+            yield element
+
+
+def __read(chunks, utf8, buffer, position):
+    """ Returns the buffer from 'position' followed by the next chunk. """
+    for chunk in chunks:
+        if chunk:
+            return buffer[position:] + utf8.decode(chunk)
+    raise ValueError("Unterminated array")
@@ -0,0 +1,80 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+
+gists.lazy
+~~~~~~~~~~
+
+Lazy imports of the heavy modules ('requests', 'clint', 'urllib2'...), so
+the commands that do not use them start faster.
+
+    >>> requests = lazy_import('requests')
+    >>> requests.Session()    # 'requests' is imported here
+
+"""
+
+import sys
+
+
+class LazyModule(object):
+    """ :class: `LazyModule <LazyModule>` stands for a module that is
+    imported on the first access to any of its attributes. """
+
+    def __init__(self, name, globals=None):
+        self.__name = name
+        self.__globals = globals
+        self.__module = None
+
+    def __getattr__(self, attribute):
+        if self.__module is None:
+            # A non-empty 'fromlist' returns the module itself, not its
+            # top-level package
+            self.__module = __import__(self.__name, self.__globals, {},
+                                       ['__name__'])
+        return getattr(self.__module, attribute)
+
+    def __repr__(self):
+        return "<lazy module '%s'>" % self.__name
+
+
+def lazy_import(name, globals=None):
+    """ Returns the module 'name' if it is already imported, or a
+    :class: `LazyModule <LazyModule>` that imports it when it is used.
+
+    :param name: name of the module ('clint.textui.colored')
+    :param globals: the globals of the importing module. If set, a module
+        of its own package is found first, as the 'import' statement does
+        ('lazy_import('cache', globals())').
+    """
+    for candidate in __candidates(name, globals):
+        if sys.modules.get(candidate) is not None:
+            return sys.modules[candidate]
+    return LazyModule(name, globals)
+
+
+def __candidates(name, globals):
+    """ Yields the names the module may be imported with: in the package
+    of the importing module, if any, and as an absolute name. """
+    module_name = (globals or {}).get('__name__', '')
+    if '.' in module_name:
+        yield module_name.rsplit('.', 1)[0] + '.' + name
+    yield name
@@ -33,6 +33,14 @@ APP_URL = "https://github.com/jdevesa/gists"
 
 LISTS_ERROR = "Can not return the list of gists. Github reason: '%s'"
 
+LISTS_PAGE_ERROR = ("Can not return the next page of the list of gists. "
+                    "Github reason: '%s'")
+
+LIST_DECODE_ERROR = "Can not decode the list of gists: '%s'"
+
+CACHED_STARRED = ("The starred gists are not indexed. Remove the '--cached' "
+                  "argument")
+
 DOWNLOAD_OK = "File '%s' downloaded successfully!"
 
 DOWNLOAD_MORE_FILES = ("Gist has more than one file. "
@@ -43,12 +51,30 @@ FILE_NOT_FOUND = ("File not found in gist. Available values are [%s])")
 
 DOWNLOAD_ERROR = "Can not download gist file. Github reason: '%s'"
 
+DOWNLOAD_INCOMPLETE = ("Download incomplete: %s of %s bytes received. "
+                       "Run it again to resume it.")
+
+PROGRESS = "\r%s/%s done (%s/%s bytes, %s failed)"
+
+BATCH_SUMMARY = "%s/%s succeeded in %.2f seconds"
+
 SHOW_ERROR = "Can not show gist file. Github reason: '%s'"
 
 UNHANDLED_EXCEPTION = "Unhandled exception"
 
+CONNECTION_ERROR = "Can not connect to Github: '%s'"
+
+CIRCUIT_OPEN = ("Github is not responding. Requests are stopped for a while "
+                "after several consecutive failures.")
+
+HTTP_ERROR = "HTTP %s %s"
+
+DEADLINE_EXCEEDED = "Deadline of %s seconds exceeded"
+
 DELETE_CONFIRMATION = "Are you sure you want to delete gist %s [yN]"
 
+DELETE_MANY_CONFIRMATION = "Are you sure you want to delete %s gists [yN]"
+
 DELETE_OK = "Gist '%s' deleted succesfully"
 
 DELETE_NOK = "Can not delete the gist. Github reason: '%s'"
@@ -57,6 +83,8 @@ DELETE_ABORTED = "Delete aborted."
 
 UPDATE_NOK = "Can not update the gist. Github reason: '%s'"
 
+UPDATE_BYTES_SAVED = "%s bytes not sent (unchanged data)"
+
 UPDATE_RM_NF = "Can not remove a file that actually does not exist in gist. "
 
 UPDATE_NF = ("Filename not found in gist. Use the '-n' (--new) argument "
@@ -89,3 +117,78 @@ STAR_NOK = "Can not star the gist. Github reason: '%s'"
 UNSTAR_OK = "Gist '%s' unstarred succesfully"
 
 UNSTAR_NOK = "Can not unstar the gist. Github reason: '%s'"
+
+RATE_LIMIT_ERROR = "Can not get the rate limit. Github reason: '%s'"
+
+ISO_8601 = "%Y-%m-%dT%H:%M:%SZ"
+
+SYNC_UPDATED = "Gist updated (%s files downloaded)"
+
+SYNC_REMOVED = "Gist deleted in Github. Local copy removed"
+
+SYNC_UP_TO_DATE = "Local mirror is up to date"
+
+SEARCH_PATTERN_ERROR = "Invalid regular expression: '%s'"
+
+SEARCH_FETCH_ERROR = "Can not index the gist '%s': %s"
+
+SEARCH_NO_MATCHES = "No matches"
+
+DAEMON_NOT_RUNNING = "The daemon is not running"
+
+DAEMON_RUNNING = "The daemon is already running (pid %s)"
+
+DAEMON_STOPPED = "Daemon stopped (pid %s)"
+
+DAEMON_START_ERROR = "Can not start the daemon"
+
+DAEMON_LOST = "Error: The daemon exited while running the command"
+
+DAEMON_REQUEST_ERROR = "Error: The daemon can not run the command: %s"
+
+BATCH_FILE_ERROR = "Can not read the file '%s': %s"
+
+BATCH_LINE_ERROR = "Invalid command: %s"
+
+BATCH_UNKNOWN_COMMAND = "unknown command '%s'"
+
+BATCH_UNKNOWN_ARGUMENTS = "unknown arguments: %s"
+
+BATCH_INTERACTIVE = ("Commands that read the standard input or ask for "
+                     "confirmation can not run in a batch "
+                     "(use 'delete --yes')")
+
+CLIENT_PASSWORD_WITHOUT_USER = "A password needs the 'username' of its user"
+
+CLIENT_USER_NOT_FOUND = "Unknown owner of the gists: set the 'username'"
+
+OFFLINE_NOT_CACHED = "Offline, and the response of '%s' is not cached"
+
+OFFLINE_REQUEST = "Offline: can not send '%s %s'"
+
+OFFLINE_NOT_INDEXED = ("Offline, and the gists of '%s' are not indexed yet. "
+                       "List them once online")
+
+OFFLINE_STARRED = ("The starred gists are not indexed. Can not list them "
+                   "offline")
+
+JOURNAL_QUEUED = ("Queued while offline: %s. Run 'gists journal replay' to "
+                  "send it")
+
+JOURNAL_EMPTY = "There are no queued changes"
+
+JOURNAL_SUMMARY = "%s queued changes, sent as %s requests"
+
+JOURNAL_KEPT = "%s changes kept in the journal for the next replay"
+
+JOURNAL_DROPPED = "%s changes rejected by Github and dropped from the journal"
+
+JOURNAL_OFFLINE = "The journal can not be replayed with '--offline'"
+
+JOURNAL_CLEAR_CONFIRMATION = "Drop the %s queued changes? [y/N]: "
+
+JOURNAL_CLEARED = "%s queued changes dropped"
+
+JOURNAL_ABORTED = "Queued changes kept"
+
+UPDATE_OK = "Gist '%s' updated succesfully"
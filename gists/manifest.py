@@ -0,0 +1,127 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+
+gists.manifest
+~~~~~~~~~~~~~~
+
+Manifest of a local mirror of gists. It records, for each mirrored gist,
+its 'updated_at' timestamp and the raw URL and SHA-1 hash of each file, so
+the 'sync' action only downloads what has changed since the last run.
+
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+
+class Manifest(object):
+    """ :class: `Manifest <Manifest>` stored as JSON in the mirror directory.
+
+    Each gist is mirrored in the '<directory>/<gist id>/' directory.
+    """
+
+    # Name of the manifest file inside the mirror directory
+    FILE_NAME = ".gists-manifest.json"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, self.FILE_NAME)
+        self.synced_at = None
+        self.gists = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                manifest = json.load(f)
+            self.synced_at = manifest.get('synced_at')
+            self.gists = manifest.get('gists', {})
+
+    def gist_dir(self, gist_id):
+        """ Returns the local directory of a gist, creating it. """
+        path = os.path.join(self.directory, gist_id)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return path
+
+    def is_updated(self, gist):
+        """ Whenever the local copy of a gist is up to date. """
+        entry = self.gists.get(gist.identifier)
+        return entry is not None and entry['updated_at'] == gist.updated_at
+
+    def stale_files(self, gist):
+        """ Returns the files of a gist whose local copy is missing, has
+        been modified locally or belongs to another revision. """
+        entry = self.gists.get(gist.identifier, {'files': {}})
+        stale = []
+        for gistfile in gist.files:
+            known = entry['files'].get(gistfile.filename)
+            path = os.path.join(self.directory, gist.identifier,
+                                gistfile.filename)
+            if (known is None or known['raw_url'] != gistfile.raw_url or
+                    not os.path.exists(path) or
+                    file_hash(path) != known['sha1']):
+                stale.append(gistfile)
+        return stale
+
+    def update(self, gist):
+        """ Records the current state of a mirrored gist, removing the local
+        files that no longer belong to it. """
+        gist_dir = self.gist_dir(gist.identifier)
+        files = {}
+        for gistfile in gist.files:
+            path = os.path.join(gist_dir, gistfile.filename)
+            files[gistfile.filename] = {'raw_url': gistfile.raw_url,
+                                        'sha1': file_hash(path)}
+        old_entry = self.gists.get(gist.identifier, {'files': {}})
+        for filename in set(old_entry['files']) - set(files):
+            path = os.path.join(gist_dir, filename)
+            if os.path.exists(path):
+                os.remove(path)
+        self.gists[gist.identifier] = {'updated_at': gist.updated_at,
+                                       'description': gist.description,
+                                       'files': files}
+
+    def remove(self, gist_id):
+        """ Removes the local copy of a gist. """
+        shutil.rmtree(os.path.join(self.directory, gist_id),
+                      ignore_errors=True)
+        self.gists.pop(gist_id, None)
+
+    def save(self):
+        """ Writes the manifest file atomically. """
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'synced_at': self.synced_at, 'gists': self.gists}, f,
+                      indent=1, sort_keys=True)
+        os.rename(temp_path, self.path)
+
+
+def file_hash(path, chunk_size=64 * 1024):
+    """ Returns the SHA-1 hex digest of a file, reading it in chunks. """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha1.update(chunk)
+    return sha1.hexdigest()
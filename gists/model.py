@@ -23,20 +23,46 @@
 gists.model
 ~~~~~~~~~~~
 
-Model defines the two classes that extend of builtin python 'dicts'.
+Model defines the classes that extend of builtin python 'dicts'.
 They represent a Gist object and a Gist File. Used to make the code of other
 modules clearer.
 
+Being 'dicts', they are serialized as JSON as they are. They declare
+'__slots__', so the instances do not carry an attribute dictionary, and the
+files of a Gist are parsed once and indexed by their name. They are
+pickled as the class and the dict of their items, with any protocol.
+
 """
 
 
-class Gist(dict):
+class Model(dict):
+    """ :class: `Model <Model>` base class of the models. """
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        # Slotted classes can not be pickled with the protocols 0 and 1.
+        # The cached attributes are built again when they are read.
+        return (self.__class__, (dict(self),))
+
+
+class Gist(Model):
     """ :class: `Gist <Gist>` Simple Gist object. """
 
+    __slots__ = ('_files', '_index')
+
     def __init__(self, parsed_gist={}):
         """ Initialize gist object variables. """
 
         super(Gist, self).__init__(parsed_gist)
+        self._files = None
+        self._index = None
+
+    def __setitem__(self, key, value):
+        if key == 'files':
+            # The files will be parsed again
+            self._files = None
+        super(Gist, self).__setitem__(key, value)
 
     @property
     def url(self):
@@ -62,6 +88,14 @@ class Gist(dict):
     def user(self):
         return self['user']['login']
 
+    @property
+    def created_at(self):
+        return self['created_at']
+
+    @property
+    def updated_at(self):
+        return self['updated_at']
+
     @property
     def public(self):
         return self['public']
@@ -72,33 +106,54 @@ class Gist(dict):
 
     @property
     def files(self):
-        """ Parse the 'self['files']' into GistFile objects. """
-        if not 'files' in self:
-            self['files'] = {}
-            return self['files']
-        return [GistFile(self['files'][gistfile])
-                for gistfile in self['files']
-                if self['files'][gistfile] != 'null']
+        """ Parse the 'self['files']' into GistFile objects.
+
+        They are parsed once and cached until a file is set or added.
+        """
+        if self._files is None:
+            self.__index_files()
+        return self._files
 
     def getFile(self, requested_filename):
-        candidates = [gistfile for gistfile in self.files
-                      if gistfile.filename == requested_filename]
-        if len(candidates) == 0:
-            return None
-        return candidates[0]
+        if self._files is None:
+            self.__index_files()
+        return self._index.get(requested_filename)
 
     def setFile(self, filename, gist_file):
+        if not 'files' in self:
+            self['files'] = {}
         self['files'][filename] = gist_file
+        self._files = None
 
     def addFile(self, gistfile):
         if not 'files' in self:
             self['files'] = {}
         self['files'][gistfile.filename] = gistfile
+        self._files = None
 
-
-class GistFile(dict):
+    def __index_files(self):
+        """ Replaces the parsed JSON files by GistFile objects, and builds
+        the list of files and the index by file name. """
+        if not 'files' in self:
+            self['files'] = {}
+        index = {}
+        for filename, gistfile in self['files'].items():
+            if gistfile is None or gistfile == 'null':
+                # File removed from the gist
+                continue
+            if not isinstance(gistfile, GistFile):
+                gistfile = GistFile(gistfile)
+                self['files'][filename] = gistfile
+            index[filename] = gistfile
+        self._index = index
+        self._files = list(index.values())
+
+
+class GistFile(Model):
     """ :class: `GistFile <GistFile>` File that belongs to a Gist. """
 
+    __slots__ = ()
+
     def __init__(self, parsed_file={}):
         super(GistFile, self).__init__(parsed_file)
 
@@ -134,10 +189,16 @@ class GistFile(dict):
     def size(self):
         return self['size']
 
+    @property
+    def truncated(self):
+        return self.get('truncated', False)
+
 
-class Authorization(dict):
+class Authorization(Model):
     """ :class: `Authorization <Authorization>` authorization object. """
 
+    __slots__ = ()
+
     def __init__(self, parsed_auth={}):
         super(Authorization, self).__init__(parsed_auth)
 
@@ -192,3 +253,68 @@ class Authorization(dict):
     @scopes.setter
     def scopes(self, scopes):
         self['scopes'] = scopes
+
+
+class Match(Model):
+    """ :class: `Match <Match>` line of a gist that matches a search. """
+
+    __slots__ = ()
+
+    def __init__(self, parsed_match={}):
+        super(Match, self).__init__(parsed_match)
+
+    @property
+    def gist_id(self):
+        return self['gist_id']
+
+    @property
+    def filename(self):
+        """ Name of the matching file. None if the description matches. """
+        return self['filename']
+
+    @property
+    def line(self):
+        """ Number of the matching line. 0 if the file name matches. """
+        return self['line']
+
+    @property
+    def text(self):
+        return self['text']
+
+
+class Mutation(Model):
+    """ :class: `Mutation <Mutation>` change of a gist queued in the
+    journal while offline. """
+
+    __slots__ = ()
+
+    def __init__(self, parsed_mutation={}):
+        super(Mutation, self).__init__(parsed_mutation)
+
+    @property
+    def action(self):
+        """ 'create', 'update', 'delete', 'star' or 'unstar'. """
+        return self['action']
+
+    @property
+    def gist_id(self):
+        """ Identifier of the changed gist. None if it is created. """
+        return self.get('gist_id')
+
+    @property
+    def description(self):
+        return self.get('description')
+
+    @property
+    def public(self):
+        return self.get('public')
+
+    @property
+    def files(self):
+        """ Content of the created or updated files, by their name. The
+        removed files are None. """
+        return self.get('files') or {}
+
+    @property
+    def queued_at(self):
+        return self.get('queued_at')
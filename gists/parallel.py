@@ -0,0 +1,186 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+
+gists.parallel
+~~~~~~~~~~~~~~
+
+Concurrent counterparts of the 'GithubFacade' and the 'actions' functions.
+Calls are run by a bounded pool of threads and return immediately a
+pending object, whose 'get' method waits for the :class: `Result <Result>`.
+Hundreds of operations can be in flight sharing the facade's connections.
+
+    >>> runner = AsyncActions(GithubFacade(None, token))
+    >>> pending = [runner.star(gist_id) for gist_id in gist_ids]
+    >>> results = gather(pending)
+
+"""
+
+import actions
+from lazy import lazy_import
+
+# Imported when the first pool is created
+multiprocessing_pool = lazy_import('multiprocessing.pool')
+
+
+class WorkerPool(object):
+    """ :class: `WorkerPool <WorkerPool>` bounded pool of threads.
+
+    'submit' returns a pending object (a 'multiprocessing.pool.AsyncResult')
+    whose 'get' method waits for the value of the call, and raises the
+    exception of the call if it failed.
+    """
+
+    # Default number of concurrent calls
+    SIZE = 10
+
+    def __init__(self, size=SIZE):
+        self.size = size
+        self.pool = multiprocessing_pool.ThreadPool(size)
+
+    def submit(self, function, *args, **kwargs):
+        """ Schedules a call and returns its pending object. """
+        return self.pool.apply_async(function, args, kwargs)
+
+    def imap(self, function, iterable):
+        """ Calls 'function' for each item, yielding the values in order
+        as soon as they are available. """
+        return self.pool.imap(function, iterable)
+
+    def imap_unordered(self, function, iterable):
+        """ Calls 'function' for each item, yielding the values as soon as
+        they are available, in any order. """
+        return self.pool.imap_unordered(function, iterable)
+
+    def close(self):
+        """ Waits for the scheduled calls and stops the threads. """
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def gather(pending):
+    """ Waits for a list of pending objects and returns their values. """
+    return [item.get() for item in pending]
+
+
+class AsyncGithubFacade(object):
+    """ :class: `AsyncGithubFacade <AsyncGithubFacade>` wraps a
+    'GithubFacade' so each of its calls returns a pending response.
+
+    :param facade: the 'GithubFacade' that performs the requests
+    :param concurrency: maximum number of requests in flight. By default,
+        the size of the facade's connection pool.
+    """
+
+    def __init__(self, facade, concurrency=None):
+        self.facade = facade
+        self.pool = WorkerPool(concurrency or facade.pool_size)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.facade, name)
+        if not callable(attribute):
+            return attribute
+
+        def submit(*args, **kwargs):
+            return self.pool.submit(attribute, *args, **kwargs)
+        return submit
+
+    def close(self):
+        """ Waits for the pending requests and stops the threads. """
+        self.pool.close()
+
+
+class AsyncActions(object):
+    """ :class: `AsyncActions <AsyncActions>` runs the 'actions' functions
+    concurrently with a shared facade.
+
+    Each method receives the same arguments as the action of the same name
+    (but the facade) and returns a pending :class: `Result <Result>`.
+
+    :param facade: the 'GithubFacade' that performs the requests
+    :param concurrency: maximum number of actions in flight. By default,
+        the size of the facade's connection pool.
+    """
+
+    def __init__(self, facade, concurrency=None):
+        self.facade = facade
+        self.pool = WorkerPool(concurrency or facade.pool_size)
+
+    def list_gists(self, username, want_starred=False, per_page=None):
+        """ Pending 'list_gists'. The data of the result is a list. """
+        return self.pool.submit(self.__list_gists, username, want_starred,
+                                per_page)
+
+    def show(self, gist_id, requested_file=None):
+        """ Pending 'show'. """
+        return self.pool.submit(actions.show, gist_id, requested_file,
+                                self.facade)
+
+    def get(self, gist_id, requested_file=None, destination_dir="."):
+        """ Pending 'get'. """
+        return self.pool.submit(actions.get, gist_id, requested_file,
+                                destination_dir, self.facade)
+
+    def post(self, public, upload_files, filepath, description=None):
+        """ Pending 'post'. """
+        return self.pool.submit(actions.post, public, upload_files,
+                                filepath, description, self.facade)
+
+    def update(self, gist_id, description=None, filenames=None,
+               filepath="./", new=False, remove=False):
+        """ Pending 'update'. """
+        return self.pool.submit(actions.update, gist_id, description,
+                                filenames, filepath, new, remove,
+                                self.facade)
+
+    def star(self, gist_id):
+        """ Pending 'star'. """
+        return self.pool.submit(actions.star, gist_id, self.facade)
+
+    def unstar(self, gist_id):
+        """ Pending 'unstar'. """
+        return self.pool.submit(actions.unstar, gist_id, self.facade)
+
+    def fork(self, gist_id):
+        """ Pending 'fork'. """
+        return self.pool.submit(actions.fork, gist_id, self.facade)
+
+    def delete(self, gist_id):
+        """ Pending 'delete'. It never asks for confirmation. """
+        return self.pool.submit(actions.delete, gist_id, self.facade, True)
+
+    def close(self):
+        """ Waits for the pending actions and stops the threads. """
+        self.pool.close()
+
+    def __list_gists(self, username, want_starred, per_page):
+        """ Runs 'list_gists' retrieving all the pages in the worker. """
+        result = actions.list_gists(username, self.facade, want_starred,
+                                    per_page)
+        if result.success:
+            result.data = list(result.data)
+        return result
@@ -0,0 +1,318 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+
+gists.profiling
+~~~~~~~~~~~~~~~
+
+Instrumentation of a command ('--profile' argument). The stages of the
+'handlers' -> 'actions' -> 'formatters' workflow are timed in wall and CPU
+time, and each HTTP call is recorded with its method, URL template,
+status, size and latency. A summary is written to the standard error when
+the command ends. The records can be saved as a Chrome trace, and the
+whole command profiled with 'cProfile'.
+
+"""
+
+import os
+import re
+import sys
+import time
+from lazy import lazy_import
+
+try:
+    import resource
+except ImportError:
+    # 'os.times' is less precise, but it is available everywhere
+    resource = None
+
+# Imported when a command is profiled, so the others do not pay for it
+threading = lazy_import('threading')
+
+# Profiler of the running command. None if the command is not profiled
+current = None
+
+# Path segments of the URL templates replaced by '{id}'
+ID_SEGMENT = re.compile(r'^([0-9a-f]{7,}|[0-9]+)$')
+
+
+def cpu_time():
+    """ Returns the CPU time (user and system) of the process, in seconds.
+    """
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+    times = os.times()
+    return times[0] + times[1]
+
+
+def start(started=None, dump_path=None):
+    """ Starts profiling the command, and returns the profiler.
+
+    :param started: time the command started. Now if None.
+    :param dump_path: where the 'cProfile' statistics are saved. The
+        command is not profiled with 'cProfile' if None.
+    """
+    global current
+    current = Profiler(started, dump_path)
+    return current
+
+
+def stage(name):
+    """ Returns the context that times a stage of the running command.
+    It does nothing if the command is not profiled.
+
+        >>> with stage('decode'):
+        ...     gist = json.loads(body)
+    """
+    return Stage(current, name)
+
+
+def record_call(method, url, started, response=None, error=None,
+                status=None, size=None):
+    """ Records an HTTP call of the running command, if it is profiled.
+
+    :param method: HTTP method of the call
+    :param url: requested URL
+    :param started: time the call was sent
+    :param response: the 'requests' response. None if the call failed.
+    :param error: the exception raised by the call, if any
+    :param status: HTTP status of the call, if there is no 'response'
+    :param size: bytes of the body, if there is no 'response'
+    """
+    if current is not None:
+        current.record_call(method, url, started, response, error, status,
+                            size)
+
+
+def url_template(url):
+    """ Returns the URL without its query, and with the identifiers and
+    user names replaced by '{id}' and '{user}'. The path of the files
+    outside the API is replaced by '{path}'. """
+    url = url.split('?')[0]
+    parts = url.split('/', 3)
+    if len(parts) < 4:
+        return url
+    base, path = '/'.join(parts[:3]), parts[3]
+    if not parts[2].startswith('api.'):
+        return base + '/{path}'
+    segments = path.split('/')
+    for position, segment in enumerate(segments):
+        if position > 0 and segments[position - 1] == 'users':
+            segments[position] = '{user}'
+        elif ID_SEGMENT.match(segment):
+            segments[position] = '{id}'
+    return base + '/' + '/'.join(segments)
+
+
+class Profiler(object):
+    """ :class: `Profiler <Profiler>` records of a profiled command.
+
+    'stages' is the list of timed stages, and 'calls' the list of HTTP
+    calls, both as dicts. Calls may be recorded from several threads.
+    """
+
+    def __init__(self, started=None, dump_path=None):
+        self.started = started or time.time()
+        self.cpu_started = cpu_time()
+        self.stages = []
+        self.calls = []
+        self.elapsed = None
+        self.cpu_elapsed = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.dump_path = dump_path
+        self.profile = None
+        if dump_path is not None:
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def add_stage(self, name, started, cpu_started=None, depth=0):
+        """ Records a stage that ends now. Its CPU time is not known if
+        'cpu_started' is None. """
+        record = {'name': name, 'depth': depth, 'start': started,
+                  'wall': time.time() - started, 'cpu': None,
+                  'thread': threading.current_thread().ident}
+        if cpu_started is not None:
+            record['cpu'] = cpu_time() - cpu_started
+        with self.lock:
+            self.stages.append(record)
+
+    def record_call(self, method, url, started, response=None, error=None,
+                    status=None, size=None):
+        """ Records an HTTP call that ends now. """
+        record = {'method': method, 'url': url_template(url),
+                  'start': started, 'latency': time.time() - started,
+                  'status': status, 'bytes': size,
+                  'thread': threading.current_thread().ident}
+        if response is not None:
+            record['status'] = response.status_code
+            record['bytes'] = self.__response_size(response)
+        if error is not None:
+            record['error'] = unicode(error)
+        with self.lock:
+            self.calls.append(record)
+
+    def finish(self, trace_path=None, stream=None):
+        """ Stops profiling, writes the summary and saves the records.
+
+        :param trace_path: where the Chrome trace is saved, if any
+        :param stream: where the summary is written. The standard error
+            if None.
+        """
+        global current
+        if current is self:
+            current = None
+        self.elapsed = time.time() - self.started
+        self.cpu_elapsed = cpu_time() - self.cpu_started
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.dump_path)
+        if trace_path is not None:
+            self.save_trace(trace_path)
+        (stream or sys.stderr).write(self.summary())
+
+    def summary(self):
+        """ Returns the table of the stages and the HTTP calls.
+
+        The stages with the same name are added up, and their number is
+        shown in the 'Count' column. The CPU time is measured once the
+        arguments are parsed, so it is not known for the 'parse' stage.
+        """
+        lines = ["%-24s %10s %10s %6s" % ("Stage", "Wall ms", "CPU ms",
+                                          "Count")]
+        totals = []
+        by_name = {}
+        for record in sorted(self.stages, key=lambda r: r['start']):
+            key = (record['depth'], record['name'])
+            if key not in by_name:
+                by_name[key] = [record['name'], record['depth'], 0, None, 0]
+                totals.append(by_name[key])
+            by_name[key][2] += record['wall']
+            if record['cpu'] is not None:
+                by_name[key][3] = (by_name[key][3] or 0) + record['cpu']
+            by_name[key][4] += 1
+        if self.elapsed is not None:
+            totals.append(['total', 0, self.elapsed, self.cpu_elapsed, 1])
+        for name, depth, wall, cpu, count in totals:
+            lines.append("%-24s %10.1f %10s %6d" %
+                         ("  " * depth + name, wall * 1000,
+                          self.__milliseconds(cpu), count))
+
+        sizes = [call['bytes'] for call in self.calls if call['bytes']]
+        latency = sum(call['latency'] for call in self.calls)
+        lines.append("")
+        lines.append("HTTP calls: %s, %s bytes, %.1f ms" %
+                     (len(self.calls), sum(sizes), latency * 1000))
+        if self.calls:
+            lines.append("%-6s %6s %10s %10s  %s" %
+                         ("Method", "Status", "Bytes", "Latency ms", "URL"))
+        for call in sorted(self.calls, key=lambda c: c['start']):
+            status = call['status'] or call.get('error', '-')
+            lines.append("%-6s %6s %10s %10.1f  %s" %
+                         (call['method'], status,
+                          '-' if call['bytes'] is None else call['bytes'],
+                          call['latency'] * 1000, call['url']))
+        return '\n'.join(lines) + '\n'
+
+    def trace_events(self):
+        """ Returns the stages and the calls as Chrome trace events
+        (complete 'X' events, times in microseconds). """
+        pid = os.getpid()
+        events = []
+        for record in self.stages:
+            cpu = record['cpu']
+            events.append({'name': record['name'], 'cat': 'stage',
+                           'ph': 'X', 'pid': pid, 'tid': record['thread'],
+                           'ts': self.__microseconds(record['start']),
+                           'dur': record['wall'] * 1e6,
+                           'args': {'cpu_ms': None if cpu is None
+                                    else cpu * 1000}})
+        for call in self.calls:
+            events.append({'name': call['method'] + ' ' + call['url'],
+                           'cat': 'http', 'ph': 'X', 'pid': pid,
+                           'tid': call['thread'],
+                           'ts': self.__microseconds(call['start']),
+                           'dur': call['latency'] * 1e6,
+                           'args': {'status': call['status'],
+                                    'bytes': call['bytes'],
+                                    'error': call.get('error')}})
+        return events
+
+    def save_trace(self, path):
+        """ Saves the Chrome trace, that 'chrome://tracing' or Perfetto
+        open. """
+        import json
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(),
+                       'displayTimeUnit': 'ms'}, f)
+
+    def __microseconds(self, moment):
+        return (moment - self.started) * 1e6
+
+    def __milliseconds(self, seconds):
+        if seconds is None:
+            return '-'
+        return "%.1f" % (seconds * 1000)
+
+    def __response_size(self, response):
+        """ Returns the size of the body of a response, without reading it
+        if it is streamed. None if it is not known. """
+        length = response.headers.get('Content-Length')
+        if length is not None and length.isdigit():
+            return int(length)
+        content = getattr(response, '_content', False)
+        if isinstance(content, bytes):
+            return len(content)
+        return None
+
+
+class Stage(object):
+    """ :class: `Stage <Stage>` context that times a stage of a command.
+
+    Stages opened inside another one, in the same thread, are nested in
+    the summary.
+
+    :param profiler: the :class: `Profiler <Profiler>`. Nothing is timed
+        if None.
+    :param name: name of the stage
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler is not None:
+            local = self.profiler.local
+            self.depth = getattr(local, 'depth', 0)
+            local.depth = self.depth + 1
+            self.started = time.time()
+            self.cpu_started = cpu_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler is not None:
+            self.profiler.add_stage(self.name, self.started,
+                                    self.cpu_started, self.depth)
+            self.profiler.local.depth = self.depth
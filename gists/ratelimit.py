@@ -0,0 +1,169 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+
+gists.ratelimit
+~~~~~~~~~~~~~~~
+
+Scheduler of the requests sent to GitHub. It reads the rate limit headers of
+every response and spreads the remaining requests until the limit is reset,
+so the budget is never exhausted. It also waits out the secondary rate
+limits instead of failing.
+
+"""
+
+import threading
+import time
+
+
+class RateLimiter(object):
+    """ :class: `RateLimiter <RateLimiter>` token bucket fed by the
+    'X-RateLimit-*' and 'Retry-After' headers of the responses.
+
+    While the remaining budget is above 'threshold' (a fraction of the
+    limit) requests are not delayed. Below it, tokens are refilled at the
+    rate that spreads the remaining budget (minus 'reserve') until the
+    reset time.
+    """
+
+    # Fraction of the limit below which the requests are throttled
+    THRESHOLD = 0.2
+
+    # Requests kept aside for interactive usage
+    RESERVE = 10
+
+    # Maximum number of requests sent in a burst while throttled
+    BURST = 5
+
+    # Seconds to wait on a secondary rate limit without 'Retry-After'
+    SECONDARY_WAIT = 60
+
+    # Maximum seconds to wait before a request. Longer waits give up and
+    # let the rate limit error reach the caller.
+    MAX_WAIT = 15 * 60
+
+    def __init__(self, threshold=THRESHOLD, reserve=RESERVE, burst=BURST,
+                 max_wait=MAX_WAIT):
+        self.threshold = threshold
+        self.reserve = reserve
+        self.burst = burst
+        self.max_wait = max_wait
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.blocked_until = 0
+        self.tokens = float(burst)
+        self.refilled = time.time()
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def update(self, response):
+        """ Reads the rate limit headers of a response.
+
+        :param response: any response from the GitHub API.
+        """
+        headers = response.headers
+        now = time.time()
+        with self.lock:
+            if headers.get('X-RateLimit-Remaining') is not None:
+                self.limit = int(headers.get('X-RateLimit-Limit', 0)) or None
+                self.remaining = int(headers['X-RateLimit-Remaining'])
+                self.reset = int(headers.get('X-RateLimit-Reset', 0)) or None
+
+            if self.is_limited(response):
+                retry_after = headers.get('Retry-After')
+                if retry_after and retry_after.isdigit():
+                    self.blocked_until = now + int(retry_after)
+                elif self.remaining == 0 and self.reset:
+                    self.blocked_until = self.reset
+                else:
+                    self.blocked_until = now + self.SECONDARY_WAIT
+
+    def is_limited(self, response):
+        """ Whenever the response has been rejected by a rate limit. """
+        if response.status_code == 429:
+            return True
+        if response.status_code != 403:
+            return False
+        return (response.headers.get('Retry-After') is not None or
+                response.headers.get('X-RateLimit-Remaining') == '0' or
+                'rate limit' in (getattr(response, '_content', None) or '')
+                .lower())
+
+    def delay(self):
+        """ Returns the seconds to wait before the next request, consuming
+        a token if no wait is needed. """
+        now = time.time()
+        with self.lock:
+            if self.blocked_until > now:
+                return self.blocked_until - now
+
+            rate = self.__rate(now)
+            if rate is None:
+                return 0
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.refilled) * rate)
+            self.refilled = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            if rate == 0:
+                return max((self.reset or now) - now, 1)
+            return (1 - self.tokens) / rate
+
+    def acquire(self, max_wait=None):
+        """ Blocks until a request can be sent.
+
+        Returns False if the wait would be longer than the 'max_wait'
+        attribute, or than the 'max_wait' argument if it is shorter.
+        """
+        if max_wait is None:
+            max_wait = self.max_wait
+        max_wait = min(max_wait, self.max_wait)
+        while True:
+            wait = self.delay()
+            if wait <= 0:
+                return True
+            if wait > max_wait:
+                return False
+            self.waited += wait
+            time.sleep(wait)
+
+    def status(self):
+        """ Returns the current budget as a dict. """
+        with self.lock:
+            return {'limit': self.limit,
+                    'remaining': self.remaining,
+                    'reset': self.reset,
+                    'blocked_until': self.blocked_until or None,
+                    'throttled': self.__rate(time.time()) is not None,
+                    'waited': self.waited}
+
+    def __rate(self, now):
+        """ Returns the requests per second allowed, None if unlimited. """
+        if self.remaining is None or not self.limit:
+            return None
+        if self.remaining > self.limit * self.threshold:
+            return None
+        if not self.reset or self.reset <= now:
+            return None
+        usable = max(self.remaining - self.reserve, 0)
+        return float(usable) / (self.reset - now)
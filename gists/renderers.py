@@ -0,0 +1,186 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+
+gists.renderers
+~~~~~~~~~~~~~~~
+
+Machine-readable counterparts of the 'formatters' ('--output' argument).
+The :class: `Result <Result>` of any action is turned into flat records,
+one per gist, file or processed item, and each record is rendered as soon
+as it is available in a single line of JSON, TSV or CSV, without colors.
+
+"""
+
+import csv
+import json
+import types
+import model
+import utils
+
+# Fields of the records of each kind of data
+GIST_FIELDS = ('id', 'description', 'public', 'files', 'html_url',
+               'created_at', 'updated_at')
+FILE_FIELDS = ('filename', 'language', 'size', 'raw_url', 'content')
+AUTHORIZATION_FIELDS = ('id', 'url')
+STATUS_FIELDS = ('success', 'message')
+ITEM_FIELDS = ('item', 'success', 'message')
+MATCH_FIELDS = ('gist_id', 'filename', 'line', 'text')
+MUTATION_FIELDS = ('action', 'gist_id', 'description', 'files',
+                   'queued_at')
+
+
+def render_jsonl(result):
+    """ Yields a JSON object per record (JSON Lines). """
+    for fields, record in records(result):
+        yield json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def render_tsv(result):
+    """ Yields a line of tab separated values per record.
+
+    Tabs, new lines and backslashes inside the values are escaped, so each
+    record is a single line.
+    """
+    for fields, record in records(result):
+        yield '\t'.join(__tsv_value(record[field])
+                        for field in fields) + '\n'
+
+
+def render_csv(result):
+    """ Yields a line of comma separated values per record, after a header
+    with the field names. """
+    line = __Line()
+    writer = csv.writer(line, lineterminator='\n')
+    header = None
+    for fields, record in records(result):
+        if fields != header:
+            header = fields
+            writer.writerow(fields)
+        writer.writerow([__text(record[field]) for field in fields])
+        yield line.pop()
+
+
+def records(result):
+    """ Yields the (fields, record) of each record of a result.
+
+    :param result: :class: `Result <Result>` of any action.
+    """
+    if isinstance(result, utils.ScriptResult):
+        # The records of each line of a batch, with its number
+        for number, line, args, outcome in result.data:
+            for fields, record in records(outcome):
+                record = dict(record)
+                record['line'] = number
+                yield ('line',) + fields, record
+    elif isinstance(result, utils.BatchResult):
+        for item, outcome in result.data:
+            yield ITEM_FIELDS, {'item': item,
+                                'success': outcome.success,
+                                'message': __message(outcome.data)}
+    elif not result.success:
+        yield STATUS_FIELDS, {'success': False, 'message': result.data}
+    elif isinstance(result.data, (list, types.GeneratorType)):
+        for item in result.data:
+            if isinstance(item, model.Match):
+                yield MATCH_FIELDS, item
+            elif isinstance(item, model.Mutation):
+                yield MUTATION_FIELDS, mutation_record(item)
+            else:
+                yield GIST_FIELDS, gist_record(item)
+    elif isinstance(result.data, model.Gist):
+        yield GIST_FIELDS, gist_record(result.data)
+    elif isinstance(result.data, model.GistFile):
+        yield FILE_FIELDS, dict((field, result.data.get(field))
+                                for field in FILE_FIELDS)
+    elif isinstance(result.data, model.Authorization):
+        yield AUTHORIZATION_FIELDS, dict((field, result.data.get(field))
+                                         for field in AUTHORIZATION_FIELDS)
+    elif isinstance(result.data, dict):
+        fields = tuple(sorted(result.data))
+        yield fields, result.data
+    else:
+        yield STATUS_FIELDS, {'success': True, 'message': result.data}
+
+
+def gist_record(gist):
+    """ Returns the record of a :class: `Gist <Gist>`. """
+    return {'id': gist.identifier,
+            'description': gist.get('description'),
+            'public': gist.get('public'),
+            'files': [gistfile.filename for gistfile in gist.files],
+            'html_url': gist.get('html_url'),
+            'created_at': gist.get('created_at'),
+            'updated_at': gist.get('updated_at')}
+
+
+def mutation_record(mutation):
+    """ Returns the record of a :class: `Mutation <Mutation>`. The removed
+    files are listed too. """
+    return {'action': mutation.action,
+            'gist_id': mutation.gist_id,
+            'description': mutation.description,
+            'files': sorted(mutation.files),
+            'queued_at': mutation.queued_at}
+
+
+# Renderers by the name of the output format
+RENDERERS = {'jsonl': render_jsonl, 'tsv': render_tsv, 'csv': render_csv}
+
+
+def __message(data):
+    """ The message of an outcome of a batch. """
+    if isinstance(data, model.Gist):
+        # A new gist has been created (forked, for instance)
+        return data.html_url
+    return data
+
+
+def __text(value):
+    """ Returns a value as an UTF-8 string. """
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        value = ','.join(value)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def __tsv_value(value):
+    return (__text(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class __Line(object):
+    """ File-like object that keeps the last line written by 'csv'. """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+
+    def pop(self):
+        line = ''.join(self.chunks)
+        self.chunks = []
+        return line
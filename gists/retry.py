@@ -0,0 +1,143 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+
+gists.retry
+~~~~~~~~~~~
+
+Handling of the transient failures of the GitHub API: the retry policy of
+the idempotent requests and the circuit breaker that fails fast when the
+API is down.
+
+"""
+
+import random
+import threading
+import time
+
+
+class RetryPolicy(object):
+    """ :class: `RetryPolicy <RetryPolicy>` decides which requests are sent
+    again and how long to wait before each attempt.
+
+    Waits grow exponentially ('backoff' * 2 ^ attempt, up to 'max_backoff')
+    and, with 'jitter', a random value between zero and that wait is used,
+    so concurrent clients do not retry at the same time.
+    """
+
+    # Methods that can be sent again without side effects
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+    # Response status considered transient failures
+    TRANSIENT_STATUS = (500, 502, 503, 504)
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30, jitter=True,
+                 methods=IDEMPOTENT_METHODS):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.methods = methods
+
+    def can_retry(self, method, attempt):
+        """ Whenever the request can be sent again.
+
+        :param method: HTTP method of the request
+        :param attempt: number of retries already done
+        """
+        return method.upper() in self.methods and attempt < self.retries
+
+    def is_transient(self, response):
+        """ Whenever the response is a transient failure. """
+        return response.status_code in self.TRANSIENT_STATUS
+
+    def delay(self, attempt):
+        """ Returns the seconds to wait before the retry number 'attempt'
+        (starting by 1). """
+        wait = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        if self.jitter:
+            return random.uniform(0, wait)
+        return wait
+
+
+class CircuitBreaker(object):
+    """ :class: `CircuitBreaker <CircuitBreaker>` stops sending requests
+    when the API is clearly down.
+
+    After 'threshold' consecutive failures the circuit trips open, and the
+    requests fail immediately during 'reset_timeout' seconds. Then a single
+    request is let through: if it succeeds the circuit is closed again,
+    otherwise it stays open another 'reset_timeout' seconds.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.trips = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """ Whenever a request can be sent. """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if (self.state == self.OPEN and
+                    time.time() - self.opened >= self.reset_timeout):
+                # Let a single request check if the API is back
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def release(self):
+        """ Ends a request let through that got no outcome (it was not
+        sent, or the deadline expired). If it was the single request of the
+        half-open circuit, the circuit opens again, so that a later request
+        checks the API. """
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened = time.time()
+
+    def record_success(self):
+        """ Closes the circuit after a successful request. """
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """ Counts a failed request. Returns True if the circuit trips. """
+        with self.lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN or
+                    (self.state == self.CLOSED and
+                     self.failures >= self.threshold)):
+                self.state = self.OPEN
+                self.opened = time.time()
+                self.trips += 1
+                return True
+            return False
@@ -0,0 +1,367 @@
+# Copyright (c) 2012 <Jaume Devesa (jaumedevesa@gmail.com)>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+
+gists.search
+~~~~~~~~~~~~
+
+Full-text search over the descriptions, file names and contents of the
+gists. An inverted index, stored in a SQLite database, maps the trigrams and
+the words of each document (a gist file, or the description of a gist) to
+the documents that contain them. A query only reads the candidate documents
+that contain all the trigrams of the searched text, and then looks for the
+text in them.
+
+"""
+
+import array
+import bisect
+import re
+import sqlite3
+import sre_constants
+import sre_parse
+import threading
+import model
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexed (
+    id INTEGER PRIMARY KEY,
+    gist_id TEXT UNIQUE,
+    owner TEXT,
+    updated_at TEXT);
+CREATE TABLE IF NOT EXISTS documents (
+    gist INTEGER,
+    filename TEXT,
+    content TEXT);
+CREATE INDEX IF NOT EXISTS documents_gist ON documents (gist);
+CREATE TABLE IF NOT EXISTS trigrams (
+    term TEXT PRIMARY KEY,
+    postings BLOB);
+CREATE TABLE IF NOT EXISTS tokens (
+    term TEXT PRIMARY KEY,
+    postings BLOB);
+"""
+
+# Words of a document
+WORD = re.compile(r'\w+', re.UNICODE)
+
+# Maximum characters of a file that are indexed
+MAX_CONTENT = 1024 * 1024
+
+# Maximum number of parameters of a SQL statement
+MAX_PARAMETERS = 500
+
+
+class SearchIndex(object):
+    """ :class: `SearchIndex <SearchIndex>` inverted index of the gists.
+
+    Each trigram and each word is stored along with its postings: the
+    sorted array of the (internal) identifiers of the gists that contain
+    it. Postings are updated only for the terms of the stored or removed
+    gists.
+
+    A single connection is shared by the threads of the process, guarded by
+    a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def outdated(self, gists):
+        """ Returns the gists whose indexed contents are missing or belong
+        to another revision (their 'updated_at' changed).
+
+        :param gists: iterable of :class: `Gist <Gist>` instances
+        """
+        with self.lock:
+            indexed = dict(self.connection.execute(
+                "SELECT gist_id, updated_at FROM indexed"))
+        return [gist for gist in gists
+                if indexed.get(gist.identifier) != gist.updated_at]
+
+    def store(self, gists, owner=None):
+        """ Indexes the description, file names and contents of the gists,
+        replacing their previous revisions, in a single transaction.
+
+        :param gists: iterable of :class: `Gist <Gist>` instances with the
+            content of their files
+        :param owner: owner of the gists. Read from each gist if None.
+        """
+        changes = {}
+        with self.lock:
+            with self.connection:
+                for gist in gists:
+                    gist_owner = owner
+                    if gist_owner is None:
+                        gist_owner = (gist.get('owner') or gist.get('user')
+                                      or {}).get('login')
+                    row = self.connection.execute(
+                        "SELECT id FROM indexed WHERE gist_id = ?",
+                        (gist.identifier,)).fetchone()
+                    if row:
+                        internal_id = row[0]
+                        self.__remove_documents(internal_id, changes)
+                        self.connection.execute(
+                            "UPDATE indexed SET owner = ?, updated_at = ? "
+                            "WHERE id = ?",
+                            (gist_owner, gist.updated_at, internal_id))
+                    else:
+                        internal_id = self.connection.execute(
+                            "INSERT INTO indexed (gist_id, owner, updated_at) "
+                            "VALUES (?, ?, ?)", (gist.identifier, gist_owner,
+                                                 gist.updated_at)).lastrowid
+                    self.__add_documents(internal_id, gist, changes)
+                self.__update_postings(changes)
+
+    def prune(self, owner, gist_ids):
+        """ Removes the indexed gists of an owner that are not in
+        'gist_ids'. """
+        gist_ids = set(gist_ids)
+        changes = {}
+        with self.lock:
+            with self.connection:
+                rows = self.connection.execute(
+                    "SELECT id, gist_id FROM indexed WHERE owner = ?",
+                    (owner,)).fetchall()
+                for internal_id, gist_id in rows:
+                    if gist_id not in gist_ids:
+                        self.__remove_documents(internal_id, changes)
+                        self.connection.execute(
+                            "DELETE FROM indexed WHERE id = ?",
+                            (internal_id,))
+                self.__update_postings(changes)
+
+    def search(self, pattern, regex=False, ignore_case=False, owner=None):
+        """ Returns the lines that match a text or a regular expression, as
+        :class: `Match <Match>` instances.
+
+        :param pattern: the text or the regular expression to search
+        :param regex: whenever 'pattern' is a regular expression
+        :param ignore_case: ignore the case of the letters
+        :param owner: only the gists of this owner
+        """
+        flags = re.UNICODE | re.MULTILINE
+        if ignore_case:
+            flags |= re.IGNORECASE
+        if regex:
+            expression = re.compile(pattern, flags)
+            fragments = required_literals(pattern)
+        else:
+            expression = re.compile(re.escape(pattern), flags)
+            fragments = [pattern]
+
+        sql = ("SELECT gist_id, filename, content FROM documents "
+               "JOIN indexed ON indexed.id = documents.gist")
+        conditions = []
+        params = []
+        if owner is not None:
+            conditions.append("owner = ?")
+            params.append(owner)
+        with self.lock:
+            candidates = self.__candidates(fragments)
+            if candidates is None:
+                chunks = [[]]
+            else:
+                candidates = sorted(candidates)
+                chunks = [candidates[start:start + MAX_PARAMETERS]
+                          for start in range(0, len(candidates),
+                                             MAX_PARAMETERS)]
+            rows = []
+            for chunk in chunks:
+                chunk_conditions = list(conditions)
+                if candidates is not None:
+                    chunk_conditions.append("gist IN (%s)" %
+                                            ", ".join("?" * len(chunk)))
+                chunk_sql = sql
+                if chunk_conditions:
+                    chunk_sql += " WHERE " + " AND ".join(chunk_conditions)
+                rows.extend(self.connection.execute(chunk_sql,
+                                                    params + chunk))
+
+        matches = []
+        for gist_id, filename, content in sorted(rows):
+            matches.extend(self.__match_lines(expression, gist_id,
+                                              filename, content))
+        return matches
+
+    def close(self):
+        self.connection.close()
+
+    def __candidates(self, fragments):
+        """ Returns the internal identifiers of the gists that can contain
+        all the fragments. None if any gist can. """
+        candidates = None
+        for fragment in fragments:
+            fragment = fragment.lower()
+            fragment_trigrams = trigrams(fragment)
+            if fragment_trigrams:
+                for trigram in fragment_trigrams:
+                    postings = self.__postings('trigrams', trigram)
+                    candidates = (postings if candidates is None else
+                                  candidates & postings)
+            elif WORD.match(fragment) and \
+                    WORD.match(fragment).end() == len(fragment):
+                # Too short for trigrams, but inside a single word
+                like = (u"%" + fragment.replace(u"\\", u"\\\\")
+                        .replace(u"%", u"\\%").replace(u"_", u"\\_") +
+                        u"%")
+                postings = set()
+                for row in self.connection.execute(
+                        "SELECT postings FROM tokens WHERE term LIKE ? "
+                        "ESCAPE '\\'", (like,)):
+                    postings.update(self.__unpack(row[0]))
+                candidates = (postings if candidates is None else
+                              candidates & postings)
+            if candidates is not None and not candidates:
+                break
+        return candidates
+
+    def __postings(self, table, term):
+        """ Returns the set of postings of a term. """
+        row = self.connection.execute(
+            "SELECT postings FROM %s WHERE term = ?" % table,
+            (term,)).fetchone()
+        return set(self.__unpack(row[0])) if row else set()
+
+    def __add_documents(self, internal_id, gist, changes):
+        """ Inserts the documents of a gist, recording its new terms. """
+        documents = [(None, gist.description or u'')]
+        for gistfile in gist.files:
+            content = (gistfile.get('content') or u'')[:MAX_CONTENT]
+            documents.append((gistfile.filename,
+                              gistfile.filename + u'\n' + content))
+        self.connection.executemany(
+            "INSERT INTO documents VALUES (?, ?, ?)",
+            [(internal_id, filename, content)
+             for filename, content in documents])
+        for filename, content in documents:
+            for table, term in self.__terms(content):
+                changes.setdefault((table, term), {})[internal_id] = True
+
+    def __remove_documents(self, internal_id, changes):
+        """ Deletes the documents of a gist, recording its old terms. """
+        for row in self.connection.execute(
+                "SELECT content FROM documents WHERE gist = ?",
+                (internal_id,)):
+            for table, term in self.__terms(row[0]):
+                changes.setdefault((table, term), {})[internal_id] = False
+        self.connection.execute("DELETE FROM documents WHERE gist = ?",
+                                (internal_id,))
+
+    def __update_postings(self, changes):
+        """ Adds and removes the gists of the postings of the changed
+        terms. """
+        for (table, term), gists in changes.iteritems():
+            row = self.connection.execute(
+                "SELECT postings FROM %s WHERE term = ?" % table,
+                (term,)).fetchone()
+            postings = self.__unpack(row[0]) if row else array.array('i')
+            for internal_id, present in gists.iteritems():
+                position = bisect.bisect_left(postings, internal_id)
+                found = (position < len(postings) and
+                         postings[position] == internal_id)
+                if present and not found:
+                    postings.insert(position, internal_id)
+                elif not present and found:
+                    del postings[position]
+            if postings:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO %s VALUES (?, ?)" % table,
+                    (term, buffer(postings.tostring())))
+            else:
+                self.connection.execute(
+                    "DELETE FROM %s WHERE term = ?" % table, (term,))
+
+    def __terms(self, content):
+        """ Yields the ('trigrams', trigram) and ('tokens', word) terms of a
+        document. """
+        lowered = content.lower()
+        for trigram in trigrams(lowered):
+            yield 'trigrams', trigram
+        for token in set(WORD.findall(lowered)):
+            yield 'tokens', token
+
+    def __match_lines(self, expression, gist_id, filename, content):
+        """ Returns a :class: `Match <Match>` per line of a document where
+        the expression matches. """
+        matches = []
+        # File names are indexed in the first line of their documents
+        line_number = 0 if filename is not None else 1
+        position = 0
+        for match in expression.finditer(content):
+            if match.start() < position:
+                # Another match in a line already reported
+                continue
+            line_number += content.count(u'\n', position, match.start())
+            start = content.rfind(u'\n', 0, match.start()) + 1
+            end = content.find(u'\n', match.start())
+            if end == -1:
+                end = len(content)
+            matches.append(model.Match({'gist_id': gist_id,
+                                        'filename': filename,
+                                        'line': line_number,
+                                        'text': content[start:end]}))
+            position = end
+        return matches
+
+    def __unpack(self, blob):
+        """ Unpacks the identifiers of a blob. """
+        postings = array.array('i')
+        postings.fromstring(str(blob))
+        return postings
+
+
+def trigrams(text):
+    """ Returns the set of trigrams (three consecutive characters) of a
+    text. """
+    return set(text[position:position + 3]
+               for position in range(len(text) - 2))
+
+
+def required_literals(pattern):
+    """ Returns the literal fragments that every match of a regular
+    expression contains.
+
+    Only the top level sequence of the expression is inspected: any other
+    element (classes, repetitions, groups, alternatives...) splits the
+    fragments. An empty list means that any document can match.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (sre_constants.error, OverflowError):
+        return []
+    fragments = []
+    current = []
+    for op, value in parsed:
+        if op == sre_constants.LITERAL:
+            current.append(unichr(value))
+            continue
+        if current:
+            fragments.append(u''.join(current))
+            current = []
+    if current:
+        fragments.append(u''.join(current))
+    return fragments
+
@@ -28,30 +28,129 @@ base64 encoding, 'requests' module encapsulation, result data model, etc...
 
 """
 
+import copy
 import json
-import requests
-import urllib2
 import os
+import socket
+import struct
+import sys
+import threading
+import time
 import literals
-import ConfigParser
-from clint.textui import colored
+import jsonstream
+from lazy import lazy_import
+from ratelimit import RateLimiter
+from retry import RetryPolicy, CircuitBreaker
+
+# Heavy modules, imported when they are used
+requests = lazy_import('requests')
+urllib2 = lazy_import('urllib2')
+ConfigParser = lazy_import('ConfigParser')
+colored = lazy_import('clint.textui.colored')
+
+# Imported when the first call is recorded
+profiling = lazy_import('profiling', globals())
+
+
+# Directory where the local data is stored, next to the '~/.gistsrc' file
+DATA_DIR = os.path.expanduser('~/.gists')
+
+# Bytes read and written at once while downloading a file
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Bytes of a list response decoded at once
+LIST_CHUNK_SIZE = 16 * 1024
+
+# (rows, columns) assumed when the output is not a terminal
+DEFAULT_TERMINAL_SIZE = (24, 80)
 
 
 class Result(object):
     """ The :class: `Result <Result>`.
 
     This class is return type of all the methods in 'gists.actions' module.
+    'retries' and 'trips' count the requests sent again after a transient
+    failure and the times the circuit breaker opened during the action.
     """
     def __init__(self):
         self.success = False
         self.data = None
+        self.retries = 0
+        self.trips = 0
+
+
+class BatchResult(Result):
+    """ The :class: `BatchResult <BatchResult>`.
+
+    Result of an action applied to several items (files, gists...). 'data'
+    is a list of (item, :class: `Result <Result>`) pairs, and 'elapsed' the
+    wall time of the whole batch in seconds.
+    """
+    def __init__(self):
+        super(BatchResult, self).__init__()
+        self.data = []
+        self.elapsed = 0
+
+
+class ScriptResult(Result):
+    """ The :class: `ScriptResult <ScriptResult>`.
+
+    Result of the 'batch' command. 'data' yields a (line number, line,
+    arguments, :class: `Result <Result>`) tuple per command, in the order
+    of the lines, as they are completed. 'arguments' is None if the line
+    is not a valid command. 'started' is the time the batch started.
+    """
+    def __init__(self):
+        super(ScriptResult, self).__init__()
+        self.success = True
+        self.data = iter(())
+        self.started = time.time()
+
+
+class GithubError(Exception):
+    """ Raised by the :class: `GithubFacade <GithubFacade>` when Github can
+    not be reached. The message is ready to be shown to the user. """
+
+
+class CircuitOpenError(GithubError):
+    """ Raised when the circuit breaker does not let the requests through.
+    """
+
+
+class DeadlineExceeded(GithubError):
+    """ Raised when the deadline of a command expires. """
+
+
+class Deadline(object):
+    """ :class: `Deadline <Deadline>` overall time limit of a command or a
+    batch of commands.
+
+    The facade shortens the timeouts of each call to the remaining time,
+    and raises 'DeadlineExceeded' once it has expired.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.time() + seconds
+
+    def remaining(self):
+        """ Returns the seconds until the deadline. Raises
+        'DeadlineExceeded' if it has already expired. """
+        remaining = self.expires - time.time()
+        if remaining <= 0:
+            raise DeadlineExceeded(literals.DEADLINE_EXCEEDED %
+                                   (self.seconds))
+        return remaining
 
 
 class GithubFacade(object):
     """ :class: `GithubFacade <GithubFacade> executes all the calls to Github.
 
     Although it is a trivial class, it is useful to mock its behavior
-    in tests and to encapsulate the 'requests' dependency
+    in tests and to encapsulate the 'requests' dependency.
+
+    All the calls share a single 'requests.Session', so the TCP and TLS
+    connections to the API are kept alive and reused between calls.
     """
     # Endpoints to gists' github API
     ENDPOINT_LIST = "https://api.github.com/users/%s/gists"
@@ -61,53 +160,412 @@ class GithubFacade(object):
     ENDPOINT_AUTH = "https://api.github.com/authorizations"
     ENDPOINT_FORK = "https://api.github.com/gists/%s/fork"
     ENDPOINT_STAR = "https://api.github.com/gists/%s/star"
+    ENDPOINT_RATE_LIMIT = "https://api.github.com/rate_limit"
 
     # Default content type
     APPLICATION_JSON = "application/json"
 
-    def __init__(self, username=None, credential=None):
+    # Default size of the connection pool (connections kept per host)
+    POOL_SIZE = 10
+
+    # Times a request rejected by a rate limit is sent again
+    RATE_LIMIT_RETRIES = 3
+
+    # Classes of endpoints, with their own timeouts
+    METADATA = 'metadata'
+    DOWNLOAD = 'download'
+
+    # Default (connect, read) timeouts in seconds of each class
+    TIMEOUTS = {METADATA: (5, 30), DOWNLOAD: (5, 60)}
+
+    def __init__(self, username=None, credential=None, pool_size=POOL_SIZE,
+                 keep_alive=True, headers=None, cache=None,
+                 rate_limiter=None, retry_policy=None, circuit_breaker=None,
+                 timeouts=None, deadline=None, offline=False):
         """ Initializes the Github facade.
 
         :param username: The username used to connect to the API. Can
                 be None if using the token based authentication.
         :param credential: The password (if username provided) or the
                 token to be used to authenticate.
+        :param pool_size: number of connections kept alive per host.
+        :param keep_alive: reuse the connections between calls. If False,
+                every call opens a new connection.
+        :param headers: extra headers sent in every call.
+        :param cache: :class: `ResponseCache <ResponseCache>` instance used
+                to revalidate the GET requests. No cache if None.
+        :param rate_limiter: :class: `RateLimiter <RateLimiter>` instance
+                that schedules the requests. A default one if None.
+        :param retry_policy: :class: `RetryPolicy <RetryPolicy>` of the
+                requests that fail. A default one if None.
+        :param circuit_breaker: :class: `CircuitBreaker <CircuitBreaker>`
+                that stops the requests when Github is down. A default one
+                if None.
+        :param timeouts: dict with the (connect, read) timeouts of the
+                'metadata' and 'download' endpoints. Missing classes take
+                the default ones.
+        :param deadline: :class: `Deadline <Deadline>` shared by all the
+                calls. No deadline if None.
+        :param offline: do not call Github. The GET requests are answered
+                from the cache, and the other ones raise a
+                :class: `GithubError <GithubError>`.
         """
         self.username = username
         self.credential = credential
         self.basic_auth = (username is not None)
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.cache = cache
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.timeouts = dict(self.TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.deadline = deadline
+        self.offline = offline
+        self.local = threading.local()
+        self.session = self.__build_session(headers)
+
+    def with_deadline(self, deadline):
+        """ Returns a facade with its own 'deadline' that shares the
+        session, the cache and the rest of the state of this one. """
+        facade = copy.copy(self)
+        facade.deadline = deadline
+        return facade
+
+    def clone(self):
+        """ Returns a facade with the settings of this one, but its own
+        session, cache, rate limiter and circuit breaker.
+
+        A forked process must use a clone: the connections of the session
+        and the locks of the parent can not be shared with it.
+        """
+        cache = None
+        if self.cache is not None:
+            cache = type(self.cache)(self.cache.directory,
+                                     self.cache.max_size)
+        return GithubFacade(self.username, self.credential, self.pool_size,
+                            self.keep_alive, dict(self.session.headers),
+                            cache, retry_policy=self.retry_policy,
+                            timeouts=self.timeouts, deadline=self.deadline,
+                            offline=self.offline)
+
+    def __build_session(self, headers):
+        """ Builds the pooled session shared by all the endpoints.
+
+        Default headers and authentication are set here once, so the
+        endpoint methods only have to care about their own parameters.
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2,
+                                                pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        session.headers.update({'Accept': self.APPLICATION_JSON})
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        if headers:
+            session.headers.update(headers)
 
-    def request_list_of_gists(self, username):
-        """ Call to get a list of gists for user.
+        if self.basic_auth and self.credential:
+            session.auth = (self.username, self.credential)
+        elif self.credential:
+            # Set the authentication token only if the credential is set
+            session.params = {'access_token': self.credential}
+        return session
+
+    def request(self, method, url, cached=True, **kwargs):
+        """ Sends a request through the shared session.
+
+        Every endpoint goes through this method, so it is the single place
+        where the calls to Github are performed.
+
+        :param method: HTTP method ('GET', 'POST', ...)
+        :param url: absolute URL to call
+        :param cached: revalidate the response against the cache, if the
+            facade has one. Only applies to non-streamed GET requests.
+        :param kwargs: extra arguments for 'requests.Session.request'. The
+            'endpoint' argument sets the class of timeouts to apply
+            ('metadata' by default).
+        """
+        if self.offline:
+            return self.__offline_request(method, url, cached, **kwargs)
+        if (method == 'GET' and cached and self.cache is not None and
+                not kwargs.get('stream')):
+            return self.__cached_request(url, **kwargs)
+        return self.__send(method, url, **kwargs)
+
+    def __offline_request(self, method, url, cached, **kwargs):
+        """ Answers a request from the cache, without revalidating it. """
+        if method == 'GET' and cached and self.cache is not None:
+            response = self.cache.lookup(self.__cache_key(url, **kwargs),
+                                         url)
+            if response is not None:
+                return response
+            raise GithubError(literals.OFFLINE_NOT_CACHED % url)
+        raise GithubError(literals.OFFLINE_REQUEST % (method, url))
+
+    def __send(self, method, url, **kwargs):
+        """ Sends the request when the rate limiter allows it.
+
+        Requests rejected by a rate limit are sent again once the limit
+        is expected to be lifted. Idempotent requests that fail with a
+        connection error or a 5xx status are sent again according to the
+        retry policy, while the circuit breaker lets them through.
+
+        Every request let through by the circuit breaker records its
+        outcome, or is released if it ends without one, so a half-open
+        circuit never waits forever for its single request.
+        """
+        endpoint = kwargs.pop('endpoint', self.METADATA)
+        response = None
+        limited = 0
+        failures = 0
+        while True:
+            if not self.circuit_breaker.allow():
+                raise CircuitOpenError(literals.CIRCUIT_OPEN)
+            recorded = False
+            try:
+                if (not self.rate_limiter.acquire(self.__remaining()) and
+                        response is not None):
+                    # The limit will not be lifted soon. Return the rejection
+                    return response
+
+                started = time.time()
+                try:
+                    response = self.session.request(
+                        method, url, timeout=self.timeout_for(endpoint),
+                        **kwargs)
+                except (requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout) as error:
+                    profiling.record_call(method, url, started, error=error)
+                    self.__record_failure()
+                    recorded = True
+                    if not self.retry_policy.can_retry(method, failures):
+                        raise GithubError(literals.CONNECTION_ERROR % (error))
+                    failures += 1
+                    self.__wait_retry(failures)
+                    continue
+                profiling.record_call(method, url, started, response)
+
+                self.rate_limiter.update(response)
+                if self.rate_limiter.is_limited(response):
+                    # Github is up, even if it rejects the request
+                    self.circuit_breaker.record_success()
+                    recorded = True
+                    if limited == self.RATE_LIMIT_RETRIES:
+                        return response
+                    limited += 1
+                elif self.retry_policy.is_transient(response):
+                    self.__record_failure()
+                    recorded = True
+                    if not self.retry_policy.can_retry(method, failures):
+                        return response
+                    failures += 1
+                    self.__wait_retry(failures)
+                else:
+                    self.circuit_breaker.record_success()
+                    recorded = True
+                    return response
+            finally:
+                if not recorded:
+                    self.circuit_breaker.release()
+
+    def __record_failure(self):
+        """ Counts a failure in the circuit breaker. """
+        if self.circuit_breaker.record_failure():
+            self.__count('trips')
+
+    def __wait_retry(self, attempt):
+        """ Waits before the retry number 'attempt'. """
+        self.__count('retries')
+        delay = self.retry_policy.delay(attempt)
+        remaining = self.__remaining()
+        if remaining is not None and delay >= remaining:
+            raise DeadlineExceeded(literals.DEADLINE_EXCEEDED %
+                                   (self.deadline.seconds))
+        time.sleep(delay)
+
+    def __remaining(self):
+        """ Returns the seconds until the deadline, None if there is no
+        deadline. """
+        if self.deadline is None:
+            return None
+        return self.deadline.remaining()
+
+    def timeout_for(self, endpoint):
+        """ Returns the (connect, read) timeouts of a class of endpoints,
+        shortened to the time remaining until the deadline.
+
+        Raises 'DeadlineExceeded' if the deadline has expired.
 
+        :param endpoint: 'metadata' or 'download'
+        """
+        connect, read = self.timeouts[endpoint]
+        remaining = self.__remaining()
+        if remaining is None:
+            return connect, read
+        return min(connect, remaining), min(read, remaining)
+
+    def __count(self, name):
+        """ Increments a counter of the calls of the current thread. """
+        stats = self.call_stats()
+        stats[name] += 1
+
+    def call_stats(self):
+        """ Returns the retries and the circuit breaker trips counted in
+        the current thread, as a dict with the keys 'retries' and 'trips'.
+        """
+        if not hasattr(self.local, 'stats'):
+            self.local.stats = {'retries': 0, 'trips': 0}
+        return self.local.stats
+
+    def __cached_request(self, url, **kwargs):
+        """ Sends a conditional GET request.
+
+        If Github answers '304 Not Modified', the response is built from
+        the stored body.
+        """
+        key = self.__cache_key(url, **kwargs)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        conditional = dict(headers)
+        conditional.update(self.cache.conditional_headers(key))
+
+        response = self.__send('GET', url, headers=conditional, **kwargs)
+        if response.status_code == 304:
+            cached = self.cache.hit(key, response)
+            if cached is not None:
+                return cached
+            # The entry has been evicted meanwhile. Ask for the whole body
+            response = self.__send('GET', url, headers=headers, **kwargs)
+        self.cache.miss(key, response)
+        return response
+
+    def __cache_key(self, url, **kwargs):
+        """ Returns the key of a GET request in the cache. """
+        params = dict(self.session.params or {})
+        params.update(kwargs.get('params') or {})
+        return self.cache.key(url, params, (self.username, self.credential))
+
+    def connection_stats(self):
+        """ Returns how many connections have been opened and reused.
+
+        Values are read from the connection pools of the session, and the
+        result is a dict with the keys 'requests', 'connections' and
+        'reused'.
+        """
+        num_requests = 0
+        num_connections = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                num_requests += getattr(pool, 'num_requests', 0)
+                num_connections += getattr(pool, 'num_connections', 0)
+        return {'requests': num_requests,
+                'connections': num_connections,
+                'reused': max(num_requests - num_connections, 0)}
+
+    def rate_limit(self):
+        """ Returns the rate limit budget known from the last response. """
+        return self.rate_limiter.status()
+
+    def close(self):
+        """ Closes all the connections kept alive by the session. """
+        self.session.close()
+
+    def request_list_of_gists(self, username, per_page=None, since=None):
+        """ Call to get the first page of the list of gists for user.
+
+        :param username: owner of the gists
+        :param per_page: number of gists per page. Github default if None.
+        :param since: ISO 8601 timestamp. Only the gists updated after it
+            are listed.
         """
         # Set the URL
         url = self.ENDPOINT_LIST % (username)
+        return self.request('GET', url, stream=self.__stream_lists(),
+                            params=self.__page_params(per_page, since))
+
+    def request_list_starred_gists(self, username, per_page=None,
+                                   since=None):
+        """ Call to get the first page of the starred gists.
+
+        :param username: unused. The starred gists are the ones of the
+            authenticated user.
+        :param per_page: number of gists per page. Github default if None.
+        :param since: ISO 8601 timestamp. Only the gists updated after it
+            are listed.
+        """
+        # Set the URL
+        url = self.ENDPOINT_STARRED
+        return self.request('GET', url, stream=self.__stream_lists(),
+                            params=self.__page_params(per_page, since))
 
-        if self.basic_auth and self.credential:
-            return requests.get(url, auth=(self.username, self.credential))
-        else:
-            params = {}
-            if self.credential:
-                # Set the authentication header only if the password is set
-                params = {'access_token': self.credential}
-            return requests.get(url, params=params)
+    def request_next_page(self, response):
+        """ Request the page linked as 'next' in the response.
 
-    def request_list_starred_gists(self, username):
-        """ Call to get a list of gists for user.
+        Returns None if the response is the last page.
 
+        :param response: the response of the previous page.
         """
-        # Set the URL
-        url = self.ENDPOINT_STARRED
+        next_link = response.links.get('next')
+        if not next_link:
+            return None
+        return self.request('GET', next_link['url'],
+                            stream=self.__stream_lists())
 
-        if self.basic_auth and self.credential:
-            return requests.get(url, auth=(self.username, self.credential))
-        else:
-            params = {}
-            if self.credential:
-                # Set the authentication header only if the password is set
-                params = {'access_token': self.credential}
-            return requests.get(url, params=params)
+    def iter_list(self, response, skip=()):
+        """ Iterate through the elements of a page of a list, decoding them
+        as the body arrives.
+
+        Raises 'GithubError' if the body can not be read or decoded.
+
+        :param response: a successful response of a list endpoint.
+        :param skip: fields removed from each element.
+        """
+        try:
+            for element in jsonstream.iter_array(
+                    response.iter_content(LIST_CHUNK_SIZE), skip):
+                yield element
+        except requests.exceptions.RequestException as error:
+            raise GithubError(literals.CONNECTION_ERROR % (error))
+        except ValueError as error:
+            raise GithubError(literals.LIST_DECODE_ERROR % (error))
+
+    def __stream_lists(self):
+        """ Whenever the list responses are streamed. Responses that are
+        revalidated against the cache are read as a whole to be stored. """
+        return self.cache is None
+
+    def iter_pages(self, response, prefetch=False):
+        """ Iterate through all the pages following the 'Link' headers.
+
+        :param response: response of the first page.
+        :param prefetch: request the next page in background while the
+            current one is being processed.
+        """
+        while response is not None:
+            if prefetch and response.ok:
+                next_page = Prefetch(self.request_next_page, response)
+                yield response
+                response = next_page.get()
+            else:
+                yield response
+                if not response.ok:
+                    return
+                response = self.request_next_page(response)
+
+    def __page_params(self, per_page, since=None):
+        """ Build the query parameters for a paginated request. """
+        params = {}
+        if per_page:
+            params['per_page'] = per_page
+        if since:
+            params['since'] = since
+        return params or None
 
     def request_gist(self, id_gist):
         """ Request a single Gist info.
@@ -117,7 +575,7 @@ class GithubFacade(object):
 
         # Set the URL and send the request
         url = self.ENDPOINT_GIST % (id_gist)
-        return requests.get(url)
+        return self.request('GET', url)
 
     def create_gist(self, payload):
         """ Create a new gist.
@@ -128,34 +586,25 @@ class GithubFacade(object):
 
         url = self.ENDPOINT_CREATE
         headers = {'Content-type': self.APPLICATION_JSON}
-        data_json = json.dumps(payload, indent=2)
-
-        if self.basic_auth:
-            return requests.post(url, data=data_json, headers=headers,
-                                 auth=(self.username, self.credential))
-        else:
-            params = {'access_token': self.credential}
-            return requests.post(url, data=data_json, headers=headers,
-                                 params=params)
+        data_json = json.dumps(payload, separators=(',', ':'))
+        return self.request('POST', url, data=data_json, headers=headers)
 
     def update_gist(self, payload):
         """ Update an existent Gist via PATCH method.
 
         :param payload: the data of the message body. It contains description,
             whenever is public or private and, of course, file contents.
+            Only the fields and files present are modified, and the files
+            set to None are removed.
         """
 
         url = self.ENDPOINT_GIST % (payload.identifier)
         headers = {'Content-type': self.APPLICATION_JSON}
-        data_json = json.dumps(payload, indent=2)
-
-        if self.basic_auth:
-            return requests.patch(url, data=data_json, headers=headers,
-                                  auth=(self.username, self.credential))
-        else:
-            params = {'access_token': self.credential}
-            return requests.patch(url, data=data_json, headers=headers,
-                                  params=params)
+        # The identifier goes in the URL, not in the body
+        body = dict((key, value) for key, value in payload.items()
+                    if key != 'id')
+        data_json = json.dumps(body, separators=(',', ':'))
+        return self.request('PATCH', url, data=data_json, headers=headers)
 
     def delete_gist(self, id_gist):
         """ Delete an existent Gist.
@@ -164,51 +613,39 @@ class GithubFacade(object):
         """
 
         url = self.ENDPOINT_GIST % (id_gist)
-        if self.basic_auth:
-            return requests.delete(url,
-                                   auth=(self.username, self.credential))
-        else:
-            params = {'access_token': self.credential}
-            return requests.delete(url, params=params)
+        return self.request('DELETE', url)
 
     def list_authorizations(self):
         """ List the authorizations for the given user. """
 
-        return requests.get(self.ENDPOINT_AUTH,
+        return self.request('GET', self.ENDPOINT_AUTH, cached=False,
                             auth=(self.username, self.credential))
 
     def fork_gist(self, gist_id):
         """ Requests to GitHub Gist API to fork a gist. """
 
         url = self.ENDPOINT_FORK % (gist_id)
-        if self.basic_auth:
-            return requests.post(url, auth=(self.username, self.credential))
-        else:
-            params = {'access_token': self.credential}
-            return requests.post(url, params=params)
+        return self.request('POST', url)
 
     def star_gist(self, gist_id):
         """ Requests to GitHub Gist API to star a gist. """
 
         url = self.ENDPOINT_STAR % (gist_id)
-        if self.basic_auth:
-            headers = {'Content-length': '0'}
-            return requests.put(url, auth=(self.username, self.credential),
-                                headers=headers)
-        else:
-            params = {'access_token': self.credential}
-            headers = {'Content-length': '0'}
-            return requests.put(url, params=params, headers=headers)
+        headers = {'Content-length': '0'}
+        return self.request('PUT', url, headers=headers)
 
     def unstar_gist(self, gist_id):
         """ Requests to GitHub Gist API to unstar a gist. """
 
         url = self.ENDPOINT_STAR % (gist_id)
-        if self.basic_auth:
-            return requests.delete(url, auth=(self.username, self.credential))
-        else:
-            params = {'access_token': self.credential}
-            return requests.delete(url, params=params)
+        return self.request('DELETE', url)
+
+    def request_rate_limit(self):
+        """ Requests the current rate limit status.
+
+        This call does not count against the rate limit.
+        """
+        return self.request('GET', self.ENDPOINT_RATE_LIMIT, cached=False)
 
     def authorize(self, payload):
         """ Authorize the current app.
@@ -219,8 +656,49 @@ class GithubFacade(object):
         url = self.ENDPOINT_AUTH
         headers = {'Content-type': self.APPLICATION_JSON}
         data_json = json.dumps(payload, indent=2)
-        return requests.post(url, data=data_json, headers=headers,
-                             auth=(self.username, self.credential))
+        return self.request('POST', url, data=data_json, headers=headers,
+                            auth=(self.username, self.credential))
+
+
+class Prefetch(threading.Thread):
+    """ :class: `Prefetch <Prefetch>` runs a call in background.
+
+    The result of the call is retrieved with 'get', which waits for the
+    call to finish. Exceptions raised by the call are raised again in 'get'.
+    """
+
+    def __init__(self, function, *args):
+        super(Prefetch, self).__init__()
+        self.daemon = True
+        self.function = function
+        self.args = args
+        self.value = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.value = self.function(*self.args)
+        except Exception as error:
+            self.error = error
+
+    def get(self):
+        """ Waits for the call and returns its value. """
+        self.join()
+        if self.error:
+            raise self.error
+        return self.value
+
+
+def data_path(*names):
+    """ Returns the path of a file or directory inside '~/.gists', the
+    directory where 'gists' keeps its local data (cache, indexes...).
+
+    The '~/.gists' directory is created if it does not exist.
+    """
+    if not os.path.isdir(DATA_DIR):
+        os.makedirs(DATA_DIR)
+    return os.path.join(DATA_DIR, *names)
 
 
 class GistsConfigurer(object):
@@ -289,26 +767,283 @@ class GistsConfigurer(object):
             self.config.write(f)
 
 
-def download(url, destination_dir, file_name, file_size):
+class Progress(object):
+    """ :class: `Progress <Progress>` aggregated progress of a batch,
+    written in the standard error as items are completed.
+
+    It is safe to update it from several threads.
+    """
+
+    def __init__(self, total_items, total_bytes, stream=None):
+        self.total_items = total_items
+        self.total_bytes = total_bytes
+        self.items = 0
+        self.bytes = 0
+        self.failures = 0
+        self.stream = stream or sys.stderr
+        self.lock = threading.Lock()
+
+    def update(self, size, success):
+        """ Counts a completed item.
+
+        :param size: bytes of the item
+        :param success: whenever the item has been completed succesfully
+        """
+        with self.lock:
+            self.items += 1
+            if success:
+                self.bytes += size or 0
+            else:
+                self.failures += 1
+            self.stream.write(literals.PROGRESS %
+                              (self.items, self.total_items, self.bytes,
+                               self.total_bytes, self.failures))
+            if self.items == self.total_items or not self.stream.isatty():
+                self.stream.write('\n')
+            self.stream.flush()
+
+
+# Size of the terminal, once it has been queried
+__terminal_size = None
+
+
+def terminal_size():
+    """ Returns the (rows, columns) of the terminal of the standard output.
+
+    The size is queried once per process. The 'LINES' and 'COLUMNS'
+    environment variables take precedence over the size reported by the
+    terminal, and 'DEFAULT_TERMINAL_SIZE' is used when the output is not a
+    terminal.
+    """
+    global __terminal_size
+    if __terminal_size is None:
+        rows, columns = __query_terminal_size()
+        try:
+            rows = int(os.environ.get('LINES', rows))
+            columns = int(os.environ.get('COLUMNS', columns))
+        except ValueError:
+            pass
+        default_rows, default_columns = DEFAULT_TERMINAL_SIZE
+        __terminal_size = (rows if rows > 0 else default_rows,
+                           columns if columns > 0 else default_columns)
+    return __terminal_size
+
+
+def set_terminal_size(size):
+    """ Sets the (rows, columns) returned by 'terminal_size', the size of
+    the terminal of a 'daemon' client. None queries it again. """
+    global __terminal_size
+    __terminal_size = size
+
+
+def __query_terminal_size():
+    """ Asks the size to the terminal with the 'TIOCGWINSZ' ioctl. """
+    try:
+        import fcntl
+        import termios
+        size = fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ,
+                           struct.pack('hhhh', 0, 0, 0, 0))
+        return struct.unpack('hhhh', size)[:2]
+    except (ImportError, AttributeError, IOError, ValueError):
+        # Not a terminal, or a platform without the ioctl
+        return DEFAULT_TERMINAL_SIZE
+
+
+class OutputWriter(object):
+    """ :class: `OutputWriter <OutputWriter>` writes the output of the
+    formatters as it is produced.
+
+    Writes to a terminal are flushed on every chunk, so each line shows up
+    as soon as it is formatted. Otherwise, chunks are joined and written
+    once 'buffer_size' bytes are pending.
+    """
+
+    # Bytes kept before writing to a pipe or a file
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, stream=None, buffer_size=BUFFER_SIZE):
+        self.stream = stream or sys.stdout
+        self.buffer_size = buffer_size
+        self.encoding = getattr(self.stream, 'encoding', None) or 'utf-8'
+        self.interactive = self.stream.isatty()
+        self.pending = []
+        self.pending_size = 0
+
+    def write(self, chunk):
+        """ Writes a chunk of the output, encoding it if it is unicode. """
+        if not isinstance(chunk, str):
+            chunk = unicode(chunk).encode(self.encoding, 'replace')
+        self.pending.append(chunk)
+        self.pending_size += len(chunk)
+        if self.interactive or self.pending_size >= self.buffer_size:
+            self.flush()
+
+    def write_all(self, chunks):
+        """ Writes all the chunks of an iterable and flushes them. """
+        try:
+            for chunk in chunks:
+                self.write(chunk)
+        finally:
+            self.flush()
+
+    def flush(self):
+        """ Writes the pending chunks. """
+        if self.pending:
+            self.stream.write(''.join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+        self.stream.flush()
+
+
+def download(url, destination_dir, file_name, file_size, timeout=None,
+             quiet=False, offline=False):
     """ Downloads a file.
 
+    The file is streamed in chunks of 'DOWNLOAD_CHUNK_SIZE' bytes to a
+    '.part' temporary file, which is renamed to the target file once it is
+    complete. If a previous download has been interrupted, the transfer is
+    resumed from the bytes of the '.part' file through an HTTP Range
+    request. The URL and the validator (ETag or Last-Modified) of the file
+    are kept in a '.part.json' file next to it, and sent in an 'If-Range'
+    header, so that the transfer starts from scratch if the remote file has
+    changed or the partial file belongs to another URL.
+
     :param url: remote location of the file
     :param destination_dir: target directory where the file will be
         download
     :param file_name: name of the target file
-    :param file_size: size of the file to download.
+    :param file_size: size of the file to download. If informed, the
+        downloaded bytes are checked against it.
+    :param timeout: seconds to wait for the connection and for each read.
+        No timeout if None.
+    :param quiet: do not print the downloading message.
+    :param offline: do not connect: raise a 'GithubError' instead, as the
+        offline facade does.
     """
 
+    if offline:
+        raise GithubError(literals.OFFLINE_REQUEST % ('GET', url))
     destination_path = os.path.join(destination_dir, file_name)
-    print colored.green(literals.DOWNLOADING %
-                        (url, destination_path, file_size))
-
-    # Open the remote url as a file, read it and write it in
-    # target directory
-    u = urllib2.urlopen(url)
-    with open(destination_path, 'wb') as f:
-        raw_file = u.read()
-        f.write(raw_file)
+    partial_path = destination_path + '.part'
+    if not quiet:
+        print colored.green(literals.DOWNLOADING %
+                            (url, destination_path, file_size))
+
+    # Resume the previous download of the same URL, if any
+    offset = 0
+    validator = __partial_validator(partial_path, url)
+    if validator is not None and os.path.exists(partial_path):
+        offset = os.path.getsize(partial_path)
+
+    try:
+        if validator is None or file_size is None or offset < file_size:
+            offset = __stream(url, partial_path, offset, validator, timeout)
+    except (urllib2.URLError, socket.error) as error:
+        raise GithubError(literals.DOWNLOAD_ERROR % (error))
+
+    if file_size is not None and offset != file_size:
+        if offset > file_size:
+            # The remote file has changed. Start from scratch next time
+            __remove_partial(partial_path)
+        raise GithubError(literals.DOWNLOAD_INCOMPLETE %
+                          (offset, file_size))
+    os.rename(partial_path, destination_path)
+    __remove_partial(partial_path)
+
+
+def __partial_validator(partial_path, url):
+    """ Returns the validator of the partial download of 'url' in
+    'partial_path', or None if it can not be resumed: there is no partial
+    file, it belongs to another URL or the server sent no validator. """
+    try:
+        with open(partial_path + '.json') as f:
+            metadata = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if not isinstance(metadata, dict) or metadata.get('url') != url:
+        return None
+    return metadata.get('validator')
+
+
+def __save_validator(partial_path, url, validator):
+    """ Stores the URL and the validator of the partial download. """
+    with open(partial_path + '.json', 'w') as f:
+        json.dump({'url': url, 'validator': validator}, f)
+
+
+def __remove_partial(partial_path):
+    """ Removes the partial download and its metadata, if they exist. """
+    for path in (partial_path, partial_path + '.json'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def __stream(url, partial_path, offset, validator, timeout):
+    """ Writes the remote file in 'partial_path', starting at 'offset'.
+
+    The range is only requested if the remote file still matches
+    'validator'. Otherwise the server sends the whole file, which is
+    written again from the start.
+
+    Returns the size of the partial file after the transfer. The transfer
+    is recorded as an HTTP call of '--profile'.
+    """
+    request = urllib2.Request(url)
+    if offset and validator:
+        request.add_header('Range', 'bytes=%s-' % (offset))
+        request.add_header('If-Range', validator)
+    else:
+        offset = 0
+    started = time.time()
+    try:
+        u = urllib2.urlopen(request, timeout=timeout)
+    except urllib2.HTTPError as error:
+        profiling.record_call('GET', url, started, status=error.code)
+        if error.code != 416:
+            raise
+        # Range not satisfiable: the partial file is already complete
+        return offset
+    except (urllib2.URLError, socket.error) as error:
+        profiling.record_call('GET', url, started, error=error)
+        raise
+
+    received = 0
+    if u.getcode() != 206:
+        # The file has changed, or the server ignored the range. Write the
+        # whole file again
+        offset = 0
+    headers = u.info()
+    __save_validator(partial_path, url,
+                     headers.get('ETag') or headers.get('Last-Modified'))
+    try:
+        with open(partial_path, 'ab' if offset else 'wb') as f:
+            while True:
+                chunk = u.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                received += len(chunk)
+    finally:
+        profiling.record_call('GET', url, started, status=u.getcode(),
+                              size=received)
+    return offset + received
+
+
+def build_batch_result(outcomes, elapsed):
+    """ Builds the :class: `BatchResult <BatchResult>` as return type.
+
+    It is successful only if all the outcomes are.
+
+    :param outcomes: list of (item, :class: `Result <Result>`) pairs
+    :param elapsed: wall time of the batch in seconds
+    """
+    result = BatchResult()
+    result.success = all(outcome.success for item, outcome in outcomes)
+    result.data = outcomes
+    result.elapsed = elapsed
+    result.retries = sum(outcome.retries for item, outcome in outcomes)
+    result.trips = sum(outcome.trips for item, outcome in outcomes)
+    return result
 
 
 def build_result(success, data, *args):